@@ -0,0 +1,147 @@
+import gc
+import json
+import math
+import os
+import platform
+import statistics
+import time
+
+import pygame
+
+# The timing and baseline side of the benchmark suite (see benchmarks/suite.py).
+#
+# Every benchmark is a function timed over `repeat` samples, each one calling it `number` times in a row, after
+# `warmup` calls that aren't timed (so caches are filled and the interpreter has settled). The garbage collector is
+# off while a sample is timed, like timeit does, so a collection doesn't land in one sample and not the others. The
+# median of the samples is what gets reported: unlike the mean it doesn't move much when a sample is hit by something
+# else running on the machine. A benchmark only counts as a regression when both its median and its best sample are
+# slower than the baseline's, so one noisy run doesn't fail the suite.
+#
+# Results can be stored as a baseline and compared against on later runs. A baseline only means something on the
+# machine it was made on, so it isn't committed: it goes in the .cache folder by default.
+
+WARMUP = 3
+REPEAT = 7
+MIN_SAMPLE_TIME = 0.05 # when a benchmark has no fixed number, it is called enough times per sample to take this long
+TOLERANCE = 0.25 # more than this much slower than the baseline (25%) is a regression
+BASELINE = '.cache/benchmarks/baseline.json'
+
+class Benchmark:
+    # func is called number times per sample (None: worked out from how long a call takes); reset, if given, is called
+    # before every sample without being timed (for benchmarks that have to start from the same state every time)
+    def __init__(self, name, func, number = None, reset = None):
+        self.name = name
+        self.func = func
+        self.number = number
+        self.reset = reset
+
+class Result:
+    def __init__(self, name, times, number):
+        self.name = name
+        self.times = sorted(times) # seconds per call of each sample
+        self.number = number
+
+    @property
+    def median(self):
+        return statistics.median(self.times)
+
+    @property
+    def best(self):
+        return self.times[0]
+
+    # How far the samples spread around the median (interquartile range over median), to tell noisy numbers apart
+    @property
+    def spread(self):
+        if len(self.times) < 4:
+            return (self.times[-1] - self.times[0]) / self.median
+        quartiles = statistics.quantiles(self.times, n=4)
+        return (quartiles[2] - quartiles[0]) / self.median
+
+    def to_json(self):
+        return {'median': self.median, 'best': self.best, 'spread': self.spread, 'number': self.number, 'samples': len(self.times)}
+
+def sample(func, number):
+    start = time.perf_counter()
+    for i in range(number):
+        func()
+    return time.perf_counter() - start
+
+def measure(bench, warmup = WARMUP, repeat = REPEAT):
+    if bench.reset:
+        bench.reset()
+    for i in range(warmup):
+        bench.func()
+    number = bench.number
+    if number is None:
+        call_time = sample(bench.func, 1)
+        number = max(1, math.ceil(MIN_SAMPLE_TIME / max(call_time, 1e-9)))
+
+    times = []
+    gc.collect()
+    gc_was_enabled = gc.isenabled()
+    gc.disable()
+    try:
+        for i in range(repeat):
+            if bench.reset:
+                gc.enable()
+                bench.reset()
+                gc.collect()
+                gc.disable()
+            times.append(sample(bench.func, number) / number)
+    finally:
+        if gc_was_enabled:
+            gc.enable()
+    return Result(bench.name, times, number)
+
+# What the numbers were measured on; comparing against a baseline from somewhere else gives a warning
+def machine():
+    return {'platform': platform.platform(), 'processor': platform.processor() or platform.machine(),
+            'python': platform.python_version(), 'pygame': pygame.version.ver}
+
+def save_baseline(path, results):
+    folder = os.path.dirname(path)
+    if folder:
+        os.makedirs(folder, exist_ok=True)
+    baseline = load_baseline(path) or {'results': {}}
+    baseline['machine'] = machine()
+    baseline['results'].update({result.name: result.to_json() for result in results}) # a filtered run only updates its own benchmarks
+    with open(path, 'w') as f:
+        json.dump(baseline, f, indent=2, sort_keys=True)
+
+def load_baseline(path):
+    if not os.path.exists(path):
+        return None
+    with open(path, 'r') as f:
+        return json.load(f)
+
+# Compare results with a baseline; returns a list of (result, baseline median, ratio) for every regression
+def compare(results, baseline, tolerance = TOLERANCE):
+    regressions = []
+    for result in results:
+        base = baseline['results'].get(result.name)
+        if base and result.median > base['median'] * (1 + tolerance) and result.best > base['best'] * (1 + tolerance):
+            regressions.append((result, base['median'], result.median / base['median']))
+    return regressions
+
+def format_time(seconds):
+    if seconds >= 1:
+        return '%.2f s' % seconds
+    if seconds >= 1e-3:
+        return '%.2f ms' % (seconds * 1e3)
+    return '%.2f us' % (seconds * 1e6)
+
+def format_row(result, baseline = None):
+    row = '%-44s %12s %12s %7.1f%%' % (result.name, format_time(result.median), format_time(result.best), result.spread * 100)
+    if baseline is not None:
+        base = baseline['results'].get(result.name)
+        if base:
+            row += ' %12s %+8.1f%%' % (format_time(base['median']), (result.median / base['median'] - 1) * 100)
+        else:
+            row += ' %12s' % 'new'
+    return row
+
+def format_header(baseline = None):
+    header = '%-44s %12s %12s %8s' % ('benchmark (time per call)', 'median', 'best', 'spread')
+    if baseline is not None:
+        header += ' %12s %9s' % ('baseline', 'change')
+    return header
@@ -0,0 +1,57 @@
+import json
+import os
+import random
+import tempfile
+import timeit
+
+from scripts.tilemap import Tilemap
+from scripts.mapfile import convert
+
+# Benchmark comparing how long it takes to load big levels from json and from the binary map format.
+# Run from the repository root with:  python -m benchmarks.map_loading
+
+SIZES = [10000, 100000, 1000000] # number of grid tiles in the synthetic maps
+REPEAT = 3
+
+
+# A synthetic level with roughly n grid tiles: hilly ground of grass on top of stone, with some decorations
+def synthetic_map(n, seed = 0):
+    rng = random.Random(seed)
+    width = int((n * 4) ** 0.5) # the ground fills about a quarter of the bounding box
+    tilemap = {}
+    height = width // 8
+    x = 0
+    while len(tilemap) < n:
+        height = max(1, min(width // 2, height + rng.choice((-1, 0, 0, 1))))
+        for depth in range(height):
+            y = width - height + depth
+            tile_type = 'grass' if depth == 0 else 'stone'
+            tilemap[str(x) + ';' + str(y)] = {'type': tile_type, 'variant': rng.randint(0, 8), 'pos': [x, y]}
+            if len(tilemap) == n:
+                break
+        x += 1
+    offgrid = [{'type': 'large_decor', 'variant': rng.randint(0, 2), 'pos': [rng.random() * x * 16, rng.random() * width * 16]}
+               for i in range(n // 100)]
+    return {'tilemap': tilemap, 'tile_size': 16, 'offgrid': offgrid}
+
+def best_of(func):
+    return min(timeit.repeat(func, number=1, repeat=REPEAT))
+
+def run():
+    print('%10s %12s %12s %12s %12s %9s' % ('tiles', 'json (KB)', 'binary (KB)', 'json (ms)', 'binary (ms)', 'speedup'))
+    with tempfile.TemporaryDirectory() as folder:
+        for n in SIZES:
+            json_path = os.path.join(folder, str(n) + '.json')
+            map_path = os.path.join(folder, str(n) + '.map')
+            with open(json_path, 'w') as f:
+                json.dump(synthetic_map(n), f)
+            convert(json_path, map_path)
+
+            tilemap = Tilemap(None) # no assets needed to load (the game is only needed to render)
+            json_time = best_of(lambda: tilemap.load(json_path))
+            map_time = best_of(lambda: tilemap.load(map_path))
+            print('%10d %12.0f %12.0f %12.1f %12.1f %8.1fx' % (n, os.path.getsize(json_path) / 1024, os.path.getsize(map_path) / 1024,
+                                                               json_time * 1000, map_time * 1000, json_time / map_time))
+
+if __name__ == '__main__':
+    run()
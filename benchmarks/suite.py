@@ -0,0 +1,271 @@
+import os
+import sys
+import json
+import random
+import argparse
+import tempfile
+
+# Everything runs headless on SDL's dummy drivers, they have to be picked before pygame starts up
+os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+os.environ.setdefault('SDL_AUDIODRIVER', 'dummy')
+
+import pygame
+
+from benchmarks.harness import Benchmark, measure, machine, save_baseline, load_baseline, compare, format_header, format_row, \
+                               format_time, WARMUP, REPEAT, TOLERANCE, BASELINE
+from benchmarks.map_loading import synthetic_map
+from scripts.simulation import Simulation, MAP_DIR
+from scripts.tilemap import Tilemap
+from scripts.entities import Enemy
+from scripts.particle import ParticleSystem
+from scripts.spark import SparkSystem
+from scripts.mapfile import convert
+from scripts.replay import InputLog
+
+# Benchmark suite for the game's hot paths, with a stored baseline to catch regressions.
+# Run from the repository root with:
+#
+#   python -m benchmarks.suite --save-baseline    # measure and store the numbers to compare against
+#   python -m benchmarks.suite                    # measure and compare, exits with status 1 on a regression (2 without a baseline)
+#   python -m benchmarks.suite --no-compare       # only measure and print the numbers
+#   python -m benchmarks.suite -k render          # only the benchmarks with 'render' in their name
+#
+# Every benchmark reports the median time per call over the samples (see benchmarks/harness.py). The inputs are all
+# seeded, so every run does exactly the same work.
+
+SYNTHETIC_SIZES = [100000] # number of grid tiles in the synthetic maps
+ENEMY_COUNTS = [10, 100, 1000]
+POPULATIONS = [100, 1000, 10000] # particles / sparks kept alive at once
+SCRIPTED_FRAMES = 120 # frames of the scripted run timed per sample
+VIEW_SIZE = (320, 240) # same as the game's graphics display
+
+def shipped_maps():
+    return sorted(name for name in os.listdir(MAP_DIR) if name.endswith('.json'))
+
+# A Simulation to borrow assets and the entity plumbing from (one for the whole suite, loading assets takes a while)
+sim = None
+def simulation():
+    global sim
+    if sim is None:
+        sim = Simulation(seed = 0)
+    return sim
+
+def load_tilemap(path):
+    tilemap = Tilemap(simulation())
+    tilemap.load(path)
+    tilemap.extract([('spawners', 0), ('spawners', 1)]) # taken out of the map when a level is played, see Simulation.read_level
+    return tilemap
+
+# Synthetic maps are written once per run into a temporary folder, as json and as a binary map
+folder = None
+def synthetic_path(n, ext):
+    global folder
+    if folder is None:
+        folder = tempfile.TemporaryDirectory()
+    path = os.path.join(folder.name, 'synthetic ' + str(n) + ext)
+    if not os.path.exists(path):
+        json_path = os.path.join(folder.name, 'synthetic ' + str(n) + '.json')
+        if not os.path.exists(json_path):
+            with open(json_path, 'w') as f:
+                json.dump(synthetic_map(n), f)
+        if ext == '.map':
+            convert(json_path, path)
+    return path
+
+# (name, function returning the path) of the maps to benchmark: the shipped levels and synthetic maps as json, plus the
+# synthetic maps as binary maps if binary is set (the paths are only made when a benchmark needs them)
+def level_maps(binary = False):
+    maps = [(name, lambda name=name: MAP_DIR + name) for name in shipped_maps()]
+    maps += [('synthetic %d.json' % n, lambda n=n: synthetic_path(n, '.json')) for n in SYNTHETIC_SIZES]
+    if binary:
+        maps += [('synthetic %d.map' % n, lambda n=n: synthetic_path(n, '.map')) for n in SYNTHETIC_SIZES]
+    return maps
+
+
+# ===== Benchmarks ===== #
+# Each setup function returns a Benchmark; only the ones that are going to run get set up
+
+def bench_physics_rects(name, path):
+    # one probe in the middle of every tile of the map, like entities walking across the whole level
+    tilemap = load_tilemap(path)
+    points = [((x + 0.5) * tilemap.tile_size, (y + 0.5) * tilemap.tile_size) for x, y in tilemap.tilemap]
+    return Benchmark('physics_rects_around/' + name, lambda: [tilemap.physics_rects_around(point) for point in points])
+
+# Camera positions sweeping over the level from left to right, along the ground (found without converting the chunks
+# of a binary map, so they are still left for render to convert)
+def camera_sweep(tilemap, count = 64):
+    xs, ys = tilemap.tilemap.locs_of_types({'grass', 'stone'})
+    ground = {}
+    for x, y in zip(xs.tolist(), ys.tolist()):
+        ground[x] = min(y, ground.get(x, y))
+    left, right = min(ground), max(ground)
+    offsets = []
+    for i in range(count):
+        x = left + (right - left) * i // (count - 1)
+        y = ground.get(x, 0)
+        offsets.append((x * tilemap.tile_size - VIEW_SIZE[0] // 2, y * tilemap.tile_size - VIEW_SIZE[1] // 2))
+    return offsets
+
+def bench_render(name, path, cold):
+    tilemap = load_tilemap(path)
+    surf = pygame.Surface(VIEW_SIZE, pygame.SRCALPHA)
+    offsets = camera_sweep(tilemap)
+    def sweep():
+        if cold: # every chunk has to be built again, like the first time the level is played
+            tilemap.chunks.clear()
+        for offset in offsets:
+            tilemap.render(surf, offset)
+    return Benchmark('render %s/%s' % ('cold' if cold else 'warm', name), sweep)
+
+def bench_enemies(n):
+    game = simulation()
+    game.load_level(0)
+    # enemies standing on the level's ground tiles, picked with a fixed seed
+    tilemap = game.tilemap
+    ground = sorted(pos for pos in tilemap.tilemap.keys() if tilemap.solid.is_solid(*pos) and not tilemap.solid.is_solid(pos[0], pos[1] - 1))
+    rng = random.Random(0)
+    spots = [rng.choice(ground) for i in range(n)]
+    def reset():
+        game.load_level(0)
+        game.rng.seed(0)
+        for x, y in spots:
+            enemy = Enemy(game, (x * tilemap.tile_size + 4, (y - 1) * tilemap.tile_size + 1), (8, 15))
+            game.enemies.append(enemy)
+            game.entities.insert(enemy, enemy.rect())
+        game.look_for_player()
+    def update():
+        for enemy in game.enemies:
+            enemy.update(tilemap, (0, 0))
+    return Benchmark('PhysicsEntity.update/%d enemies' % n, update, number = 30, reset = reset)
+
+def bench_particles(n):
+    particles = ParticleSystem(simulation(), capacity = n)
+    rng = random.Random(0)
+    spawns = [((rng.random() * 320, rng.random() * 240), (rng.random() - 0.5, rng.random() - 0.5), rng.randint(0, 7)) for i in range(n)]
+    def reset():
+        particles.clear()
+    def churn():
+        # every step the dead particles are replaced, so the population stays at n
+        for pos, velocity, frame in spawns[:n - len(particles)]:
+            particles.spawn('particle', pos, velocity, frame)
+        particles.update()
+    return Benchmark('particles/%d' % n, churn, number = 60, reset = reset)
+
+def bench_sparks(n):
+    sparks = SparkSystem(capacity = n)
+    rng = random.Random(0)
+    spawns = [((rng.random() * 320, rng.random() * 240), rng.random() * 6.283, 2 + rng.random()) for i in range(n)]
+    def reset():
+        sparks.clear()
+    def churn():
+        for pos, angle, speed in spawns[:n - len(sparks)]:
+            sparks.spawn(pos, angle, speed)
+        sparks.update()
+    return Benchmark('sparks/%d' % n, churn, number = 60, reset = reset)
+
+def bench_load(name, path):
+    tilemap = Tilemap(None) # no assets needed to load
+    return Benchmark('Tilemap.load/' + name, lambda: tilemap.load(path))
+
+def bench_save(name, path, ext):
+    tilemap = Tilemap(None)
+    tilemap.load(path)
+    out = os.path.join(tempfile.gettempdir(), 'benchmark save' + ext)
+    return Benchmark('Tilemap.save/' + name + ' as ' + ext, lambda: tilemap.save(out))
+
+# Scripted inputs: run right, jumping and dashing every now and then (the same every run)
+def scripted_inputs(steps, seed = 0):
+    rng = random.Random(seed)
+    log = InputLog(seed, 0)
+    for i in range(steps):
+        log.record([False, True] if i % 400 < 300 else [True, False], rng.random() < 0.05, rng.random() < 0.02)
+    return log
+
+def bench_frame():
+    # The whole game: one fixed step and the full render (outlines, upscaling to the 1280x960 screen...) per frame
+    from game import Game
+    game = Game()
+    game.start()
+    log = scripted_inputs(SCRIPTED_FRAMES)
+    def reset():
+        game.reset(log.level, log.seed)
+    def frame():
+        game.movement, jump, dash = log.inputs(game.frame % len(log))
+        game.step(jump, dash)
+        game.render()
+    return Benchmark('frame/scripted level 0', frame, number = SCRIPTED_FRAMES, reset = reset)
+
+# (name, setup) of every benchmark, in the order they run
+def registry():
+    entries = []
+    for name, path in level_maps():
+        entries.append(('physics_rects_around/' + name, lambda name=name, path=path: bench_physics_rects(name, path())))
+    for name, path in level_maps(binary = True):
+        for cold in (False, True):
+            entries.append(('render %s/%s' % ('cold' if cold else 'warm', name), lambda name=name, path=path, cold=cold: bench_render(name, path(), cold)))
+    for n in ENEMY_COUNTS:
+        entries.append(('PhysicsEntity.update/%d enemies' % n, lambda n=n: bench_enemies(n)))
+    for n in POPULATIONS:
+        entries.append(('particles/%d' % n, lambda n=n: bench_particles(n)))
+        entries.append(('sparks/%d' % n, lambda n=n: bench_sparks(n)))
+    for name, path in level_maps(binary = True):
+        entries.append(('Tilemap.load/' + name, lambda name=name, path=path: bench_load(name, path())))
+    for name, path in level_maps():
+        for ext in ('.json', '.map'):
+            entries.append(('Tilemap.save/%s as %s' % (name, ext), lambda name=name, path=path, ext=ext: bench_save(name, path(), ext)))
+    entries.append(('frame/scripted level 0', bench_frame))
+    return entries
+
+def run(args):
+    entries = [(name, setup) for name, setup in registry() if not args.k or any(k in name for k in args.k)]
+    if args.list:
+        for name, setup in entries:
+            print(name)
+        return 0
+
+    baseline = None if args.save_baseline or args.no_compare else load_baseline(args.baseline)
+    if baseline is None and not (args.save_baseline or args.no_compare):
+        # Without a baseline nothing can be checked, which must not look like a passing run
+        print('no baseline at %s to compare against: make one with --save-baseline, or pass --no-compare to only print the numbers' % args.baseline)
+        return 2
+    if baseline and baseline.get('machine') != machine():
+        print('warning: the baseline was measured on a different machine / setup, the comparison may not mean much')
+    print(format_header(baseline))
+    results = []
+    for name, setup in entries:
+        result = measure(setup(), warmup = args.warmup, repeat = args.repeat)
+        results.append(result)
+        print(format_row(result, baseline), flush=True)
+
+    if args.save_baseline:
+        save_baseline(args.baseline, results)
+        print('\nbaseline saved to ' + args.baseline)
+        return 0
+    if baseline is None:
+        return 0 # --no-compare
+
+    regressions = compare(results, baseline, args.tolerance)
+    if regressions:
+        print('\n' + '!' * 80)
+        print('%d REGRESSION%s: slower than the baseline by more than %d%%' % (len(regressions), 'S' if len(regressions) > 1 else '', args.tolerance * 100))
+        for result, base, ratio in regressions:
+            print('  %-44s %12s -> %-12s (%.2fx)' % (result.name, format_time(base), format_time(result.median), ratio))
+        print('!' * 80)
+        return 1
+    print('\nno regressions (tolerance %d%%)' % (args.tolerance * 100))
+    return 0
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(prog = 'python -m benchmarks.suite', description = 'Benchmarks of the game\'s hot paths.')
+    parser.add_argument('-k', action = 'append', metavar = 'TEXT', help = 'only run benchmarks with TEXT in their name (can be repeated)')
+    parser.add_argument('--warmup', type = int, default = WARMUP, help = 'untimed calls before measuring (default %(default)s)')
+    parser.add_argument('--repeat', type = int, default = REPEAT, help = 'timed samples per benchmark (default %(default)s)')
+    parser.add_argument('--baseline', default = BASELINE, help = 'baseline file (default %(default)s)')
+    parser.add_argument('--save-baseline', action = 'store_true', help = 'store the results as the baseline instead of comparing')
+    parser.add_argument('--no-compare', action = 'store_true', help = 'only print the numbers, without a baseline to check them against')
+    parser.add_argument('--tolerance', type = float, default = TOLERANCE, help = 'allowed slowdown before failing, 0.25 = 25%% (default %(default)s)')
+    parser.add_argument('--list', action = 'store_true', help = 'list the benchmarks and exit')
+    return parser.parse_args(argv)
+
+if __name__ == '__main__':
+    sys.exit(run(parse_args(sys.argv[1:])))
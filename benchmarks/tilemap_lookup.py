@@ -0,0 +1,115 @@
+import json
+import os
+import timeit
+
+import pygame
+
+from scripts.tilemap import Tilemap, NEIGHBOR_OFFSETS, PHYSICS_TILES
+
+# Micro-benchmark comparing tile lookups against the old "x;y" string keyed tilemap and the tuple keyed Tilemap.
+# Run from the repository root with:  python -m benchmarks.tilemap_lookup
+
+MAP_DIR = 'data/maps/'
+VIEW_SIZE = (320, 240) # same as the game's graphics display
+REPEAT = 5
+
+
+# ===== Reference implementation using the old string keys ===== #
+
+def legacy_tiles_around(tilemap, pos, tile_size):
+    tiles = []
+    tile_loc = (int(pos[0] // tile_size), int(pos[1] // tile_size))
+    for offset in NEIGHBOR_OFFSETS:
+        check_loc = str(tile_loc[0] + offset[0]) + ';' + str(tile_loc[1] + offset[1])
+        if check_loc in tilemap:
+            tiles.append(tilemap[check_loc])
+    return tiles
+
+def legacy_physics_rects_around(tilemap, pos, tile_size):
+    rects = []
+    for tile in legacy_tiles_around(tilemap, pos, tile_size):
+        if tile['type'] in PHYSICS_TILES:
+            rects.append(pygame.Rect(tile['pos'][0]*tile_size, tile['pos'][1]*tile_size, tile_size, tile_size))
+    return rects
+
+def legacy_solid_check(tilemap, pos, tile_size):
+    tile_loc = str(int(pos[0] // tile_size)) + ';' + str(int(pos[1] // tile_size))
+    if tile_loc in tilemap:
+        if tilemap[tile_loc]['type'] in PHYSICS_TILES:
+            return tilemap[tile_loc]
+
+def legacy_visible(tilemap, offset, tile_size):
+    tiles = []
+    for x in range(offset[0] // tile_size - 1, (offset[0] + VIEW_SIZE[0]) // tile_size + 1):
+        for y in range(offset[1] // tile_size - 1, (offset[1] + VIEW_SIZE[1]) // tile_size + 1):
+            tile_loc = str(x) + ';' + str(y)
+            if tile_loc in tilemap:
+                tiles.append(tilemap[tile_loc])
+    return tiles
+
+
+# ===== Same loops against the tuple keyed Tilemap ===== #
+
+def visible(tilemap, offset):
+    tiles = []
+    grid = tilemap.tilemap
+    tile_size = tilemap.tile_size
+    for x in range(offset[0] // tile_size - 1, (offset[0] + VIEW_SIZE[0]) // tile_size + 1):
+        for y in range(offset[1] // tile_size - 1, (offset[1] + VIEW_SIZE[1]) // tile_size + 1):
+            tile = grid.get((x, y))
+            if tile:
+                tiles.append(tile)
+    return tiles
+
+
+def probe_points(tilemap):
+    # one probe in the middle of every tile in the map, like entities walking across the whole level
+    return [((x + 0.5) * tilemap.tile_size, (y + 0.5) * tilemap.tile_size) for x, y in tilemap.tilemap]
+
+def camera_offsets(tilemap):
+    # cameras centered over every tile (in pixels, like render_scroll)
+    return [(x * tilemap.tile_size - VIEW_SIZE[0] // 2, y * tilemap.tile_size - VIEW_SIZE[1] // 2) for x, y in tilemap.tilemap]
+
+def best_of(func):
+    return min(timeit.repeat(func, number=1, repeat=REPEAT))
+
+
+def run():
+    print('%-12s %-14s %12s %12s %8s' % ('map', 'lookup', 'legacy (us)', 'tuple (us)', 'speedup'))
+    for name in sorted(name for name in os.listdir(MAP_DIR) if name.endswith('.json')): # only the json maps, not converted or other files
+        path = MAP_DIR + name
+        with open(path, 'r') as f:
+            legacy_map = json.load(f)['tilemap']
+
+        tilemap = Tilemap(None)
+        tilemap.load(path)
+        tile_size = tilemap.tile_size
+        points = probe_points(tilemap)
+        offsets = camera_offsets(tilemap)
+
+        cases = [
+            ('tiles_around',
+             lambda: [legacy_tiles_around(legacy_map, p, tile_size) for p in points],
+             lambda: [tilemap.tiles_around(p) for p in points],
+             len(points)),
+            ('physics_rects',
+             lambda: [legacy_physics_rects_around(legacy_map, p, tile_size) for p in points],
+             lambda: [tilemap.physics_rects_around(p) for p in points],
+             len(points)),
+            ('solid_check',
+             lambda: [legacy_solid_check(legacy_map, p, tile_size) for p in points],
+             lambda: [tilemap.solid_check(p) for p in points],
+             len(points)),
+            ('render view',
+             lambda: [legacy_visible(legacy_map, o, tile_size) for o in offsets],
+             lambda: [visible(tilemap, o) for o in offsets],
+             len(offsets)),
+        ]
+
+        for label, legacy, current, calls in cases:
+            legacy_time = best_of(legacy) / calls * 1e6
+            current_time = best_of(current) / calls * 1e6
+            print('%-12s %-14s %12.3f %12.3f %7.2fx' % (name, label, legacy_time, current_time, legacy_time / current_time))
+
+if __name__ == '__main__':
+    run()
@@ -1,7 +1,7 @@
 import sys
 import pygame
 from scripts.utils import load_images
-from scripts.tilemap import Tilemap
+from scripts.tilemap import Tilemap, AUTOTILE_TYPES
 # import json
 
 RENDER_SCALE = 2.0
@@ -75,33 +75,29 @@ class Editor:
             if self.clicking:
                 if not self.ongrid and self.can_place_offgrid:
                     # Add an item to the list of offgrid tiles
-                    self.tilemap.offgrid_tiles.append({'type': self.tile_list[self.tile_group],'variant': self.tile_variant, \
+                    self.tilemap.add_offgrid({'type': self.tile_list[self.tile_group],'variant': self.tile_variant, \
                                                        'pos': (mpos[0] + self.scroll[0], mpos[1] + self.scroll[1])})
                     self.can_place_offgrid = False
                 elif self.ongrid:
-                    # Add an item to the dictionary based on mouse position and current tile selection
-                    self.tilemap.tilemap[str(tile_pos[0]) + ';' + str(tile_pos[1])] = {'type': self.tile_list[self.tile_group], \
-                                                                                        'variant': self.tile_variant, 'pos': tile_pos}
+                    tile_type = self.tile_list[self.tile_group]
+                    # (auto-tiled types are only placed once, otherwise holding the button would undo the auto-tiling)
+                    if tile_type not in AUTOTILE_TYPES or self.tilemap.tilemap.get(tile_pos, {}).get('type') != tile_type:
+                        # Add an item to the dictionary based on mouse position and current tile selection
+                        self.tilemap.set_tile(tile_pos, tile_type, self.tile_variant)
+                        # then fix up the variants of the new tile and its neighbors
+                        self.tilemap.autotile_around(tile_pos)
                     # print(self.tilemap.tilemap)
             # Remove tiles
             if self.right_clicking:
-                # Get a key representation of the current mouse position in tile coordinates
-                tile_loc = str(tile_pos[0]) + ';' + str(tile_pos[1])
-                # If there is a tile at the current mouse location, delete it from the dictionary
-                if tile_loc in self.tilemap.tilemap:
-                    del self.tilemap.tilemap[tile_loc]
-
-                # Handle removal of offgrid tiles
-                for tile in self.tilemap.offgrid_tiles.copy():
-                    # for each tile in the list of offgrid tiles, get the tile's image
-                    tile_img = self.assets[tile['type']][tile['variant']]
-                    # Get a rectangle bounding the image of the currently selected tile
-                    tile_r = pygame.Rect(tile['pos'][0] - self.scroll[0],tile['pos'][1] - self.scroll[1],\
-                                         tile_img.get_width(),tile_img.get_height())
-                    # check if the tile is colliding with the mouse
-                    if tile_r.collidepoint(mpos):
-                        # remove the current tile from the list of tiles
-                        self.tilemap.offgrid_tiles.remove(tile)
+                # If there is a tile at the current mouse location (in tile coordinates), delete it from the dictionary
+                if tile_pos in self.tilemap.tilemap:
+                    self.tilemap.remove_tile(tile_pos)
+                    self.tilemap.autotile_around(tile_pos) # its neighbors may need different variants now
+
+                # Handle removal of offgrid tiles: ask the tilemap's spatial index which decorations are under the mouse
+                for tile in self.tilemap.offgrid_at((mpos[0] + self.scroll[0], mpos[1] + self.scroll[1])):
+                    # remove the current tile from the list of tiles
+                    self.tilemap.remove_offgrid(tile)
             # Show the current tile selection
             self.display.blit(current_tile_img,(5,5))
 
@@ -1,15 +1,14 @@
 import sys
-import random
+import time
 import pygame
-from scripts.entities import PhysicsEntity, Player, Enemy
-from scripts.utils import load_image, load_images
-from scripts.tilemap import Tilemap
 from scripts.clouds import Cloud, Clouds
-from scripts.utils import Animation
-from scripts.particle import Particle
-from scripts.spark import Spark
-import math
-import os
+from scripts.simulation import Simulation, ASSET_LOADERS, FPS
+from scripts.render_targets import RenderTargets
+from scripts.outline import OutlineRenderer, OUTLINE_COLOR
+from scripts.loader import AssetLoader, load_sound, load_picture, load_font
+from scripts.text import TextCache
+from scripts.replay import InputLog, load_log
+from scripts.profiler import Profiler
 
 WHITE = (255, 255, 255)
 BLACK = (0, 0, 0)
@@ -19,16 +18,20 @@ RED = (200, 0, 0)
 MY=(139, 69, 19)
 ME=(101, 67, 33) 
 
+FRAME_SNAP = 0.0002 # frame times this close (in seconds) to 1/FPS count as exactly one game step
+
 # Fonts
 
 is_helping=False
 
 
-class Game:
-    def __init__(self):
+class Game(Simulation):
+    def __init__(self, capacities = None):
 
         pygame.init()
 
+        self.capacities = capacities # pool sizes for the simulation, see CAPACITIES in scripts/simulation.py
+
         # set the window title        
         pygame.display.set_caption('Ninja Game')
 
@@ -52,84 +55,96 @@ class Game:
         self.display = pygame.Surface(GRAPHICS_DISPLAY_SIZE, pygame.SRCALPHA) # This is the game graphics display
         self.display_2 = pygame.Surface(GRAPHICS_DISPLAY_SIZE) # This surface is used to create the "outlines" effect
 
+        # Scaled backgrounds and scratch surfaces are made once and reused every frame (see scripts/render_targets.py)
+        self.render_targets = RenderTargets()
+
         # Create a clock object to control frame rate
         self.clock = pygame.time.Clock()
 
-        # Create a Dictionary containing all the game assets
-        self.assets = {
-            'decor': load_images('tiles/decor'),
-            'grass': load_images('tiles/grass'),
-            'large_decor': load_images('tiles/large_decor'),
-            'stone': load_images('tiles/stone'),
-            'player': load_image('entities/player.png') ,
-            'background': load_image('background.png'),
-            'clouds': load_images('clouds'),
-            'enemy/idle': Animation(load_images('entities/enemy/idle'),img_dur = 6),
-            'enemy/run': Animation(load_images('entities/enemy/run'),img_dur = 4),
-            'player/idle': Animation(load_images('entities/player/idle'),img_dur = 6),
-            'player/run': Animation(load_images('entities/player/run'),img_dur = 4),
-            'player/jump': Animation(load_images('entities/player/jump')),
-            'player/slide': Animation(load_images('entities/player/slide')),
-            'player/wall_slide': Animation(load_images('entities/player/wall_slide')),
-            'particle/leaf': Animation(load_images('particles/leaf'), img_dur = 20, loop=False),
-            'particle/particle': Animation(load_images('particles/particle'), img_dur = 6, loop=False),
-            'gun': load_image('gun.png'),
-            'projectile': load_image('projectile.png'),
-        }
+        # Everything is loaded in the background (see scripts/loader.py), what the menu needs first: the handles can be
+        # used like the fonts / sounds themselves, they only wait for the asset if it hasn't finished loading yet
+        self.loader = AssetLoader()
+        self.menu_background = self.loader.load('menu background', load_picture, 'data/images/background/game.png', priority = 0)
+        self.fontN = self.loader.load('font 2.ttf 60', load_font, "data/font/2.ttf", 60, priority = 0)
+        self.fontH = self.loader.load('font 2.ttf 90', load_font, "data/font/2.ttf", 90, priority = 0)
+        self.fontI = self.fontN # same font and size
+        self.fontP = self.loader.load('font 6.ttf 50', load_font, "data/font/6.ttf", 50, priority = 0)
+        self.fontS = self.loader.load('font 5.ttf 40', load_font, "data/font/5.ttf", 40, priority = 0)
+        self.fontD = self.loader.load('font 6.ttf 70', load_font, "data/font/6.ttf", 70, priority = 0)
 
         # Load Sound effects into a dictionary
+        # Apply mixing (best practice is to load sfx audio files too loud then scale down volume in-game)
         self.sfx = {
-            'jump': pygame.mixer.Sound('data/sfx/jump.wav'),
-            'dash': pygame.mixer.Sound('data/sfx/dash.wav'),
-            'hit': pygame.mixer.Sound('data/sfx/hit.wav'),
-            'shoot': pygame.mixer.Sound('data/sfx/shoot.wav'),
-            'ambience': pygame.mixer.Sound('data/sfx/ambience.wav'),
+            'ambience': self.loader.load('sfx ambience', load_sound, 'data/sfx/ambience.wav', 0.2, priority = 0), # the menu plays it
+            'jump': self.loader.load('sfx jump', load_sound, 'data/sfx/jump.wav', 0.7),
+            'dash': self.loader.load('sfx dash', load_sound, 'data/sfx/dash.wav', 0.3),
+            'hit': self.loader.load('sfx hit', load_sound, 'data/sfx/hit.wav', 0.8),
+            'shoot': self.loader.load('sfx shoot', load_sound, 'data/sfx/shoot.wav', 0.4),
         }
 
-        # Apply mixing (best practice is to load sfx audio files too loud then scale down volume in-game)
-        self.sfx['ambience'].set_volume(0.2)
-        self.sfx['shoot'].set_volume(0.4)
-        self.sfx['hit'].set_volume(0.8)
-        self.sfx['dash'].set_volume(0.3)
-        self.sfx['jump'].set_volume(0.7)
-
-        self.movement = [False,False]
-
-        self.player = Player(self,(50,50),(8,15))
-
-        self.tilemap = Tilemap(self, 16)
-        self.level = 0
-        self.load_level(self.level)
-        self.fontN = pygame.font.Font("data/font/2.ttf", 60)
-        self.fontH = pygame.font.Font("data/font/2.ttf", 90)
-        self.fontI=pygame.font.Font("data/font/2.ttf", 60)
-        self.fontP=pygame.font.Font("data/font/6.ttf", 50)
-        self.fontS=pygame.font.Font("data/font/5.ttf", 40)
-        self.fontD=pygame.font.Font("data/font/6.ttf", 70)
-        self.screenshake = 0 # Timer for screen shake effect
+        # Create a Dictionary containing all the game assets (one job each, so the loader threads share the work)
+        self.game_assets = {name: self.loader.load(name, load) for name, load in ASSET_LOADERS.items()}
+
+        # Rendered menu text is kept around instead of rendering the same strings every frame (see scripts/text.py)
+        self.text_cache = TextCache()
+
+        # Outline effect (see scripts/outline.py); F2 switches between cached outlines and the full display mask
+        self.outlines = OutlineRenderer(self.render_targets)
+
+        # Frame time profiler (see scripts/profiler.py): F3 shows it on screen, and python game.py --profile out.json
+        # (or out.csv) writes the numbers out when the game quits; it doesn't time anything unless one of them is on
+        self.profile_path = sys.argv[sys.argv.index('--profile') + 1] if '--profile' in sys.argv else None
+        self.show_profiler = False
+        self.profiler = Profiler(enabled = self.profile_path is not None)
+
+        self.started = False # the game state is set up by start(), once the game assets are needed
+
+    # Set up the game state and logic (see scripts/simulation.py), this also loads the first level
+    def start(self):
+        if self.started:
+            return
+        self.started = True
+        assets = {name: handle.get() for name, handle in self.game_assets.items()}
+        self.outlines.prepare(assets, [name for name in assets if name.startswith(('player/', 'enemy/'))] + ['gun', 'projectile']) # what gets outlined image by image
+
+        # python game.py --replay session.log plays a recorded session again instead of listening to the keyboard
+        self.replay = load_log(sys.argv[sys.argv.index('--replay') + 1]) if '--replay' in sys.argv else None
+        if self.replay:
+            super().__init__(assets, self.sfx, level = self.replay.level, view_size = self.display.get_size(), seed = self.replay.seed,
+                             profiler = self.profiler, capacities = self.capacities)
+        else:
+            super().__init__(assets, self.sfx, level = 0, view_size = self.display.get_size(), profiler = self.profiler,
+                             capacities = self.capacities)
+        self.pending_input = {'jump': False, 'dash': False} # button presses waiting for the next simulation step
+
+        # python game.py --record session.log saves the inputs of every step (written when the game quits)
+        if '--record' in sys.argv:
+            self.input_log = InputLog(self.seed, self.level)
+        if '--timings' in sys.argv: # python game.py --timings
+            print(self.loader.report())
     
     
     def draw_text(self,text, x, y):
         """Helper function to render text on the screen"""
-        self.text_surface = self.fontN.render(text, True, ME)
+        self.text_surface = self.text_cache.render(self.fontN, text, ME)
         self.screen.blit(self.text_surface, (x, y))
     def draw_head(self,text, x, y):
         """Helper function to render text on the screen"""
-        self.text_surface = self.fontH.render(text, True, MY)
+        self.text_surface = self.text_cache.render(self.fontH, text, MY)
         self.screen.blit(self.text_surface, (x, y))    
     def draw_help(self,text, x, y):
         """Helper function to render text on the screen"""
-        self.text_surface = self.fontI.render(text, True, (255,255,255))
+        self.text_surface = self.text_cache.render(self.fontI, text, (255,255,255))
         self.screen.blit(self.text_surface, (x, y))  
     def draw_instructions(self,text, x, y):
         """Helper function to render text on the screen"""
-        self.text_surface = self.fontP.render(text, True,(216,191,145))
+        self.text_surface = self.text_cache.render(self.fontP, text, (216,191,145))
         self.screen.blit(self.text_surface, (x, y))   
     def draw_developer(self,text, x, y):
-        self.text_surface = self.fontS.render(text, True, (139,69,19))
+        self.text_surface = self.text_cache.render(self.fontS, text, (139,69,19))
         self.screen.blit(self.text_surface, (x, y))
     def draw_develop(self,text, x, y):
-        self.text_surface = self.fontD.render(text, True, (176,97,71))
+        self.text_surface = self.text_cache.render(self.fontD, text, (176,97,71))
         self.screen.blit(self.text_surface, (x, y))    
                 
     
@@ -145,12 +160,19 @@ class Game:
         self.draw_instructions("d.Press 'X' to sabotage.", 220, 350)
         self.draw_instructions("e.Press 'ESC' to close the game.", 220, 400)
         
+        # Nothing on this screen moves, so it is only drawn once (above) and shown again when the window needs it
+        dirty = True
         helping = True
         while helping:
+            if dirty:
+                pygame.display.flip()
+                dirty = False
             for event in pygame.event.get():
                 if event.type == pygame.QUIT:
                     pygame.quit()
                     exit()
+                elif event.type == pygame.WINDOWEXPOSED:
+                    dirty = True
                 elif event.type == pygame.MOUSEBUTTONDOWN:
                     if back_button.collidepoint(event.pos):
                         helping = False
@@ -158,7 +180,7 @@ class Game:
                          # Exit the help screen and return to main menu
                         self.quit_confirmation_screen()
                         self.run()  # Restart the game loop or return to main menu
-            pygame.display.flip()
+            self.clock.tick(FPS) # don't spin a whole CPU core waiting for a click
 
 
     def quit_confirmation_screen(self):
@@ -175,34 +197,43 @@ class Game:
         exit_button = pygame.Rect(560, 330, 200, 50)
         help_button = pygame.Rect(560, 390, 200, 50)
 
+        # the menu background is only scaled the first time the menu is shown
+        image = self.render_targets.scaled_image('menu background', self.menu_background.get(), (1280, 960))
+
+        # The menu is static, so it is only drawn when something changed (when it is first shown, or when another
+        # screen was drawn over it), and the rest of the time we just wait for input
+        dirty = True
         while running:
-            image = pygame.image.load('data/images/background/game.png')
-            image = pygame.transform.scale(image, (1280, 960))
-            self.screen.fill(WHITE)
-            self.screen.blit(image, (0, 0))
-            self.draw_head("NINJA GAME", 400, 160)
-
-        # Draw buttons
-           # pygame.draw.rect(self.screen, BLUE, start_button)
-            #pygame.draw.rect(self.screen, BLUE, exit_button)
-           # pygame.draw.rect(self.screen, BLUE, help_button)
-
-        # Draw button text
-            self.draw_text("START", 560, 265)
-            self.draw_text("EXIT", 560, 330)
-            self.draw_text("HELP", 560, 390)
-        # Developer 
-            self.draw_developer("Developed By: ASTRA OG", 450, 810)  
+            if dirty:
+                self.screen.fill(WHITE)
+                self.screen.blit(image, (0, 0))
+                self.draw_head("NINJA GAME", 400, 160)
+
+            # Draw buttons
+               # pygame.draw.rect(self.screen, BLUE, start_button)
+                #pygame.draw.rect(self.screen, BLUE, exit_button)
+               # pygame.draw.rect(self.screen, BLUE, help_button)
+
+            # Draw button text
+                self.draw_text("START", 560, 265)
+                self.draw_text("EXIT", 560, 330)
+                self.draw_text("HELP", 560, 390)
+            # Developer 
+                self.draw_developer("Developed By: ASTRA OG", 450, 810)  
     
-            pygame.display.flip()
+                pygame.display.flip()
+                dirty = False
 
             for event in pygame.event.get():
                 if event.type == pygame.QUIT:
                    pygame.quit()
                    exit()
+                elif event.type == pygame.WINDOWEXPOSED:
+                    dirty = True
                 elif event.type == pygame.MOUSEBUTTONDOWN:
                     if help_button.collidepoint(event.pos):
                         self.draw_help_menu()
+                        dirty = True
                     elif start_button.collidepoint(event.pos):
                         running = False
                     elif exit_button.collidepoint(event.pos):
@@ -211,8 +242,11 @@ class Game:
                 elif event.type == pygame.KEYDOWN and event.key == pygame.K_ESCAPE:
                     running = False  # Pressing Esc returns to menu
 
+            self.clock.tick(FPS) # don't spin a whole CPU core waiting for a click
+
 
     def run(self): # This is the game loop
+        self.start()
 
         # Start the music
         pygame.mixer.music.load('data/music.wav') # note that .wav files are the best for pygame sounds (issues arise with other file types)
@@ -220,92 +254,10 @@ class Game:
         pygame.mixer.music.play(-1) # play music on an endless loop
         self.sfx['ambience'].play(-1)
 
+        lag = 0 # real time (in seconds) the simulation still has to catch up on
+        self.clock.tick() # start timing here: the time spent in the menus and loading is not time to catch up on
+        last_time = time.perf_counter()
         while True:
-            
-            # Render the base background
-            self.display.fill((0,0,0,0)) # fill display with transparant background
-            self.display_2.blit(pygame.transform.scale(self.assets['background'],self.display.get_size()),(0,0))
-
-            # Increment screen shake timer
-            self.screenshake = max(0, self.screenshake - 1)
-
-            # Check if all the enemies are gone
-            if not len(self.enemies):
-                self.transition += 1
-                # Load the next level
-                if self.transition > 30:
-                    self.level = min(self.level + 1, len(os.listdir('data/maps'))-1)
-                    self.load_level(self.level)
-            if self.transition < 0:
-                self.transition += 2
-
-            # Restart the level if the player dies
-            if self.dead:
-                self.dead += 1
-                if self.dead >= 10:
-                    self.transition = min(30, self.transition + 1) # cap at 30 to prevent level transition from occuring outside of self.dead counter
-                if self.dead > 60:
-                    self.load_level(self.level)
-
-            # Move the Camera
-            self.scroll[0] += (self.player.rect().centerx - self.display.get_width() / 2 - self.scroll[0]) / 2
-            self.scroll[1] += (self.player.rect().centery - self.display.get_height() / 2 - self.scroll[1]) / 2
-            render_scroll = (int(self.scroll[0]),int(self.scroll[1])) # integer version of scroll position
-
-            # Spawn Particles
-            for rect in self.leaf_spawners:
-                # Note: spawn rate of particles is proportional to the size of the particle emitter rectangle
-                if random.random() * 49999 < rect.width * rect.height: 
-                    pos = (rect.x + random.random() * rect.width, rect.y + random.random() * rect.height)
-                    self.particles.append(Particle(self, 'leaf', pos, velocity = [-0.1, 0.3], frame = random.randint(0,20)))
-
-
-            # Update and render the level / environment
-            self.clouds.update() # move the clouds
-            self.clouds.render(self.display_2, offset = render_scroll) # render the clouds (render on display_2 to prevent adding the outline)
-
-            self.tilemap.render(self.display, offset = render_scroll) # render tilemap objects
-
-            # Update and Render the enemies
-            for enemy in self.enemies.copy():
-                kill = enemy.update(self.tilemap, (0,0))
-                enemy.render(self.display, offset = render_scroll)
-                if kill:
-                    self.enemies.remove(enemy)
-
-
-            # Update and Render the player (if they have not died)
-            if not self.dead:
-                self.player.update(self.tilemap, (2*(self.movement[1] - self.movement[0]),0))
-                self.player.render(self.display, offset = render_scroll)
-
-            # Update and Render Projectiles
-            self.process_projectiles(offset = render_scroll)
-
-
-            # Update and render sparks
-            for spark in self.sparks.copy():
-                kill = spark.update()
-                spark.render(self.display, offset = render_scroll)
-                if kill:
-                    self.sparks.remove(spark)
-
-            # Render the "outline" effect:
-            # this logic generates a surface with black "sillhouettes" everywhere we rendered graphics onto display
-            display_mask = pygame.mask.from_surface(self.display) # create a mask from the display
-            display_sillhouette = display_mask.to_surface(setcolor=(0,0,0,180), unsetcolor=(0,0,0,0)) # turn the mask into a surface
-
-            for offset in [(1,0), (-1,0), (0,-1), (0,1)]:
-                self.display_2.blit(display_sillhouette,offset) # render the sillhouette onto the game graphics display
-
-            # Update and Render Particles
-            for particle in self.particles.copy(): # work with a copy of the particles list because we are removing items!
-                kill = particle.update() # update particle and check if it is EOL
-                particle.render(self.display,offset = render_scroll) # render each particle
-                if particle.type == 'leaf':
-                    particle.pos[0] += math.sin(particle.animation.frame * 0.035) * 0.3 # add some oscillations in x-axis movement
-
-                if kill: self.particles.remove(particle) # remove EOL particles
 
             for event in pygame.event.get():
                 if event.type == pygame.QUIT:
@@ -322,12 +274,21 @@ class Game:
 
                     # Handle Jumping (Allows multiple jumps)
                     if (event.key == pygame.K_UP or event.key == pygame.K_w):
-                        if self.player.jump():
-                            self.sfx['jump'].play()
+                        self.pending_input['jump'] = True
 
                     # Handle Dashing
                     if event.key == pygame.K_x:
-                        self.player.dash()
+                        self.pending_input['dash'] = True
+
+                    # Switch the outline renderer (to compare frame times)
+                    if event.key == pygame.K_F2:
+                        self.outlines.toggle()
+
+                    # Show / hide the profiler
+                    if event.key == pygame.K_F3:
+                        self.show_profiler = not self.show_profiler
+                        if self.profiler.enabled != (self.show_profiler or self.profile_path is not None):
+                            self.profiler.toggle()
 
                     # Handle exit via escape key
                     if event.key == pygame.K_ESCAPE:
@@ -340,113 +301,124 @@ class Game:
                     if event.key == pygame.K_RIGHT or event.key == pygame.K_d:
                         self.movement[1] = False
 
-            # Draw a circle for transitions
-            if self.transition:
+            # Advance the game logic in fixed 1/60 s steps to catch up with real time (at most a few steps per frame,
+            # so a long stall doesn't turn into a burst of hundreds of steps), then draw the result. clock.tick() only
+            # caps the frame rate: it counts whole milliseconds (16 or 17 for a 16.7 ms frame), which would make the
+            # number of steps per frame judder, so the frame time itself comes from perf_counter(). A frame time within
+            # a hair of one step is counted as exactly one step, or rounding would still give 0 or 2 steps now and then
+            self.clock.tick(FPS)
+            now = time.perf_counter()
+            frame_time = now - last_time
+            last_time = now
+            if abs(frame_time - 1 / FPS) < FRAME_SNAP:
+                frame_time = 1 / FPS
+            lag = min(lag + frame_time, 4 / FPS)
+            while lag >= 1 / FPS:
+                if self.replay:
+                    if self.frame >= len(self.replay):
+                        self.quit() # the recording is over
+                    self.movement, jump, dash = self.replay.inputs(self.frame)
+                    self.step(jump, dash)
+                else:
+                    self.step(**self.pending_input)
+                self.pending_input = {'jump': False, 'dash': False}
+                lag -= 1 / FPS
+
+            self.render()
+
+            self.count_objects()
+            self.profiler.end_frame()
+
+    def render(self):
+        profiler = self.profiler
+
+        # Render the base background
+        with profiler.scope('draw background'):
+            self.display.fill((0,0,0,0)) # fill display with transparant background
+            self.display_2.blit(self.render_targets.scaled_image('background', self.assets['background'], self.display.get_size()),(0,0))
+
+        render_scroll = (int(self.scroll[0]),int(self.scroll[1])) # integer version of scroll position
+        outlines = self.outlines
+        outlines.begin()
+
+        # Render the level / environment
+        with profiler.scope('draw clouds'):
+            self.clouds.render(self.display_2, offset = render_scroll) # render the clouds (render on display_2 to prevent adding the outline)
+
+        # Everything drawn from here until the particles gets an outline, so it also gets queued with the outline renderer
+        with profiler.scope('draw tilemap'):
+            self.tilemap.render(self.display, offset = render_scroll, outlines = outlines) # render tilemap objects
+
+        with profiler.scope('draw entities'):
+            # Render the enemies
+            for enemy in self.enemies:
+                enemy.render(self.display, offset = render_scroll, outlines = outlines)
+
+            # Render the player (if they have not died)
+            if not self.dead:
+                self.player.render(self.display, offset = render_scroll, outlines = outlines)
+
+        # Render Projectiles and sparks
+        with profiler.scope('draw projectiles'):
+            self.projectiles.render(self.display, self.assets['projectile'], offset = render_scroll, outlines = outlines)
+        with profiler.scope('draw sparks'):
+            self.sparks.render(self.display, offset = render_scroll)
+            if len(self.sparks):
+                # sparks are polygons, not images: their outline is the same polygons drawn in the outline color
+                outlines.add_drawn(lambda surf, shift: self.sparks.render(surf, (render_scroll[0] - shift[0], render_scroll[1] - shift[1]), OUTLINE_COLOR), \
+                                   self.display.get_size())
+
+        # Render the "outline" effect onto the background display (see scripts/outline.py)
+        with profiler.scope('draw outlines'):
+            outlines.render(self.display, self.display_2)
+
+        # Render Particles
+        with profiler.scope('draw particles'):
+            self.particles.render(self.display, offset = render_scroll)
+
+        # Draw a circle for transitions
+        if self.transition:
+            with profiler.scope('draw transition'):
                 # Note that this draw operation is a bit computationally expensive
-                transition_surf = pygame.Surface(self.display.get_size())
+                transition_surf = self.render_targets.target('transition', self.display.get_size())
+                transition_surf.fill((0, 0, 0))
                 pygame.draw.circle(transition_surf, (255, 255, 255), (self.display.get_width()//2, self.display.get_height()//2), (30 - abs(self.transition))*int(self.display.get_width()/30))
                 transition_surf.set_colorkey((255,255,255)) # this makes the color white transparent on this surface
                 self.display.blit(transition_surf,(0,0))
 
-            # Handle screen shake rendering
-            screenshake_offset = (random.random() * self.screenshake - self.screenshake / 2, random.random() * self.screenshake - self.screenshake / 2 )
+        # Handle screen shake rendering
+        screenshake_offset = (self.render_rng.random() * self.screenshake - self.screenshake / 2, self.render_rng.random() * self.screenshake - self.screenshake / 2 )
 
-            # Render the game graphics onto an up-scaled display
+        # Render the game graphics onto an up-scaled display
+        with profiler.scope('draw scale'):
             self.display_2.blit(self.display, (0,0)) # add nominal graphics onto the game display
-            self.screen.blit(pygame.transform.scale(self.display_2, self.screen.get_size()),screenshake_offset)
+            self.render_targets.upscale(self.display_2, self.screen, screenshake_offset) # scales straight into the screen's pixels
+
+        if self.show_profiler:
+            profiler.render(self.screen)
+
+        with profiler.scope('present'):
             pygame.display.update()
-            self.clock.tick(60)
+
+    def step(self, jump = False, dash = False):
+        super().step(jump, dash)
+        self.clouds.update() # move the clouds
 
     def quit(self):
+        if self.started and self.input_log is not None:
+            self.input_log.save(sys.argv[sys.argv.index('--record') + 1])
+        if self.profile_path is not None:
+            self.profiler.dump(self.profile_path)
         pygame.quit()
         sys.exit()
 
-    def process_projectiles(self,offset=(0,0)):
-        # Update and Render Projectiles
-            # Projectiles is a list of all the projectiles in the game.
-            # Each projectile is a 3-Dimensional list with the following data:
-            # [[x,y], direction, timer]
-            # Based on how Python handles lists, here are some tips:
-            # projectile[0][0] is the x-coordinate
-            # projectile[0][1] is the y-coordinate
-            # projectile[1] is the velocity
-            # projectile[2] is the number of frames that projectile has existed
-            for projectile in self.projectiles.copy():
-                projectile[0][0] += projectile[1]
-                projectile[2] += 1
-                img = self.assets['projectile']
-                self.display.blit(img,(projectile[0][0]-img.get_width() / 2 - offset[0], \
-                                  projectile[0][1] - img.get_height() / 2 - offset[1]))
-                if self.tilemap.solid_check(projectile[0]):
-                    self.projectiles.remove(projectile)
-                    # Spawn spark particles upon collision with a wall
-                    for i in range(4):
-                        self.sparks.append(Spark(projectile[0], random.random() - 0.5 + (math.pi if projectile[1]>0 else 0) , 2 + random.random() ))
-                elif projectile[2] > 360:
-                    self.projectiles.remove(projectile)
-
-                # Logic for player collision with projectile
-                elif abs(self.player.dashing) < 50 and not self.dead: # if the player is not in a dash or already dead
-                    if self.player.rect().collidepoint(projectile[0]):
-                        self.projectiles.remove(projectile)
-                        self.dead += 1 # take damage
-                        self.screenshake = max(25,self.screenshake) # this prevents a larger screen shake from being overwritten by a smaller one
-                        # Play death sound
-                        self.sfx['hit'].play()
-                        # Spawn a mess of particles
-                        for i in range(30):
-                            angle = random.random() * math.pi * 2
-                            speed = random.random() * 5
-                            self.sparks.append(Spark(self.player.rect().center,angle, 2 + random.random()))
-                            self.particles.append(Particle(self, 'particle', self.player.rect().center, \
-                                                   velocity=[math.cos(angle+math.pi) * speed * 0.5, \
-                                                             math.sin(angle+math.pi) * speed * 0.5], frame = random.randint(0,7)))
-        
     def load_level(self,map_id):
-        # Load the tilemap
-        self.tilemap.load('data/maps/' + str(map_id) + '.json')
-
-        # ===== Initilize the Level ===== #
+        super().load_level(map_id)
 
         # create clouds
-        self.clouds = Clouds(self.assets['clouds'], count=8)
-        
-        # initialize camera position
-        self.scroll = [0,0] # create a list representing the camera position
-
-        # Game Over State
-        self.dead = 0
-
-        # Scene transition counter
-        self.transition = -30
-
-        # initilize leaf particle spawners
-        self.leaf_spawners = []
-        # Create rectangles representing leaf spawning areas of all the trees
-        for tree in self.tilemap.extract([('large_decor',2)], keep=True):
-                self.leaf_spawners.append(pygame.Rect(4 + tree['pos'][0], 4 + tree['pos'][1], 23, 13))
-
-        # initilize list of particles for particle controllers
-        self.particles = []
-        self.sparks = []
-
-        # initialize list of enemies
-        self.enemies = []
-        
-        # initialize list of projectiles
-        self.projectiles = []
-        
+        self.clouds = Clouds(self.assets['clouds'], count=8, rng=self.render_rng)
 
-        # Spawn player and enemies by looping over all spawners in the level
-        for spawner in self.tilemap.extract([('spawners',0), ('spawners',1)],keep=False):
-            if spawner['variant'] == 0:
-                self.player.pos = spawner['pos'] # move the player to the starting position
-                self.player.air_time = 0
-                self.player.dashing = 0
-                self.player.velocity = [0,0]
-                self.player.flip = False
-            else:
-                # Spawn enemies
-                self.enemies.append(Enemy(self,spawner['pos'],(8,15)))
-Game().quit_confirmation_screen()
-Game().run()
+if __name__ == '__main__':
+    game = Game() # one Game for the menu and the game itself, so nothing gets loaded twice
+    game.quit_confirmation_screen()
+    game.run()
@@ -0,0 +1,146 @@
+import hashlib
+import json
+import os
+
+import pygame
+
+CACHE_DIR = '.cache/atlas/' # packed atlases are kept here between launches (not part of the repository)
+ATLAS_VERSION = 2 # bump when the packing or the index format changes, so old caches get rebuilt
+PAGE_SIZE = 512 # width and maximum height of an atlas page
+MAX_PACKED_SIZE = 256 # images bigger than this (the backgrounds) are loaded on their own
+
+class Atlas:
+    # Packs all the small images under an image folder into one (or a few) big "page" surfaces, so starting the game
+    # loads a single file instead of ~100 separate PNGs. Every image is handed out as a subsurface of its page, which
+    # shares the page's pixels and colorkey.
+    #
+    # The packed pages and an index (page and rectangle of every image) are cached on disk. The cache is rebuilt
+    # whenever an image is added, removed or modified (checked using the file sizes and modification times).
+    #
+    # Several processes can build the cache at once (the level validation workers all start with a cold cache), so a
+    # reader must never see a half written file or pages that don't belong to its index. Every file is written under a
+    # temporary name and renamed into place, the page files are named after the sources they were packed from (so a
+    # page is never overwritten with different content) and index.json, which names its pages, is written last.
+    def __init__(self, root, cache_dir = CACHE_DIR):
+        self.root = root
+        self.cache_dir = cache_dir
+        self.pages = []
+        self.index = {} # image path (relative to root, with '/') -> [page number, x, y, w, h], or None if not packed
+        self.folders = {} # folder path -> sorted file names in it
+
+        sources = self.scan()
+        if not self.load_cache(sources):
+            self.pack(sources)
+            self.save_cache(sources)
+
+        for path in self.index:
+            folder, name = path.rsplit('/', 1) if '/' in path else ('', path)
+            self.folders.setdefault(folder, []).append(name)
+        for names in self.folders.values():
+            names.sort()
+
+    def __contains__(self, path):
+        return self.index.get(path) is not None
+
+    # The image at path (relative to the root folder), as a subsurface of its atlas page
+    def image(self, path):
+        page, x, y, w, h = self.index[path]
+        return self.pages[page].subsurface((x, y, w, h))
+
+    # Sorted names of the files in a folder (relative to the root folder), like sorted(os.listdir())
+    def listdir(self, folder):
+        return self.folders[folder.strip('/')]
+
+    # Sizes and modification times of every image under root, this is what the cache is keyed by
+    def scan(self, folder = ''):
+        sources = {}
+        for entry in os.scandir(self.root + folder):
+            if entry.is_dir():
+                sources.update(self.scan(folder + entry.name + '/'))
+            elif entry.name.lower().endswith('.png'):
+                stat = entry.stat()
+                sources[folder + entry.name] = [stat.st_size, stat.st_mtime_ns]
+        return sources
+
+    def load_cache(self, sources):
+        try:
+            with open(self.cache_dir + 'index.json', 'r') as f:
+                cache = json.load(f)
+            if cache['version'] != ATLAS_VERSION or cache['sources'] != sources:
+                return False
+            pages = []
+            for name in cache['pages']:
+                page = pygame.image.load(self.cache_dir + name).convert()
+                page.set_colorkey((0,0,0))
+                pages.append(page)
+        except (OSError, ValueError, KeyError, pygame.error):
+            return False # no cache yet (or a broken one), just pack again
+        self.pages = pages
+        self.index = cache['index']
+        return True
+
+    def save_cache(self, sources):
+        key = hashlib.sha1(json.dumps([ATLAS_VERSION, sources], sort_keys=True).encode()).hexdigest()[:16]
+        names = ['page_%s_%d.png' % (key, i) for i in range(len(self.pages))]
+        try:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            for name, page in zip(names, self.pages):
+                self.replace_file(name, lambda path, page=page: pygame.image.save(page, path))
+            def write_index(path):
+                with open(path, 'w') as f:
+                    json.dump({'version': ATLAS_VERSION, 'sources': sources, 'pages': names, 'index': self.index}, f)
+            self.replace_file('index.json', write_index)
+            # pages of older packings aren't needed any more (a process still using an older index just packs again)
+            for name in os.listdir(self.cache_dir):
+                if name.startswith('page_') and name.endswith('.png') and '.tmp' not in name and name not in names:
+                    os.remove(self.cache_dir + name)
+        except (OSError, pygame.error):
+            pass # can't write the cache (read-only install?), the atlas still works, it just gets packed every launch
+
+    # Write a cache file with write(path) under a temporary name, then rename it into place (never leave a half written
+    # file behind, and never let two processes write into the same file)
+    def replace_file(self, name, write):
+        base, ext = os.path.splitext(name)
+        tmp = self.cache_dir + '%s.%d.tmp%s' % (base, os.getpid(), ext) # keep the extension, pygame picks the image format by it
+        try:
+            write(tmp)
+            os.replace(tmp, self.cache_dir + name)
+        finally:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+
+    # Shelf packing: sort the images by height and lay them out left to right in rows ("shelves"), starting a new
+    # page when a page is full
+    def pack(self, sources):
+        images = {}
+        self.index = {}
+        for path in sources:
+            img = pygame.image.load(self.root + path).convert() # same conversion as loading it on its own
+            if img.get_width() > MAX_PACKED_SIZE or img.get_height() > MAX_PACKED_SIZE:
+                self.index[path] = None
+            else:
+                images[path] = img
+
+        layouts = [] # per page: list of (path, x, y)
+        x = y = shelf_height = 0
+        for path in sorted(images, key = lambda path: (-images[path].get_height(), path)):
+            w, h = images[path].get_size()
+            if x + w > PAGE_SIZE: # next shelf
+                x, y, shelf_height = 0, y + shelf_height, 0
+            if not layouts or y + h > PAGE_SIZE: # next page
+                layouts.append([])
+                x = y = shelf_height = 0
+            layouts[-1].append((path, x, y))
+            self.index[path] = [len(layouts) - 1, x, y, w, h]
+            x += w
+            shelf_height = max(shelf_height, h)
+
+        self.pages = []
+        for layout in layouts:
+            height = max(y + images[path].get_height() for path, x, y in layout)
+            page = pygame.Surface((PAGE_SIZE, height)).convert()
+            page.fill((0,0,0))
+            for path, x, y in layout:
+                page.blit(images[path], (x, y))
+            page.set_colorkey((0,0,0))
+            self.pages.append(page)
@@ -0,0 +1,98 @@
+import math
+from collections import OrderedDict
+
+import pygame
+
+CHUNK_SIZE = 8 # width and height of a chunk, in tiles
+MAX_CHUNKS = 64 # how many pre-rendered chunks to keep around before the least recently used ones get thrown away
+
+class ChunkCache:
+    # Pre-renders fixed size square regions ("chunks") of a tilemap into surfaces, so drawing the level only takes a
+    # handful of blits per frame instead of one per visible tile and decoration.
+    #
+    # Chunks are built lazily the first time they are drawn. When the tilemap changes, the affected chunks are dropped
+    # and simply rebuilt the next time they come into view. Only the MAX_CHUNKS most recently drawn chunks are kept.
+    def __init__(self, tilemap, chunk_size = CHUNK_SIZE, max_chunks = MAX_CHUNKS):
+        self.tilemap = tilemap
+        self.chunk_size = chunk_size
+        self.max_chunks = max_chunks
+        self.chunks = OrderedDict() # (chunk x, chunk y) -> surface (or None for chunks with nothing in them)
+        self.overhang = None # how many extra tiles a grid tile image can reach past its own cell (worked out on first build)
+
+    @property
+    def chunk_px(self):
+        return self.chunk_size * self.tilemap.tile_size
+
+    # Drop every chunk (used when a level loads or the whole map changes at once)
+    def clear(self):
+        self.chunks.clear()
+        self.overhang = None
+
+    # Make sure chunks are built with enough margin to include tiles whose images are bigger than one cell
+    def fit_tile(self, tile):
+        if self.overhang is None:
+            return # nothing has been built yet, the whole map gets measured on the first build
+        img = self.tilemap.game.assets[tile['type']][tile['variant']]
+        tile_size = self.tilemap.tile_size
+        self.overhang = max(self.overhang, math.ceil(img.get_width() / tile_size) - 1, math.ceil(img.get_height() / tile_size) - 1)
+
+    # Drop every chunk that can show the grid tile at pos (in tile coordinates)
+    def invalidate_tile(self, pos):
+        if self.overhang is None:
+            return
+        reach = self.tilemap.tile_size * (self.overhang + 1)
+        self.invalidate_rect((pos[0] * self.tilemap.tile_size, pos[1] * self.tilemap.tile_size, reach, reach))
+
+    # Drop every chunk overlapping a rectangle (in pixels)
+    def invalidate_rect(self, rect):
+        size = self.chunk_px
+        for cx in range(int(rect[0] // size), int((rect[0] + rect[2] - 1) // size) + 1):
+            for cy in range(int(rect[1] // size), int((rect[1] + rect[3] - 1) // size) + 1):
+                self.chunks.pop((cx, cy), None)
+
+    # Returns the surface of a chunk, building it if needed
+    def get(self, loc):
+        if loc in self.chunks:
+            self.chunks.move_to_end(loc) # mark as most recently used
+            return self.chunks[loc]
+
+        chunk = self.build(loc)
+        self.chunks[loc] = chunk
+        if len(self.chunks) > self.max_chunks:
+            self.chunks.popitem(last=False) # evict the least recently used chunk
+        return chunk
+
+    def build(self, loc):
+        tilemap = self.tilemap
+        assets = tilemap.game.assets
+        tile_size = tilemap.tile_size
+        size = self.chunk_px
+        origin = (loc[0] * size, loc[1] * size)
+        bounds = pygame.Rect(origin[0], origin[1], size, size)
+
+        if self.overhang is None:
+            self.overhang = 0
+            for tile_type, variant in tilemap.tilemap.pairs(): # only the kinds of tiles matter, not where they are
+                self.fit_tile({'type': tile_type, 'variant': variant})
+
+        surf = pygame.Surface((size, size))
+        surf.set_colorkey((0, 0, 0)) # same transparency scheme as the tile images themselves
+        empty = True
+
+        # Render decorations first (anything reaching into this chunk, even if it starts in a neighbor)
+        for tile in tilemap.offgrid_in_rect(bounds):
+            pos = (math.floor(tile['pos'][0]), math.floor(tile['pos'][1])) # positions can be fractional
+            surf.blit(assets[tile['type']][tile['variant']], (pos[0] - origin[0], pos[1] - origin[1]))
+            empty = False
+
+        # Then the grid tiles, in the same order Tilemap.render used to draw them
+        grid = tilemap.tilemap
+        first = (loc[0] * self.chunk_size - self.overhang, loc[1] * self.chunk_size - self.overhang)
+        for x in range(first[0], (loc[0] + 1) * self.chunk_size):
+            for y in range(first[1], (loc[1] + 1) * self.chunk_size):
+                tile = grid.get((x, y))
+                if tile:
+                    surf.blit(assets[tile['type']][tile['variant']], (x * tile_size - origin[0], y * tile_size - origin[1]))
+                    empty = False
+
+        return None if empty else surf
@@ -17,14 +17,14 @@ class Cloud:
                             render_pos[1] % (surf.get_height() + self.img.get_height()) - self.img.get_height())) # use the mod operator to loop the cloud across the screen
 
 class Clouds: # class to store all the clouds in the scene
-    def __init__(self, cloud_images, count = 16):
+    def __init__(self, cloud_images, count = 16, rng = random): # rng: where the random numbers come from (a random.Random, or the random module)
         self.clouds = []
         
         # Generate count number of clouds at random positions, chosing a random variant of the cloud image, with random speed (alawys moving right)
         # and random depth (always at least 0.2); recall that random.random produces a random float between 0.0 and 1.0
         for i in range(count):
-            self.clouds.append(Cloud((random.random() * 99999, random.random() * 99999), random.choice(cloud_images), \
-                                      random.random()* 0.05 + 0.05, random.random() * 0.6 + 0.2))
+            self.clouds.append(Cloud((rng.random() * 99999, rng.random() * 99999), rng.choice(cloud_images), \
+                                      rng.random()* 0.05 + 0.05, rng.random() * 0.6 + 0.2))
             
         self.clouds.sort(key = lambda x: x.depth) # sort the list of clouds based on depth (clouds at farther depth get rendered first)
 
@@ -1,8 +1,5 @@
 import pygame
 import math
-import random
-from scripts.particle import Particle
-from scripts.spark import Spark
 
 GRAVITY = 0.4
 TERMINAL_VELOCITY = 12
@@ -30,7 +27,7 @@ class PhysicsEntity:
     def set_action(self, action):
         if action != self.action: # check if animation action has changed
             self.action = action
-            self.animation = self.game.assets[self.type + '/' + self.action].copy() # grab the new animation
+            self.animation = self.game.assets[self.type + '/' + self.action].play() # start playing the new animation
 
     def update(self, tilemap, movement = (0,0)):
         self.collisions = {'up': False, 'down': False, 'left': False, 'right': False}
@@ -46,16 +43,16 @@ class PhysicsEntity:
         self.pos[0] += frame_movement[0]
         entity_rect = self.rect()
     
-        # Check for collisions with tilemap physics objects 
+        # Check for collisions with tilemap physics objects (their rects are (x, y, w, h) tuples)
         for rect in tilemap.physics_rects_around(self.pos): # loop across neighboring tiles only
 
             # resolve collisions in the x-axis
             if entity_rect.colliderect(rect):
                 if frame_movement[0] > 0:
-                    entity_rect.right = rect.left
+                    entity_rect.right = rect[0] # left edge of the tile
                     self.collisions['right'] = True
                 if frame_movement[0] < 0:
-                    entity_rect.left = rect.right
+                    entity_rect.left = rect[0] + rect[2] # right edge of the tile
                     self.collisions['left'] = True
                 self.pos[0] = entity_rect.x
 
@@ -69,10 +66,10 @@ class PhysicsEntity:
         # Resolve collisions in the y-axis
             if entity_rect.colliderect(rect):
                 if frame_movement[1] > 0:
-                    entity_rect.bottom = rect.top
+                    entity_rect.bottom = rect[1] # top edge of the tile
                     self.collisions['down'] = True
                 if frame_movement[1] < 0:
-                    entity_rect.top = rect.bottom
+                    entity_rect.top = rect[1] + rect[3] # bottom edge of the tile
                     self.collisions['up'] = True
                 self.pos[1] = entity_rect.y
 
@@ -88,19 +85,27 @@ class PhysicsEntity:
         if self.collisions['left'] or self.collisions['right']:
             self.velocity[0] = 0 # set x-velocity = 0 after collision occurs
 
+        # Register our new position in the game's broadphase grid, which is what entity-vs-entity checks go through
+        self.game.entities.insert(self, self.rect())
+
         self.animation.update()
 
-    def render(self,surf,offset):
-        surf.blit(pygame.transform.flip(self.animation.img(),self.flip,False),\
-                  (self.pos[0]-offset[0]+self.anim_offset[0],self.pos[1]-offset[1]+self.anim_offset[1]))
+    # outlines: optional OutlineRenderer to queue the outline of what gets drawn (see scripts/outline.py)
+    def render(self,surf,offset,outlines=None):
+        pos = (self.pos[0]-offset[0]+self.anim_offset[0],self.pos[1]-offset[1]+self.anim_offset[1])
+        surf.blit(self.animation.img(self.flip), pos) # the animation has the flipped frames ready
+        if outlines:
+            outlines.add(self.animation.img(), pos, self.flip)
 
 # Enemy class
 class Enemy(PhysicsEntity):
-    def __init__(self,game,pos,size):
+    def __init__(self,game,pos,size,number = -1):
         super().__init__(game,'enemy',pos,size)
 
         self.walking = 0
         self.flip = False
+        self.number = number # which of the level's enemies this is (in spawner order), its projectiles carry it
+        self.shots = 0 # number of projectiles fired so far
 
     def update(self, tilemap, movement = (0,0)):
         
@@ -132,30 +137,34 @@ class Enemy(PhysicsEntity):
             movement = (movement[0] - 0.5 if self.flip else 0.5, movement[1]) # move depending on the direction the enemy is facing
             self.walking = max(0,self.walking-1) # subtract from the walking timer
 
-            # Shoot a projectile when the walking timer runs out
-            if not self.walking:
+            # Shoot a projectile when the walking timer runs out (and the player is within range, see Simulation.look_for_player)
+            if not self.walking and self in self.game.in_sight:
                 dis = (self.game.player.pos[0] - self.pos[0], self.game.player.pos[1] - self.pos[1])
                 if abs(dis[1] < 16): # if the player is within +/- 1 tile in y
                     if (self.flip and dis[0] < 0): # if the player is to the left of the enemy and the enemy is facing left
                         # Spawn a projectile (left velocity)
-                        self.game.projectiles.append([[self.rect().centerx - 7, self.rect().centery],-5,0])
-                        # Spawn sparks at the end of the gun barrel
-                        for i in range(4):
-                            self.game.sparks.append(Spark(self.game.projectiles[-1][0], random.random() - 0.5 + math.pi, 2 + random.random() ))
-                        # Play the shooting sound
-                        self.game.sfx['shoot'].play()
+                        barrel = (self.rect().centerx - 7, self.rect().centery)
+                        if self.game.projectiles.spawn(barrel, -5, self.number):
+                            self.shots += 1
+                            # Spawn sparks at the end of the gun barrel
+                            for i in range(4):
+                                self.game.sparks.spawn(barrel, self.game.rng.random() - 0.5 + math.pi, 2 + self.game.rng.random() )
+                            # Play the shooting sound
+                            self.game.sfx['shoot'].play()
                     elif (not self.flip and dis[0] > 0):
                         # Spawn a projectile (right velocity)
-                        self.game.projectiles.append([[self.rect().centerx + 7, self.rect().centery],5,0])
-                        # Spawn sparks at the end of the gun barrel
-                        for i in range(4):
-                            self.game.sparks.append(Spark(self.game.projectiles[-1][0], random.random() - 0.5, 2 - random.random() ))
-                        # Play the shooting sound
-                        self.game.sfx['shoot'].play()
+                        barrel = (self.rect().centerx + 7, self.rect().centery)
+                        if self.game.projectiles.spawn(barrel, 5, self.number):
+                            self.shots += 1
+                            # Spawn sparks at the end of the gun barrel
+                            for i in range(4):
+                                self.game.sparks.spawn(barrel, self.game.rng.random() - 0.5, 2 - self.game.rng.random() )
+                            # Play the shooting sound
+                            self.game.sfx['shoot'].play()
         
         # for each frame that we are not walking, have a random chance to start walking again
-        elif random.random() < 0.01:
-            self.walking = random.randint(30,120) # this is the number of frames we will continue to walk for
+        elif self.game.rng.random() < 0.01:
+            self.walking = self.game.rng.randint(30,120) # this is the number of frames we will continue to walk for
 
         # Handle animations
         if movement[0] != 0:
@@ -166,39 +175,36 @@ class Enemy(PhysicsEntity):
         # Get nominal physics update logic
         super().update(tilemap, movement = movement)
 
-        # Handle Enemy death (collisions with player dash attack)
-        if abs(self.game.player.dashing) >= 50:
-            if self.rect().colliderect(self.game.player.rect()):
-                # Generate particles
-                for i in range(30):
-                    angle = random.random() * math.pi * 2
-                    speed = random.random() * 5
-                    self.game.sparks.append(Spark(self.rect().center,angle, 2 + random.random()))
-                    self.game.particles.append(Particle(self.game, 'particle', self.rect().center, \
-                                            velocity=[math.cos(angle+math.pi) * speed * 0.5, \
-                                                        math.sin(angle+math.pi) * speed * 0.5],\
-                                            frame = random.randint(0,7)))
-                    self.game.sparks.append(Spark(self.rect().center, 0,       5+random.random()))
-                    self.game.sparks.append(Spark(self.rect().center, math.pi, 5+random.random()))
-                # Apply screenshake
-                self.game.screenshake = max(25,self.game.screenshake)
-                # Play death sound
-                self.game.sfx['hit'].play()
-                return True
-            else:
-                return False
-        else:
-            return False
-
-    def render(self, surf, offset = (0,0)):
-        super().render(surf, offset=offset)
+    # Enemy death (the player's dash attack hit it, see Simulation.step): the death effects
+    def die(self):
+        # Generate particles
+        for i in range(30):
+            angle = self.game.rng.random() * math.pi * 2
+            speed = self.game.rng.random() * 5
+            self.game.sparks.spawn(self.rect().center,angle, 2 + self.game.rng.random())
+            self.game.particles.spawn('particle', self.rect().center, \
+                                    velocity=[math.cos(angle+math.pi) * speed * 0.5, \
+                                                math.sin(angle+math.pi) * speed * 0.5],\
+                                    frame = self.game.rng.randint(0,7))
+            self.game.sparks.spawn(self.rect().center, 0,       5+self.game.rng.random())
+            self.game.sparks.spawn(self.rect().center, math.pi, 5+self.game.rng.random())
+        # Apply screenshake
+        self.game.screenshake = max(25,self.game.screenshake)
+        # Play death sound
+        self.game.sfx['hit'].play()
+
+    def render(self, surf, offset = (0,0), outlines = None):
+        super().render(surf, offset=offset, outlines=outlines)
 
         # Render a gun on top of the enemy
         if self.flip:
-            surf.blit(pygame.transform.flip(self.game.assets['gun'],True,False),\
-                      (self.rect().centerx - 4 - self.game.assets['gun'].get_width() - offset[0],self.rect().centery - offset[1]))
+            pos = (self.rect().centerx - 4 - self.game.assets['gun'].get_width() - offset[0],self.rect().centery - offset[1])
+            surf.blit(self.game.assets['gun/flipped'], pos)
         else:
-            surf.blit(self.game.assets['gun'],(self.rect().centerx + 4 - offset[0], self.rect().centery - offset[1]))
+            pos = (self.rect().centerx + 4 - offset[0], self.rect().centery - offset[1])
+            surf.blit(self.game.assets['gun'], pos)
+        if outlines:
+            outlines.add(self.game.assets['gun'], pos, self.flip)
             
 
 class Player(PhysicsEntity):
@@ -209,9 +215,9 @@ class Player(PhysicsEntity):
         self.wall_slide = False
         self.dashing = False
 
-    def render(self, surf, offset = (0,0)):
+    def render(self, surf, offset = (0,0), outlines = None):
         if abs(self.dashing) <= 50:
-            super().render(surf,offset)
+            super().render(surf,offset,outlines)
 
     def update(self, tilemap, movement=(0,0)):
         super().update(tilemap, movement=movement)
@@ -225,12 +231,12 @@ class Player(PhysicsEntity):
             self.game.screenshake = max(25,self.game.screenshake)
             # Spawn a mess of particles
             for i in range(30):
-                angle = random.random() * math.pi * 2
-                speed = random.random() * 5
-                self.game.sparks.append(Spark(self.rect().center,angle, 2 + random.random()))
-                self.game.particles.append(Particle(self.game, 'particle', self.rect().center, \
+                angle = self.game.rng.random() * math.pi * 2
+                speed = self.game.rng.random() * 5
+                self.game.sparks.spawn(self.rect().center,angle, 2 + self.game.rng.random())
+                self.game.particles.spawn('particle', self.rect().center, \
                                         velocity=[math.cos(angle+math.pi) * speed * 0.5, \
-                                                    math.sin(angle+math.pi) * speed * 0.5], frame = random.randint(0,7)))
+                                                    math.sin(angle+math.pi) * speed * 0.5], frame = self.game.rng.randint(0,7))
 
         # Logic for restoring your jump / keeping track of air time
         self.air_time += 1
@@ -269,11 +275,11 @@ class Player(PhysicsEntity):
         # Generate a burst of particles for the dash at self.dashing == 60 and 50 (start/end of dash)
         if abs(self.dashing) in {60,50}:
             for i in range(20): # repeat 20 times
-                angle = random.random() * math.pi * 2 # 0 to 2pi
-                speed = random.random() * 0.5 + 0.5 # 0.5 to 1
+                angle = self.game.rng.random() * math.pi * 2 # 0 to 2pi
+                speed = self.game.rng.random() * 0.5 + 0.5 # 0.5 to 1
                 particle_vel = [math.cos(angle) * speed, math.sin(angle) * speed]
                 # Spawn the particle
-                self.game.particles.append(Particle(self.game,'particle',self.rect().center,velocity=particle_vel,frame=random.randint(0,7))) 
+                self.game.particles.spawn('particle',self.rect().center,velocity=particle_vel,frame=self.game.rng.randint(0,7))
         
         # Handle Dashing Movement
         if self.dashing > 0:
@@ -286,8 +292,8 @@ class Player(PhysicsEntity):
             if abs(self.dashing) == 51:
                    self.velocity[0] *= 0.1 # take away 90% of dash velocity after 9 frames (let air drag remove the remaining velocity)
             # Generate a stream of particles for the duration of the dash
-            particle_vel = [abs(self.dashing)/self.dashing * random.random()*3, 0]
-            self.game.particles.append(Particle(self.game,'particle',self.rect().center,velocity=particle_vel,frame=random.randint(0,7))) 
+            particle_vel = [abs(self.dashing)/self.dashing * self.game.rng.random()*3, 0]
+            self.game.particles.spawn('particle',self.rect().center,velocity=particle_vel,frame=self.game.rng.randint(0,7))
         # The remaining 50 frames are for the dash cooldown! (can't dash until self.dashing == 0)
 
 
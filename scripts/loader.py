@@ -0,0 +1,101 @@
+import queue
+import threading
+import time
+
+import pygame
+
+class AssetHandle:
+    # Stands in for an asset that is still loading. get() waits for it (only if it isn't ready yet) and returns it;
+    # anything else, like handle.render(...) on a font or handle.play() on a sound, is passed through to the asset.
+    def __init__(self, name):
+        self.name = name
+        self.ready = threading.Event()
+        self.value = None
+        self.error = None
+        self.load_time = None # seconds spent loading it (on a loader thread)
+        self.wait_time = 0 # seconds the game spent waiting for it
+
+    def get(self):
+        if not self.ready.is_set():
+            start = time.perf_counter()
+            self.ready.wait()
+            self.wait_time += time.perf_counter() - start
+        if self.error is not None:
+            raise self.error
+        return self.value
+
+    def __getattr__(self, attr):
+        return getattr(self.get(), attr)
+
+class AssetLoader:
+    # Loads assets (images, sounds, fonts...) on a few background threads, so the game can show its menu while the
+    # rest is still loading. load() returns an AssetHandle straight away.
+    #
+    # Jobs with a lower priority number are picked up first (ties go in the order they were added), so whatever the
+    # first screen needs can be put at the front of the line. Load and wait times of every asset are kept for report().
+    def __init__(self, workers = 4):
+        self.jobs = queue.PriorityQueue()
+        self.handles = []
+        self.count = 0 # keeps jobs with the same priority in order
+        for i in range(workers):
+            threading.Thread(target=self.work, daemon=True).start()
+
+    # Load an asset by calling func(*args) on a loader thread
+    def load(self, name, func, *args, priority = 1):
+        handle = AssetHandle(name)
+        self.handles.append(handle)
+        self.jobs.put((priority, self.count, handle, func, args))
+        self.count += 1
+        return handle
+
+    def work(self):
+        while True:
+            priority, count, handle, func, args = self.jobs.get()
+            start = time.perf_counter()
+            try:
+                handle.value = func(*args)
+            except Exception as e: # handed to whoever uses the asset
+                handle.error = e
+            handle.load_time = time.perf_counter() - start
+            handle.ready.set()
+
+    # A table of where startup time went, slowest assets first
+    def report(self):
+        lines = ['%-24s %10s %10s' % ('asset', 'load (ms)', 'wait (ms)')]
+        for handle in sorted(self.handles, key = lambda handle: -(handle.load_time or 0)):
+            load_time = '%10.1f' % (handle.load_time * 1000) if handle.load_time is not None else '%10s' % '...'
+            lines.append('%-24s %s %10.1f' % (handle.name, load_time, handle.wait_time * 1000))
+        return '\n'.join(lines)
+
+# Loaders for the kinds of assets that need a bit of setup
+
+font_lock = threading.Lock() # SDL_ttf shares one FreeType library between all fonts, so only use one at a time
+
+class LockedFont:
+    # A pygame font that only renders while holding font_lock: the game renders text on the main thread while the
+    # loader threads may still be opening other fonts, which also goes through FreeType
+    def __init__(self, font):
+        self.font = font
+
+    def render(self, *args, **kwargs):
+        with font_lock:
+            return self.font.render(*args, **kwargs)
+
+    def size(self, text):
+        with font_lock:
+            return self.font.size(text)
+
+    def __getattr__(self, attr):
+        return getattr(self.font, attr)
+
+def load_font(path, size):
+    with font_lock:
+        return LockedFont(pygame.font.Font(path, size))
+
+def load_sound(path, volume = 1.0):
+    sound = pygame.mixer.Sound(path)
+    sound.set_volume(volume)
+    return sound
+
+def load_picture(path):
+    return pygame.image.load(path).convert()
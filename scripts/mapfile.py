@@ -0,0 +1,296 @@
+import argparse
+import json
+import mmap
+import os
+import struct
+
+import numpy as np
+
+# Binary map format (little endian), an alternative to the json map files that loads without parsing any text:
+#
+#   header       magic b'NJMP', version (u16), tile size (u16), chunk size (u16), reserved (u16)
+#   strings      count (u16), then per string: length (u8) + utf-8 bytes; the tile type names
+#   chunks       count (u32), then per chunk: chunk x (i32), chunk y (i32), encoding (u8), 3 padding bytes,
+#                data offset (u32, from the start of the file), data size (u32)
+#   offgrid      count (u32), then that many records: type (u16), variant (u16), x (f64), y (f64)
+#   grid index   count (u32), then per (chunk, type, variant) that occurs on the grid: chunk number (u32, position in
+#                the chunk directory), type (u16), variant (u16), number of tiles (u32)
+#   offgrid index  count (u32), then per (chunk, type, variant) of the off-grid tiles (chunk of the tile's position,
+#                in pixels / (CHUNK_SIZE * tile size)): chunk x (i32), chunk y (i32), type (u16), variant (u16),
+#                first (u32), count (u32); the record numbers of those tiles are offgrid order[first:first + count]
+#   offgrid order  one record number (u32) per off-grid tile, grouped as described by the offgrid index
+#   chunk data   per chunk, either
+#                  DENSE: the type (u16) of every cell then the variant (u16) of every cell, row by row
+#                  RLE:   runs of identical cells, each run is length (u16), type (u16), variant (u16)
+#
+# Types are indexes into the string table, EMPTY marks cells without a tile. Chunks hold CHUNK_SIZE x CHUNK_SIZE grid
+# cells and chunks without any tiles are not stored at all.
+#
+# The two indexes answer "where are the tiles of this kind?" (spawners, trees, physics tiles...) by chunk, without
+# decoding every chunk or looking at every off-grid record.
+
+MAGIC = b'NJMP'
+VERSION = 2
+CHUNK_SIZE = 16
+EMPTY = 0xFFFF
+
+DENSE = 0
+RLE = 1
+
+HEADER = struct.Struct('<4sHHHH')
+CHUNK_ENTRY = struct.Struct('<iiB3xII')
+OFFGRID_RECORD = np.dtype([('type', '<u2'), ('variant', '<u2'), ('x', '<f8'), ('y', '<f8')])
+RUN = np.dtype([('length', '<u2'), ('type', '<u2'), ('variant', '<u2')])
+GRID_INDEX_ENTRY = np.dtype([('chunk', '<u4'), ('type', '<u2'), ('variant', '<u2'), ('count', '<u4')])
+OFFGRID_INDEX_ENTRY = np.dtype([('cx', '<i4'), ('cy', '<i4'), ('type', '<u2'), ('variant', '<u2'), ('first', '<u4'), ('count', '<u4')])
+
+CACHE_DIR = '.cache/maps/' # binary versions of the json maps (not part of the repository)
+
+def is_map_file(path):
+    with open(path, 'rb') as f:
+        return f.read(len(MAGIC)) == MAGIC
+
+# Format version of a binary map file (None if it isn't one)
+def map_version(path):
+    with open(path, 'rb') as f:
+        header = f.read(HEADER.size)
+    if len(header) < HEADER.size or header[:len(MAGIC)] != MAGIC:
+        return None
+    return HEADER.unpack(header)[1]
+
+# Number of every (type, variant) pair, for comparing against whole index arrays at once
+def pair_keys(types, variants):
+    return (np.asarray(types, dtype=np.uint32) << 16) | np.asarray(variants, dtype=np.uint32)
+
+class MapFile:
+    # A binary map opened with mmap: nothing is read from disk (or decoded) until it is asked for, and the arrays it
+    # hands out are views straight into the file.
+    def __init__(self, path):
+        with open(path, 'rb') as f:
+            self.data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, self.tile_size, self.chunk_size, reserved = HEADER.unpack_from(self.data, 0)
+        if magic != MAGIC:
+            raise ValueError(path + ' is not a binary map file')
+        if version != VERSION:
+            raise ValueError(path + ' is map format version ' + str(version) + ', expected ' + str(VERSION))
+        offset = HEADER.size
+
+        # tile type names
+        count, = struct.unpack_from('<H', self.data, offset)
+        offset += 2
+        self.types = []
+        for i in range(count):
+            length = self.data[offset]
+            self.types.append(self.data[offset + 1:offset + 1 + length].decode('utf-8'))
+            offset += 1 + length
+
+        # chunk directory: (chunk x, chunk y) -> (encoding, data offset, data size)
+        count, = struct.unpack_from('<I', self.data, offset)
+        offset += 4
+        self.chunks = {}
+        self.chunk_locs = [] # in directory order, the grid index refers to chunks by their position in here
+        for i in range(count):
+            cx, cy, encoding, data_offset, size = CHUNK_ENTRY.unpack_from(self.data, offset)
+            self.chunks[(cx, cy)] = (encoding, data_offset, size)
+            self.chunk_locs.append((cx, cy))
+            offset += CHUNK_ENTRY.size
+
+        # off-grid tiles, then the indexes
+        self.offgrid, offset = self.read_array(OFFGRID_RECORD, offset)
+        self.grid_index, offset = self.read_array(GRID_INDEX_ENTRY, offset)
+        self.offgrid_index, offset = self.read_array(OFFGRID_INDEX_ENTRY, offset)
+        self.offgrid_order = np.frombuffer(self.data, dtype='<u4', count=len(self.offgrid), offset=offset)
+
+    # A count (u32) followed by that many items of dtype; returns the array and the offset just past it
+    def read_array(self, dtype, offset):
+        count, = struct.unpack_from('<I', self.data, offset)
+        array = np.frombuffer(self.data, dtype=dtype, count=count, offset=offset + 4)
+        return array, offset + 4 + array.nbytes
+
+    # Pair numbers (see pair_keys) of the (type name, variant) pairs in id_pairs that this map has any types for
+    def wanted_keys(self, id_pairs):
+        type_ids = {name: i for i, name in enumerate(self.types)}
+        return [int(pair_keys(type_ids[tile_type], variant)) for tile_type, variant in id_pairs if tile_type in type_ids]
+
+    # Locations of the chunks (in directory order) holding any tile whose (type, variant) is in id_pairs, or whose
+    # type is in tile_types
+    def chunks_with(self, id_pairs = (), tile_types = ()):
+        index = self.grid_index
+        match = np.isin(pair_keys(index['type'], index['variant']), self.wanted_keys(id_pairs))
+        type_ids = [i for i, name in enumerate(self.types) if name in tile_types]
+        if type_ids:
+            match |= np.isin(index['type'], type_ids)
+        return [self.chunk_locs[i] for i in np.unique(index['chunk'][match]).tolist()]
+
+    # The off-grid tiles whose (type, variant) is in id_pairs, by chunk: a list of ((chunk x, chunk y), record numbers)
+    def offgrid_groups(self, id_pairs):
+        index = self.offgrid_index
+        match = np.isin(pair_keys(index['type'], index['variant']), self.wanted_keys(id_pairs))
+        return [((cx, cy), self.offgrid_order[first:first + count])
+                for cx, cy, first, count in zip(index['cx'][match].tolist(), index['cy'][match].tolist(),
+                                                index['first'][match].tolist(), index['count'][match].tolist())]
+
+    # The type and variant arrays (CHUNK_SIZE x CHUNK_SIZE, indexed [y, x]) of a chunk
+    def chunk(self, loc):
+        encoding, offset, size = self.chunks[loc]
+        cells = self.chunk_size * self.chunk_size
+        if encoding == DENSE:
+            types = np.frombuffer(self.data, dtype='<u2', count=cells, offset=offset)
+            variants = np.frombuffer(self.data, dtype='<u2', count=cells, offset=offset + cells * 2)
+        else:
+            runs = np.frombuffer(self.data, dtype=RUN, count=size // RUN.itemsize, offset=offset)
+            types = np.repeat(runs['type'], runs['length'])
+            variants = np.repeat(runs['variant'], runs['length'])
+        return types.reshape(self.chunk_size, self.chunk_size), variants.reshape(self.chunk_size, self.chunk_size)
+
+    # The tiles of a chunk as the usual tile dictionaries, (x, y) -> tile
+    def chunk_tiles(self, loc):
+        types, variants = self.chunk(loc)
+        size = self.chunk_size
+        ys, xs = np.nonzero(types != EMPTY)
+        tiles = {}
+        for x, y, tile_type, variant in zip((xs + loc[0] * size).tolist(), (ys + loc[1] * size).tolist(),
+                                            types[ys, xs].tolist(), variants[ys, xs].tolist()):
+            tiles[(x, y)] = {'type': self.types[tile_type], 'variant': variant, 'pos': (x, y)}
+        return tiles
+
+    # The off-grid tiles (all of them, or just the given record numbers) as the usual tile dictionaries
+    def offgrid_tiles(self, ids = None):
+        records = self.offgrid if ids is None else self.offgrid[ids]
+        tiles = []
+        for tile_type, variant, x, y in records.tolist():
+            tiles.append({'type': self.types[tile_type], 'variant': variant, 'pos': [x, y]})
+        return tiles
+
+# Write a binary map from a grid ((x, y) -> tile dict), a list of off-grid tile dicts and the tile size
+def write_map(path, grid, offgrid, tile_size, chunk_size = CHUNK_SIZE):
+    types = sorted({tile['type'] for tile in grid.values()} | {tile['type'] for tile in offgrid})
+    type_ids = {name: i for i, name in enumerate(types)}
+
+    # sort the tiles into chunks
+    chunk_cells = {}
+    for (x, y), tile in grid.items():
+        cells = chunk_cells.get((x // chunk_size, y // chunk_size))
+        if cells is None:
+            cells = chunk_cells[(x // chunk_size, y // chunk_size)] = \
+                (np.full((chunk_size, chunk_size), EMPTY, dtype='<u2'), np.zeros((chunk_size, chunk_size), dtype='<u2'))
+        cells[0][y % chunk_size, x % chunk_size] = type_ids[tile['type']]
+        cells[1][y % chunk_size, x % chunk_size] = tile['variant']
+
+    # encode every chunk, whichever way is smaller
+    chunk_data = []
+    for loc in sorted(chunk_cells):
+        types_array, variants_array = (cells.ravel() for cells in chunk_cells[loc])
+        dense = types_array.tobytes() + variants_array.tobytes()
+        starts = np.flatnonzero(np.r_[True, (types_array[1:] != types_array[:-1]) | (variants_array[1:] != variants_array[:-1])])
+        runs = np.zeros(len(starts), dtype=RUN)
+        runs['length'] = np.diff(np.r_[starts, len(types_array)])
+        runs['type'] = types_array[starts]
+        runs['variant'] = variants_array[starts]
+        rle = runs.tobytes()
+        chunk_data.append((loc, RLE, rle) if len(rle) < len(dense) else (loc, DENSE, dense))
+
+    records = np.zeros(len(offgrid), dtype=OFFGRID_RECORD)
+    for i, tile in enumerate(offgrid):
+        records[i] = (type_ids[tile['type']], tile['variant'], tile['pos'][0], tile['pos'][1])
+
+    # grid index: how many tiles of each (type, variant) every chunk holds
+    grid_index = []
+    for i, (loc, encoding, data) in enumerate(chunk_data):
+        types_array, variants_array = chunk_cells[loc]
+        cells = types_array != EMPTY
+        keys, counts = np.unique(pair_keys(types_array[cells], variants_array[cells]), return_counts=True)
+        entries = np.zeros(len(keys), dtype=GRID_INDEX_ENTRY)
+        entries['chunk'] = i
+        entries['type'] = keys >> 16
+        entries['variant'] = keys & 0xFFFF
+        entries['count'] = counts
+        grid_index.append(entries)
+    grid_index = np.concatenate(grid_index) if grid_index else np.zeros(0, dtype=GRID_INDEX_ENTRY)
+
+    # offgrid index: the record numbers sorted by chunk, type and variant (and file order within each group)
+    chunk_px = chunk_size * tile_size
+    cxs = np.floor(records['x'] / chunk_px).astype(np.int32)
+    cys = np.floor(records['y'] / chunk_px).astype(np.int32)
+    order = np.lexsort((np.arange(len(records)), records['variant'], records['type'], cys, cxs)).astype('<u4')
+    groups = np.stack((cxs[order], cys[order], records['type'][order], records['variant'][order]))
+    starts = np.flatnonzero(np.r_[True, (groups[:, 1:] != groups[:, :-1]).any(axis=0)]) if len(order) else np.zeros(0, dtype=int)
+    offgrid_index = np.zeros(len(starts), dtype=OFFGRID_INDEX_ENTRY)
+    offgrid_index['cx'] = cxs[order][starts]
+    offgrid_index['cy'] = cys[order][starts]
+    offgrid_index['type'] = records['type'][order][starts]
+    offgrid_index['variant'] = records['variant'][order][starts]
+    offgrid_index['first'] = starts
+    offgrid_index['count'] = np.diff(np.r_[starts, len(order)])
+
+    strings = struct.pack('<H', len(types))
+    for name in types:
+        encoded = name.encode('utf-8')
+        strings += struct.pack('<B', len(encoded)) + encoded
+    offset = HEADER.size + len(strings) + 4 + CHUNK_ENTRY.size * len(chunk_data) + 4 + records.nbytes + \
+             4 + grid_index.nbytes + 4 + offgrid_index.nbytes + order.nbytes
+
+    directory = struct.pack('<I', len(chunk_data))
+    for loc, encoding, data in chunk_data:
+        directory += CHUNK_ENTRY.pack(loc[0], loc[1], encoding, offset, len(data))
+        offset += len(data)
+
+    with open(path, 'wb') as f:
+        f.write(HEADER.pack(MAGIC, VERSION, tile_size, chunk_size, 0))
+        f.write(strings)
+        f.write(directory)
+        f.write(struct.pack('<I', len(records)))
+        f.write(records.tobytes())
+        f.write(struct.pack('<I', len(grid_index)))
+        f.write(grid_index.tobytes())
+        f.write(struct.pack('<I', len(offgrid_index)))
+        f.write(offgrid_index.tobytes())
+        f.write(order.tobytes())
+        for loc, encoding, data in chunk_data:
+            f.write(data)
+
+# Convert a json map file into a binary one
+def convert(json_path, map_path):
+    with open(json_path, 'r') as f:
+        map_data = json.load(f)
+    grid = {}
+    for loc, tile in map_data['tilemap'].items():
+        x, y = loc.split(';')
+        grid[(int(x), int(y))] = tile
+    write_map(map_path, grid, map_data['offgrid'], map_data['tile_size'])
+
+# Where the binary version of a json map is kept in the cache
+def cache_path(json_path, cache_dir = CACHE_DIR):
+    return cache_dir + os.path.normpath(json_path).replace(os.sep, '_') + '.map' # data/maps/0.json -> data_maps_0.json.map
+
+# Path of an up to date binary version of a json map, converting it into the cache first if needed (also when the
+# cached copy was written by an older version of the format). Falls back to the json file itself if the cache can't
+# be written.
+def cached_map(json_path, cache_dir = CACHE_DIR):
+    map_path = cache_path(json_path, cache_dir)
+    try:
+        if not os.path.exists(map_path) or os.path.getmtime(map_path) < os.path.getmtime(json_path) \
+                or map_version(map_path) != VERSION:
+            os.makedirs(cache_dir, exist_ok=True)
+            convert(json_path, map_path + '.tmp')
+            os.replace(map_path + '.tmp', map_path) # never leave a half written map behind
+    except OSError:
+        return json_path
+    return map_path
+
+if __name__ == '__main__':
+    # Convert json maps to binary maps:  python -m scripts.mapfile data/maps/*.json map.json [-o folder]
+    # By default they go in the cache (where the game looks for them), never next to the json files in the level folder
+    parser = argparse.ArgumentParser(prog = 'python -m scripts.mapfile', description = 'Convert json maps to binary maps.')
+    parser.add_argument('maps', nargs = '+', help = 'json maps to convert')
+    parser.add_argument('-o', '--output', metavar = 'FOLDER', help = 'write the .map files here (default: the cache, %s)' % CACHE_DIR)
+    args = parser.parse_args()
+
+    os.makedirs(args.output or CACHE_DIR, exist_ok=True)
+    for json_path in args.maps:
+        if args.output:
+            map_path = os.path.join(args.output, os.path.splitext(os.path.basename(json_path))[0] + '.map')
+        else:
+            map_path = cache_path(json_path)
+        convert(json_path, map_path)
+        print(json_path, '->', map_path, '(%d -> %d bytes)' % (os.path.getsize(json_path), os.path.getsize(map_path)))
@@ -0,0 +1,96 @@
+import weakref
+
+import pygame
+
+from scripts.utils import Animation
+
+OUTLINE_OFFSETS = [(1,0), (-1,0), (0,-1), (0,1)] # the silhouette is drawn shifted 1 pixel in each direction
+OUTLINE_COLOR = (0, 0, 0, 180)
+
+class OutlineRenderer:
+    # Draws the dark "outline" around everything in the game graphics display. There are two ways of doing it:
+    #
+    #  - 'mask':   the original approach, build a mask of the whole display every frame, turn it into a silhouette and
+    #              blit it 4 times (cost grows with the display size, no matter how much is on screen)
+    #  - 'cached': every image that gets drawn (animation frames, tiles, tilemap chunks...) has its outline worked out
+    #              once, with the 4 shifted silhouettes already combined into one surface. Each frame the images are
+    #              queued with add() as they are drawn and their outlines are composited with a single blits() call.
+    #
+    # Both give the same picture (except for a slightly darker outline where two separately drawn images overlap),
+    # mode can be switched at any time to compare frame times.
+    def __init__(self, render_targets, mode = 'cached'):
+        self.render_targets = render_targets # for the scratch surfaces (see scripts/render_targets.py)
+        self.mode = mode
+        self.outlines = weakref.WeakKeyDictionary() # image -> outline surface (chunks come and go, so don't keep them alive)
+        self.flipped = weakref.WeakKeyDictionary() # image -> horizontally flipped outline surface
+        self.queue = [] # (outline surface, position) pairs for this frame
+
+    def toggle(self):
+        self.mode = 'mask' if self.mode == 'cached' else 'cached'
+
+    # Build the outlines of the named assets up front (images, lists of images and animations). Only the assets that
+    # are drawn one by one with an outline need this: tiles are drawn through the tilemap's chunks (whose outlines are
+    # made when the chunk is), and the background, clouds and particles get no outline at all. Anything missed here
+    # still gets its outline the first time it is drawn.
+    def prepare(self, assets, names):
+        for name in names:
+            asset = assets[name]
+            if isinstance(asset, Animation):
+                for img in asset.images:
+                    self.outline(img, flip = True) # entities face both ways
+                asset = asset.images
+            for img in (asset if isinstance(asset, list) else [asset]):
+                self.outline(img)
+
+    # The outline of an image: 2 pixels bigger than the image, to be drawn 1 pixel up and left of it
+    def outline(self, img, flip = False):
+        cache = self.flipped if flip else self.outlines
+        if img in cache:
+            return cache[img]
+        if flip:
+            # the offsets are symmetric, so the outline of a flipped image is just the flipped outline
+            surf = pygame.transform.flip(self.outline(img), True, False)
+        else:
+            silhouette = pygame.mask.from_surface(img).to_surface(setcolor=OUTLINE_COLOR, unsetcolor=(0,0,0,0))
+            surf = pygame.Surface((img.get_width() + 2, img.get_height() + 2), pygame.SRCALPHA)
+            for offset in OUTLINE_OFFSETS:
+                surf.blit(silhouette, (1 + offset[0], 1 + offset[1]))
+        cache[img] = surf
+        return surf
+
+    # Start a new frame
+    def begin(self):
+        self.queue = []
+
+    # Queue the outline of an image drawn at pos (only used in 'cached' mode)
+    def add(self, img, pos, flip = False):
+        if self.mode == 'cached':
+            self.queue.append((self.outline(img, flip), (int(pos[0]) - 1, int(pos[1]) - 1))) # blit() truncates positions too
+
+    # Queue the outline of the same image drawn at many positions
+    def add_many(self, img, positions):
+        if self.mode == 'cached':
+            outline = self.outline(img)
+            self.queue.extend((outline, (int(pos[0]) - 1, int(pos[1]) - 1)) for pos in positions)
+
+    # Queue the outline of something that isn't an image (like the spark polygons): draw(surf, shift) is called to draw
+    # it in OUTLINE_COLOR once per outline offset, onto a transparent layer the size of the display
+    def add_drawn(self, draw, size):
+        if self.mode == 'cached':
+            layer = self.render_targets.target('outline_layer', size, pygame.SRCALPHA)
+            layer.fill((0,0,0,0))
+            for offset in OUTLINE_OFFSETS:
+                draw(layer, offset)
+            self.queue.append((layer, (0, 0)))
+
+    # Draw the outlines of everything drawn on display this frame onto dest
+    def render(self, display, dest):
+        if self.mode == 'cached':
+            dest.blits(self.queue, doreturn=False)
+        else:
+            # this logic generates a surface with black "sillhouettes" everywhere we rendered graphics onto display
+            display_mask = pygame.mask.from_surface(display) # create a mask from the display
+            display_sillhouette = self.render_targets.target('sillhouette', display.get_size(), pygame.SRCALPHA)
+            display_mask.to_surface(display_sillhouette, setcolor=OUTLINE_COLOR, unsetcolor=(0,0,0,0)) # turn the mask into a surface
+            for offset in OUTLINE_OFFSETS:
+                dest.blit(display_sillhouette, offset) # render the sillhouette onto the game graphics display
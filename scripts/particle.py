@@ -1,29 +1,76 @@
-class Particle:
-    def __init__(self, game, p_type, pos, velocity = [0,0], frame = 0):
+import numpy as np
+
+from scripts.pool import ArrayPool
+
+class ParticleSystem(ArrayPool):
+    # Keeps every live particle in NumPy arrays (position, velocity, animation frame and type) instead of one object
+    # each, so the whole population moves, animates and dies in a few vectorized operations.
+    #
+    # The arrays have room for `capacity` particles and never grow (see scripts/pool.py): the slots of dead particles go
+    # back on the free list at the end of every update, and particles spawned while every slot is taken are dropped.
+    FIELDS = {'pos': ((2,), np.float64), 'velocity': ((2,), np.float64), 'frame': ((), np.int32), 'kind': ((), np.int8)}
+
+    def __init__(self, game, p_types = ('leaf', 'particle'), capacity = 1024):
         self.game = game
-        self.type = p_type
-        self.pos = list(pos)
-        self.velocity = list(velocity)
-        self.animation = self.game.assets['particle/' + p_type].copy()
-        self.animation.frame = frame
+        self.types = list(p_types)
+        self.type_ids = {p_type: i for i, p_type in enumerate(self.types)}
+        animations = [self.game.assets['particle/' + p_type] for p_type in self.types]
+
+        # Per-type animation data, indexed by the type number stored in self.kind (the particles' frame counters are
+        # their animation playheads)
+        self.last_frame = np.array([anim.length - 1 for anim in animations], dtype=np.int32)
+        self.first_frame = np.cumsum([0] + [anim.length for anim in animations[:-1]]).astype(np.int32)
+        first_image = np.cumsum([0] + [len(anim.images) for anim in animations[:-1]])
+        # The frame -> image lookup tables of all the types joined together, pointing into one flat list of images
+        # (plus their half sizes, to center them on render)
+        self.frame_image = np.concatenate([np.array(anim.frame_index) + first for anim, first in zip(animations, first_image)]).astype(np.int32)
+        self.images = [img for anim in animations for img in anim.images]
+        self.half_size = np.array([(img.get_width() / 2, img.get_height() / 2) for img in self.images])
+
+        self.leaf = self.type_ids.get('leaf', -1)
+
+        super().__init__(capacity)
+
+    # Returns whether it was spawned (False: every slot was taken and it was dropped)
+    def spawn(self, p_type, pos, velocity = (0, 0), frame = 0):
+        i = self.acquire()
+        if i < 0:
+            return False
+        self.pos[i] = pos
+        self.velocity[i] = velocity
+        self.frame[i] = frame
+        self.kind[i] = self.type_ids[p_type]
+        return True
 
     def update(self):
+        if not self.count:
+            return
+        top = self.top
+        pos = self.pos[:top]
+        frame = self.frame[:top]
+        kind = self.kind[:top]
+        last_frame = self.last_frame[kind]
+
+        # a particle dies on the update after its (non-looping) animation reached the last frame
+        dead = frame >= last_frame
 
-        # logic for detecting end of particle life
-        kill = False
-        if self.animation.done:
-            kill = True
+        # move particles and advance their animations (free slots below top get moved too, nobody looks at them)
+        pos += self.velocity[:top]
+        np.minimum(frame + 1, last_frame, out=frame)
 
-        # move particle
-        self.pos[0] += self.velocity[0]
-        self.pos[1] += self.velocity[1]
+        # leaves sway from side to side as they fall
+        if self.leaf >= 0:
+            leaves = kind == self.leaf
+            pos[leaves, 0] += np.sin(frame[leaves] * 0.035) * 0.3
 
-        # update animation
-        self.animation.update()
+        self.kill(dead)
 
-        return kill
-    
-    def render(self, surf, offset = (0,0)):
-        img = self.animation.img()
-        surf.blit(img, (self.pos[0] - offset[0] - img.get_width()/2, self.pos[1] - offset[1] - img.get_height()/2))
-              
\ No newline at end of file
+    def render(self, surf, offset = (0, 0)):
+        if not self.count:
+            return
+        slots = self.live()
+        kind = self.kind[slots]
+        image = self.frame_image[self.first_frame[kind] + self.frame[slots]]
+        corner = self.pos[slots] - offset - self.half_size[image] # center each image on its particle
+        images = self.images
+        surf.blits([(images[i], xy) for i, xy in zip(image.tolist(), corner.tolist())], doreturn=False)
@@ -0,0 +1,83 @@
+import heapq
+
+import numpy as np
+
+class ArrayPool:
+    # Fixed-capacity storage for lots of short-lived objects (particles, sparks, projectiles) kept in NumPy arrays: one
+    # array per field, one slot per object. Subclasses list their fields in FIELDS and get an array for each.
+    #
+    # The arrays are allocated up front. Free slots are kept on a free list: acquire() takes the lowest free slot for a
+    # new object and kill() hands slots back for reuse. What happens when every slot is in use depends on `grow`:
+    #  - grow = False: the new object is dropped (and counted in stats()), for things that are only for show
+    #    (particles, sparks), so a huge burst can't grow memory without bound
+    #  - grow = True: the arrays double in size, for things the game logic depends on (projectiles), which must never
+    #    silently disappear
+    #
+    # Taking the lowest free slot keeps the live objects packed near the front: every slot at or past `top` is free, so
+    # the vectorized updates only look at [0, top), with `alive` marking which of those slots are in use.
+    FIELDS = {} # field name -> (shape of one object's value, dtype)
+
+    def __init__(self, capacity, grow = False):
+        self.capacity = capacity
+        self.grow = grow
+        for name, (shape, dtype) in self.FIELDS.items():
+            setattr(self, name, np.zeros((capacity,) + shape, dtype=dtype))
+        self.alive = np.zeros(capacity, dtype=bool)
+        self.high_water = 0 # most live at the same time, useful to pick a good capacity
+        self.dropped = 0 # objects that didn't fit
+        self.clear()
+
+    def __len__(self):
+        return self.count
+
+    def clear(self):
+        self.alive[:] = False
+        self.free = list(range(self.capacity)) # a heap of the free slots (a sorted list already is one)
+        self.count = 0
+        self.top = 0
+
+    def stats(self):
+        return {'capacity': self.capacity, 'in_use': self.count, 'high_water': self.high_water, 'dropped': self.dropped}
+
+    # Make room for more objects (the live ones keep their slots)
+    def resize(self, capacity):
+        for name in list(self.FIELDS) + ['alive']:
+            old = getattr(self, name)
+            new = np.zeros((capacity,) + old.shape[1:], dtype=old.dtype)
+            new[:self.capacity] = old
+            setattr(self, name, new)
+        self.free.extend(range(self.capacity, capacity)) # all bigger than the free slots already there, so still a heap
+        self.capacity = capacity
+
+    # Take a free slot for a new object; returns its index, or -1 if the pool is full and the object has to be dropped
+    def acquire(self):
+        if not self.free:
+            if not self.grow:
+                self.dropped += 1
+                return -1
+            self.resize(self.capacity * 2)
+        i = heapq.heappop(self.free)
+        self.alive[i] = True
+        self.count += 1
+        if i >= self.top:
+            self.top = i + 1
+        if self.count > self.high_water:
+            self.high_water = self.count
+        return i
+
+    # Free every live slot flagged in a boolean mask over the slots [0, top)
+    def kill(self, dead):
+        alive = self.alive[:self.top]
+        slots = np.flatnonzero(dead & alive)
+        if not len(slots):
+            return
+        alive[slots] = False
+        self.count -= len(slots)
+        for i in slots.tolist():
+            heapq.heappush(self.free, i)
+        live = np.flatnonzero(alive)
+        self.top = int(live[-1]) + 1 if len(live) else 0
+
+    # Indexes of the live slots, in slot order
+    def live(self):
+        return np.flatnonzero(self.alive[:self.top])
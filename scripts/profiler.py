@@ -0,0 +1,158 @@
+import csv
+import json
+import time
+from array import array
+
+import numpy as np
+import pygame
+
+WINDOW = 300 # the overlay's percentiles are over this many of the latest frames (5 seconds at 60 FPS)
+OVERLAY_REFRESH = 30 # frames between redraws of the overlay text (rendering it every frame would show up in the profile)
+
+class NullScope:
+    # What scope() hands out while the profiler is off: entering and leaving it does nothing at all
+    def __enter__(self):
+        pass
+
+    def __exit__(self, *exc):
+        pass
+
+NULL_SCOPE = NullScope()
+
+class Scope:
+    # Adds the time spent inside a `with` block to its name's total for the current frame
+    __slots__ = ('totals', 'name', 'start')
+
+    def __init__(self, totals, name):
+        self.totals = totals
+        self.name = name
+        self.start = 0
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+
+    def __exit__(self, *exc):
+        self.totals[self.name] += time.perf_counter() - self.start
+
+class Profiler:
+    # Frame time instrumentation. Stages of the frame are wrapped in named scopes:
+    #
+    #     with profiler.scope('draw tilemap'):
+    #         ...
+    #
+    # and end_frame() closes every frame, storing how long each scope took in it (the same scope may run several
+    # times in a frame, e.g. one simulation step per scope, the times add up) along with any counts (number of
+    # particles...) given to count(). 'frame' is the time from one end_frame() to the next.
+    #
+    # While it is off, scope() returns a shared do-nothing scope and count() / end_frame() return straight away, so
+    # the instrumentation can stay in place for good.
+    def __init__(self, enabled = False, window = WINDOW):
+        self.enabled = enabled
+        self.window = window
+        self.scopes = {} # name -> Scope
+        self.totals = {} # name -> seconds spent in that scope so far this frame
+        self.counts = {} # name -> latest count this frame
+        self.times = {} # name -> array of milliseconds per frame
+        self.count_history = {} # name -> array of counts per frame
+        self.frames = 0
+        self.last_frame = None # perf_counter() at the end of the previous frame
+        self.overlay = None # cached overlay surface
+        self.font = None
+
+    def toggle(self):
+        self.enabled = not self.enabled
+        self.last_frame = None # the time it was off is not a frame
+
+    def scope(self, name):
+        if not self.enabled:
+            return NULL_SCOPE
+        scope = self.scopes.get(name)
+        if scope is None:
+            scope = self.scopes[name] = Scope(self.totals, name)
+            self.totals[name] = 0.0
+        return scope
+
+    def count(self, name, value):
+        if self.enabled:
+            self.counts[name] = value
+
+    # Append a value to a named series, padding series that first show up late with zeros so every series has one
+    # value per frame
+    def add(self, series, name, value):
+        if name not in series:
+            series[name] = array('d', bytes(8 * self.frames))
+        series[name].append(value)
+
+    def end_frame(self):
+        if not self.enabled:
+            return
+        now = time.perf_counter()
+        if self.last_frame is not None:
+            self.add(self.times, 'frame', (now - self.last_frame) * 1000)
+        self.last_frame = now
+        for name, total in self.totals.items():
+            self.add(self.times, name, total * 1000)
+            self.totals[name] = 0.0
+        for name, value in self.counts.items():
+            self.add(self.count_history, name, value)
+        self.frames += 1
+        for series in (self.times, self.count_history): # anything that didn't happen this frame gets a zero
+            for values in series.values():
+                if len(values) < self.frames:
+                    values.append(0.0)
+
+    # mean, p50, p95, p99 and max of a series (over the latest `window` frames, or all of them)
+    def stats(self, values, window = None):
+        values = np.frombuffer(values, dtype=np.float64)
+        if window:
+            values = values[-window:]
+        if not len(values):
+            return {'mean': 0.0, 'p50': 0.0, 'p95': 0.0, 'p99': 0.0, 'max': 0.0}
+        p50, p95, p99 = np.percentile(values, [50, 95, 99]).tolist()
+        return {'mean': float(values.mean()), 'p50': p50, 'p95': p95, 'p99': p99, 'max': float(values.max())}
+
+    # Stats of every scope (in milliseconds) and count, over the whole run or the latest `window` frames
+    def summary(self, window = None):
+        return {'frames': self.frames,
+                'times': {name: self.stats(values, window) for name, values in self.times.items()},
+                'counts': {name: self.stats(values, window) for name, values in self.count_history.items()}}
+
+    # Write the summary (.json) or every frame's numbers (.csv, one column per scope / count)
+    def dump(self, path):
+        if path.endswith('.csv'):
+            names = list(self.times) + list(self.count_history)
+            columns = [self.times[name] for name in self.times] + [self.count_history[name] for name in self.count_history]
+            with open(path, 'w', newline='') as f:
+                writer = csv.writer(f)
+                writer.writerow(['frame'] + [name if name in self.count_history else name + ' (ms)' for name in names])
+                for i in range(self.frames):
+                    writer.writerow([i] + ['%.4g' % column[i] for column in columns])
+        else:
+            with open(path, 'w') as f:
+                json.dump(self.summary(), f, indent=2)
+
+    # Draw the latest stats in the top left corner of surf
+    def render(self, surf):
+        if self.overlay is None or self.frames % OVERLAY_REFRESH == 0:
+            if self.font is None:
+                self.font = pygame.font.Font(None, 24) # pygame's built in font, so nothing has to be loaded for it
+            summary = self.summary(self.window)
+            rows = [('ms', 'p50', 'p95', 'p99')]
+            for name, stats in summary['times'].items():
+                rows.append((name, '%.2f' % stats['p50'], '%.2f' % stats['p95'], '%.2f' % stats['p99']))
+            for name in summary['counts']:
+                rows.append((name, '%d' % self.count_history[name][-1], '', ''))
+
+            # the names are left aligned, the numbers right aligned in columns
+            cells = [[self.font.render(text, True, (255, 255, 255)) for text in row] for row in rows]
+            widths = [max(row[i].get_width() for row in cells) + 12 for i in range(4)]
+            line_height = self.font.get_linesize()
+            self.overlay = pygame.Surface((sum(widths) + 6, line_height * len(rows) + 12), pygame.SRCALPHA)
+            self.overlay.fill((0, 0, 0, 160))
+            for i, row in enumerate(cells):
+                self.overlay.blit(row[0], (6, 6 + i * line_height))
+                x = widths[0]
+                for width, cell in zip(widths[1:], row[1:]):
+                    x += width
+                    self.overlay.blit(cell, (x - cell.get_width(), 6 + i * line_height))
+        surf.blit(self.overlay, (0, 0))
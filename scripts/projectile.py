@@ -0,0 +1,86 @@
+import numpy as np
+
+from scripts.pool import ArrayPool
+
+class ProjectileSystem(ArrayPool):
+    # Stores every enemy bullet in NumPy arrays (position, horizontal velocity, age and who fired it) and steps them all at once.
+    #
+    # Wall hits are looked up in the tilemap's solidity bitmap for all projectiles in one go, and hits against entities
+    # go through the game's uniform grid broadphase: projectiles are bucketed by grid cell, and each bucket is only
+    # tested against the targets (the entities it can hit) registered in that same cell.
+    # Like the other array systems it keeps its projectiles in pool slots (see scripts/pool.py), but projectiles are part
+    # of the game logic, so instead of dropping new ones when it is full it grows. The masks passed in and out of it are
+    # over its slots [0, top).
+    FIELDS = {'pos': ((2,), np.float64), 'velocity': ((), np.float64), 'timer': ((), np.int32), 'owner': ((), np.int32)}
+
+    def __init__(self, capacity = 256):
+        super().__init__(capacity, grow = True)
+
+    # owner: number of the enemy that fired it (see Enemy.number), -1 if nobody in particular. Returns whether the
+    # projectile was spawned (always, as this pool grows, but callers shouldn't count on it)
+    def spawn(self, pos, velocity, owner = -1):
+        i = self.acquire()
+        if i < 0:
+            return False
+        self.pos[i] = pos
+        self.velocity[i] = velocity
+        self.timer[i] = 0
+        self.owner[i] = owner
+        return True
+
+    # Move every projectile and age it by one frame
+    def update(self):
+        top = self.top
+        self.pos[:top, 0] += self.velocity[:top]
+        self.timer[:top] += 1
+
+    def render(self, surf, img, offset = (0, 0), outlines = None):
+        if not self.count:
+            return
+        corner = self.pos[self.live()] - offset - (img.get_width() / 2, img.get_height() / 2) # center the image on each projectile
+        surf.blits([(img, xy) for xy in corner.tolist()], doreturn=False)
+        if outlines:
+            outlines.add_many(img, corner.tolist())
+
+    # Boolean mask of the projectiles currently inside a solid tile
+    def in_walls(self, tilemap):
+        cells = np.floor(self.pos[:self.top] / tilemap.tile_size).astype(np.int64)
+        return tilemap.solid.is_solid_many(cells[:, 0], cells[:, 1]) & self.alive[:self.top]
+
+    # Find projectiles inside the targets (entities registered in a SpatialHash broadphase, see scripts/spatial.py).
+    # Only the grid cells that actually hold projectiles are visited, and the other entities in them are never tested.
+    # Returns a list of (projectile slot, target) pairs ordered by slot. Projectiles flagged in `ignore` are skipped.
+    def hits(self, grid, targets, ignore = None):
+        target_ids = {id(target) for target in targets if id(target) in grid.items}
+        if not self.count or not target_ids:
+            return []
+        slots = self.live()
+        n = len(slots)
+
+        # bucket the projectiles by grid cell
+        cells = np.floor(self.pos[slots] / grid.cell_size).astype(np.int64)
+        keys = (cells[:, 0] << 32) + (cells[:, 1] + (1 << 31))
+        order = np.argsort(keys, kind='stable')
+        sorted_keys = keys[order]
+        starts = np.flatnonzero(np.r_[True, sorted_keys[1:] != sorted_keys[:-1]])
+        ends = np.r_[starts[1:], n]
+
+        found = []
+        for start, end in zip(starts.tolist(), ends.tolist()):
+            first = order[start]
+            cell = (int(cells[first, 0]), int(cells[first, 1]))
+            entity_ids = [entity_id for entity_id in grid.cells.get(cell, ()) if entity_id in target_ids]
+            if not entity_ids:
+                continue
+            candidates = slots[order[start:end]]
+            pos = self.pos[candidates]
+            for entity_id in entity_ids:
+                entry = grid.items[entity_id]
+                x, y, w, h = entry[2]
+                # narrowphase: same test as pygame.Rect.collidepoint
+                inside = (pos[:, 0] >= x) & (pos[:, 0] < x + w) & (pos[:, 1] >= y) & (pos[:, 1] < y + h)
+                if ignore is not None:
+                    inside &= ~ignore[candidates]
+                found.extend((i, entry[1]) for i in candidates[inside].tolist())
+        found.sort(key = lambda hit: hit[0])
+        return found
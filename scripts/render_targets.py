@@ -0,0 +1,39 @@
+import pygame
+
+class RenderTargets:
+    # Keeps the surfaces the renderer needs every frame around instead of creating them again and again:
+    #
+    #  - scaled copies of static images (like the backgrounds), scaled once per size and then reused
+    #  - persistent "render target" surfaces (scratch surfaces that are redrawn every frame, like the transition circle)
+    #  - the final upscale of the game graphics onto the screen, done straight into an existing surface
+    #
+    # Everything is keyed by size, so switching resolution just builds new ones the first time they are needed.
+    def __init__(self):
+        self.scaled = {} # (name, size) -> scaled surface
+        self.targets = {} # name -> surface
+
+    # A copy of img scaled to size, only scaled the first time it is asked for at that size
+    def scaled_image(self, name, img, size):
+        key = (name, tuple(size))
+        if key not in self.scaled:
+            self.scaled[key] = pygame.transform.scale(img, size)
+        return self.scaled[key]
+
+    # A persistent surface with the given name (recreated only if the size or flags change); its old contents are
+    # left in place, so callers clear or overwrite it themselves
+    def target(self, name, size, flags = 0):
+        surf = self.targets.get(name)
+        if surf is None or surf.get_size() != tuple(size) or surf.get_flags() & pygame.SRCALPHA != flags & pygame.SRCALPHA:
+            surf = pygame.Surface(size, flags)
+            self.targets[name] = surf
+        return surf
+
+    # Scale src up to fill dest, writing into dest's pixels instead of allocating a new full screen surface every frame.
+    # With an offset (screen shake) the scaled image goes into a persistent target first and is then blitted shifted.
+    def upscale(self, src, dest, offset = (0, 0)):
+        if not offset[0] and not offset[1]:
+            pygame.transform.scale(src, dest.get_size(), dest)
+        else:
+            scaled = self.target('upscale', dest.get_size())
+            pygame.transform.scale(src, dest.get_size(), scaled)
+            dest.blit(scaled, offset)
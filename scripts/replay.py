@@ -0,0 +1,76 @@
+import struct
+import sys
+import time
+
+from scripts.simulation import Simulation
+
+# Input log format (little endian), everything needed to play a session of the game again exactly:
+#
+#   header   magic b'NJIN', version (u16), level (u16), seed (u64), number of steps (u32)
+#   steps    one byte per simulation step, the inputs of that step as bits: LEFT / RIGHT (held down) and
+#            JUMP / DASH (pressed)
+#
+# The simulation only ever gets its randomness from its seeded random generator (see Simulation), so the same seed
+# and the same inputs always give the same game. An hour of play is about 200 KB.
+
+MAGIC = b'NJIN'
+VERSION = 1
+HEADER = struct.Struct('<4sHHQI')
+
+LEFT = 1
+RIGHT = 2
+JUMP = 4
+DASH = 8
+
+class InputLog:
+    def __init__(self, seed = 0, level = 0, steps = b''):
+        self.seed = seed
+        self.level = level
+        self.steps = bytearray(steps)
+
+    def __len__(self):
+        return len(self.steps)
+
+    # Add the inputs of one step (movement is the [left, right] keys held down)
+    def record(self, movement, jump, dash):
+        self.steps.append((LEFT if movement[0] else 0) | (RIGHT if movement[1] else 0) | (JUMP if jump else 0) | (DASH if dash else 0))
+
+    # The inputs of step i: ([left, right], jump, dash)
+    def inputs(self, i):
+        bits = self.steps[i]
+        return [bool(bits & LEFT), bool(bits & RIGHT)], bool(bits & JUMP), bool(bits & DASH)
+
+    def save(self, path):
+        with open(path, 'wb') as f:
+            f.write(HEADER.pack(MAGIC, VERSION, self.level, self.seed, len(self.steps)))
+            f.write(self.steps)
+
+def load_log(path):
+    with open(path, 'rb') as f:
+        data = f.read()
+    magic, version, level, seed, count = HEADER.unpack_from(data, 0)
+    if magic != MAGIC:
+        raise ValueError(path + ' is not an input log')
+    if version != VERSION:
+        raise ValueError(path + ' is input log version ' + str(version) + ', expected ' + str(VERSION))
+    return InputLog(seed, level, data[HEADER.size:HEADER.size + count])
+
+# Drive a simulation with the inputs of a log, one step per logged step. sim has to be set up with the log's seed and
+# level (a new headless Simulation is made if there is none); returns it.
+def replay(log, sim = None):
+    if sim is None:
+        sim = Simulation(level = log.level, seed = log.seed)
+    for i in range(len(log)):
+        sim.movement, jump, dash = log.inputs(i)
+        sim.step(jump, dash)
+    return sim
+
+if __name__ == '__main__':
+    # Play a recorded session (python game.py --record session.log) headless, as fast as possible:
+    #   python -m scripts.replay session.log
+    log = load_log(sys.argv[1])
+    start = time.perf_counter()
+    sim = replay(log)
+    elapsed = max(time.perf_counter() - start, 1e-9)
+    print('%d steps at %.0f steps/s, ended on level %d with %d enemies left, player at (%.1f, %.1f)'
+          % (len(log), len(log) / elapsed, sim.level, len(sim.enemies), sim.player.pos[0], sim.player.pos[1]))
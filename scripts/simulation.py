@@ -0,0 +1,366 @@
+import os
+import time
+import random
+import pygame
+from scripts.entities import Player, Enemy
+from scripts.utils import load_image, load_images, Animation
+from scripts.tilemap import Tilemap
+from scripts.mapfile import cached_map
+from scripts.particle import ParticleSystem
+from scripts.spark import SparkSystem
+from scripts.projectile import ProjectileSystem
+from scripts.spatial import SpatialHash
+from scripts.profiler import Profiler
+import math
+
+FPS = 60 # the game logic always advances in fixed steps of 1/FPS seconds
+MAP_DIR = 'data/maps/'
+STREAM_MIN_CHUNKS = 1024 # levels with more (binary map) chunks than this are streamed around the camera, see Tilemap.stream
+
+# Number of levels: the json maps in MAP_DIR (other files in there, like converted .map files, aren't levels)
+def level_count():
+    return len([name for name in os.listdir(MAP_DIR) if name.endswith('.json')])
+
+# How to load each of the game assets (needs a display mode to be set, for convert()). Every asset is loaded on its own,
+# so the game can hand them to its loader threads as separate jobs (see scripts/loader.py)
+ASSET_LOADERS = {
+    'decor': lambda: load_images('tiles/decor'),
+    'grass': lambda: load_images('tiles/grass'),
+    'large_decor': lambda: load_images('tiles/large_decor'),
+    'stone': lambda: load_images('tiles/stone'),
+    'player': lambda: load_image('entities/player.png'),
+    'background': lambda: load_image('background.png'),
+    'clouds': lambda: load_images('clouds'),
+    'enemy/idle': lambda: Animation(load_images('entities/enemy/idle'),img_dur = 6),
+    'enemy/run': lambda: Animation(load_images('entities/enemy/run'),img_dur = 4),
+    'player/idle': lambda: Animation(load_images('entities/player/idle'),img_dur = 6),
+    'player/run': lambda: Animation(load_images('entities/player/run'),img_dur = 4),
+    'player/jump': lambda: Animation(load_images('entities/player/jump')),
+    'player/slide': lambda: Animation(load_images('entities/player/slide')),
+    'player/wall_slide': lambda: Animation(load_images('entities/player/wall_slide')),
+    'particle/leaf': lambda: Animation(load_images('particles/leaf'), img_dur = 20, loop=False),
+    'particle/particle': lambda: Animation(load_images('particles/particle'), img_dur = 6, loop=False),
+    'gun': lambda: load_image('gun.png'),
+    'projectile': lambda: load_image('projectile.png'),
+    'gun/flipped': lambda: pygame.transform.flip(load_image('gun.png'), True, False), # flipped once here for enemies facing left
+}
+
+# Create a Dictionary containing all the game assets, one after the other
+def load_assets():
+    return {name: load() for name, load in ASSET_LOADERS.items()}
+
+# Set pygame up without a real window or audio device (SDL's dummy drivers), for running the simulation on servers / CI
+def init_headless():
+    os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+    os.environ.setdefault('SDL_AUDIODRIVER', 'dummy')
+    pygame.display.init()
+    if not pygame.display.get_surface():
+        pygame.display.set_mode((1, 1)) # image.convert() needs a display mode, even a 1x1 one
+
+class SilentSound:
+    # Stands in for a pygame.mixer.Sound when there is no audio
+    def play(self, *args, **kwargs):
+        pass
+
+    def set_volume(self, volume):
+        pass
+
+SFX_NAMES = ('jump', 'dash', 'hit', 'shoot', 'ambience')
+
+# Starting number of slots of the short-lived object pools (see scripts/pool.py). Particles and sparks are only for
+# show: once every slot is taken, new ones are dropped (counted in pool_stats()), which keeps a huge fight from eating
+# memory. These are sized for tens of thousands of live particles (a death burst is 30 particles and 90 sparks) and
+# can be changed per Simulation with `capacities`. Projectiles are game logic, they are never dropped: their pool grows.
+CAPACITIES = {'particles': 32768, 'sparks': 16384, 'projectiles': 256}
+
+PROJECTILE_LIFETIME = 360 # frames before a projectile expires (6 seconds)
+SHOT_RANGE = 5 * PROJECTILE_LIFETIME # how far a projectile flies (5 px per frame) before it expires: enemies don't shoot at a player farther away
+
+class Simulation:
+    # The game's state and logic (player, enemies, projectiles, sparks and particles) without any rendering or sound.
+    #
+    # step() advances everything by exactly one fixed timestep (one frame at 60 FPS), so it can be driven by the real
+    # game loop, which renders in between steps, or run headless as fast as the CPU allows, e.g.:
+    #
+    #     init_headless()
+    #     sim = Simulation()
+    #     sim.run(3600) # one minute of game time
+    #
+    # Entities get everything they need through this object (their `game`), so Game is just a Simulation that also
+    # draws itself and plays sounds.
+    #
+    # stream turns the chunk streaming world mode on (True) or off (False); by default only big levels are streamed.
+    #
+    # All the randomness comes from self.rng, seeded with seed (a random seed if None, kept in self.seed), so the same
+    # seed and the same inputs always play out the same way; see scripts/replay.py for recording and replaying inputs.
+    # Things that are only for show and don't happen in lockstep with step() (clouds, screen shake) use self.render_rng,
+    # so drawing more or fewer frames never changes the game.
+    #
+    # The stages of step() are timed with profiler (see scripts/profiler.py), which does nothing unless it is enabled.
+    #
+    # capacities overrides some of the pool sizes in CAPACITIES, e.g. {'particles': 100000}.
+    def __init__(self, assets = None, sfx = None, level = 0, view_size = (320, 240), stream = None, seed = None, profiler = None,
+                 capacities = None):
+        if assets is None:
+            init_headless()
+            assets = load_assets()
+        self.assets = assets
+        self.sfx = sfx if sfx is not None else {name: SilentSound() for name in SFX_NAMES}
+        self.view_size = view_size # size of the game graphics display, for the camera
+        self.stream = stream
+
+        self.input_log = None # an InputLog (see scripts/replay.py) to record every step's inputs into
+        self.profiler = profiler if profiler is not None else Profiler()
+
+        # Broadphase grid for entity-vs-entity checks; every entity re-registers itself here when it moves
+        self.entities = SpatialHash(32)
+
+        # All the leaf and dash particles live in a single particle system, all the sparks in a spark system...
+        capacities = dict(CAPACITIES, **(capacities or {}))
+        self.particles = ParticleSystem(self, capacity = capacities['particles']) # drops new particles when full
+        self.sparks = SparkSystem(capacity = capacities['sparks']) # drops new sparks when full
+        # ... and all the enemy bullets in a projectile system
+        self.projectiles = ProjectileSystem(capacity = capacities['projectiles']) # grows when full
+
+        self.tilemap = Tilemap(self, 16)
+        self.level_data = None # (level number, leaf spawners, spawners) of the level loaded last, see load_level()
+        self.reset(level, seed)
+
+    # Start a new run of a level: seed the random generators (a random seed if None, kept in self.seed), clear the
+    # inputs and the step count, and load the level with a new player. Running the same object again this way plays out
+    # exactly like a new Simulation(level = level, seed = seed), without reading the level's map again.
+    def reset(self, level, seed = None):
+        self.seed = seed if seed is not None else random.randrange(2**63)
+        self.rng = random.Random(self.seed)
+        self.render_rng = random.Random(self.seed + 1)
+
+        self.movement = [False,False]
+        self.screenshake = 0 # Timer for screen shake effect
+        self.frame = 0 # number of steps taken so far
+
+        self.player = Player(self,(50,50),(8,15))
+        self.level = level
+        self.load_level(self.level)
+
+    # Advance the game by one fixed timestep; jump and dash are this step's button presses
+    def step(self, jump = False, dash = False):
+        self.frame += 1
+        if self.input_log is not None:
+            self.input_log.record(self.movement, jump, dash)
+
+        # ===== Handle User Inputs ===== #
+        # (self.movement holds the left/right keys currently held down)
+        if jump: # Handle Jumping (Allows multiple jumps)
+            if self.player.jump():
+                self.sfx['jump'].play()
+        if dash: # Handle Dashing
+            self.player.dash()
+
+        # Increment screen shake timer
+        self.screenshake = max(0, self.screenshake - 1)
+
+        # Check if all the enemies are gone
+        if not len(self.enemies):
+            self.transition += 1
+            # Load the next level
+            if self.transition > 30:
+                self.level = min(self.level + 1, level_count()-1)
+                self.load_level(self.level)
+        if self.transition < 0:
+            self.transition += 2
+
+        # Restart the level if the player dies
+        if self.dead:
+            self.dead += 1
+            if self.dead >= 10:
+                self.transition = min(30, self.transition + 1) # cap at 30 to prevent level transition from occuring outside of self.dead counter
+            if self.dead > 60:
+                self.load_level(self.level)
+
+        # Move the Camera
+        self.scroll[0] += (self.player.rect().centerx - self.view_size[0] / 2 - self.scroll[0]) / 2
+        self.scroll[1] += (self.player.rect().centery - self.view_size[1] / 2 - self.scroll[1]) / 2
+
+        profiler = self.profiler
+
+        # Page the level in and out around the camera
+        if self.streaming:
+            with profiler.scope('update stream'):
+                self.tilemap.stream((self.scroll[0], self.scroll[1], self.view_size[0], self.view_size[1]))
+
+        # Spawn Particles
+        with profiler.scope('update leaves'):
+            for rect in self.active_leaf_spawners():
+                # Note: spawn rate of particles is proportional to the size of the particle emitter rectangle
+                if self.rng.random() * 49999 < rect.width * rect.height:
+                    pos = (rect.x + self.rng.random() * rect.width, rect.y + self.rng.random() * rect.height)
+                    self.particles.spawn('leaf', pos, velocity = [-0.1, 0.3], frame = self.rng.randint(0,20))
+
+        # Update the enemies
+        with profiler.scope('update enemies'):
+            self.look_for_player()
+            for enemy in self.enemies:
+                enemy.update(self.tilemap, (0,0))
+
+            # The player's dash attack kills every enemy it touches: one lookup in the broadphase grid (where the enemies
+            # just registered their new positions) instead of every enemy checking the player
+            if abs(self.player.dashing) >= 50:
+                for enemy in self.entities.query_rect(self.player.rect()):
+                    if enemy is not self.player:
+                        enemy.die()
+                        self.enemies.remove(enemy)
+                        self.entities.remove(enemy)
+
+        # Update the player (if they have not died)
+        with profiler.scope('update player'):
+            if not self.dead:
+                self.player.update(self.tilemap, (2*(self.movement[1] - self.movement[0]),0))
+
+        with profiler.scope('update projectiles'):
+            self.update_projectiles()
+        with profiler.scope('update sparks'):
+            self.sparks.update()
+        with profiler.scope('update particles'):
+            self.particles.update() # the particle system also removes EOL particles and sways the leaves
+
+    # Run a number of steps back to back (no frame rate limit); returns the achieved steps per second
+    def run(self, steps):
+        start = time.perf_counter()
+        for i in range(steps):
+            self.step()
+        return steps / max(time.perf_counter() - start, 1e-9)
+
+    def update_projectiles(self):
+        # All the projectiles live in a ProjectileSystem (see scripts/projectile.py), which stores
+        # their positions, velocities and ages (in frames) in arrays and moves them all at once
+        projectiles = self.projectiles
+        projectiles.update()
+
+        # Projectiles that hit a wall (the masks here are over the projectile system's slots, see scripts/pool.py)
+        top = projectiles.top
+        walls = projectiles.in_walls(self.tilemap)
+        for pos, velocity in zip(projectiles.pos[:top][walls].tolist(), projectiles.velocity[:top][walls].tolist()):
+            # Spawn spark particles upon collision with a wall
+            for i in range(4):
+                self.sparks.spawn(pos, self.rng.random() - 0.5 + (math.pi if velocity>0 else 0) , 2 + self.rng.random() )
+        dead = walls | (projectiles.timer[:top] > PROJECTILE_LIFETIME) # projectiles also expire after 6 seconds
+
+        # Logic for player collision with projectile
+        if abs(self.player.dashing) < 50 and not self.dead: # if the player is not in a dash or already dead
+            hits = projectiles.hits(self.entities, (self.player,), ignore = dead) # the enemies' own bullets go right through them
+            if hits:
+                dead[hits[0][0]] = True # only the first projectile to reach the player is used up
+                self.killed_by = int(projectiles.owner[hits[0][0]]) # number of the enemy that fired it
+                self.dead += 1 # take damage
+                self.screenshake = max(25,self.screenshake) # this prevents a larger screen shake from being overwritten by a smaller one
+                # Play death sound
+                self.sfx['hit'].play()
+                # Spawn a mess of particles
+                for i in range(30):
+                    angle = self.rng.random() * math.pi * 2
+                    speed = self.rng.random() * 5
+                    self.sparks.spawn(self.player.rect().center,angle, 2 + self.rng.random())
+                    self.particles.spawn('particle', self.player.rect().center, \
+                                         velocity=[math.cos(angle+math.pi) * speed * 0.5, \
+                                                   math.sin(angle+math.pi) * speed * 0.5], frame = self.rng.randint(0,7))
+
+        projectiles.kill(dead)
+
+    # Find the enemies that can see the player this step (a shot from farther away would expire before reaching them):
+    # one radius lookup in the broadphase grid instead of every enemy measuring its distance to the player
+    def look_for_player(self):
+        self.in_sight = set(self.entities.query_radius(self.player.rect().center, SHOT_RANGE))
+
+    # The leaf spawning rectangles to use this step (only the ones around the camera when streaming)
+    def active_leaf_spawners(self):
+        if not self.streaming:
+            return self.leaf_spawners
+        near = self.tilemap.chunks_near((self.scroll[0], self.scroll[1], self.view_size[0], self.view_size[1]))
+        return [rect for loc in sorted(near) for rect in self.leaf_spawners.get(loc, ())]
+
+    # Hand the number of live objects to the profiler (once per frame)
+    def count_objects(self):
+        profiler = self.profiler
+        profiler.count('enemies', len(self.enemies))
+        profiler.count('projectiles', len(self.projectiles))
+        profiler.count('sparks', len(self.sparks))
+        profiler.count('particles', len(self.particles))
+
+    # Usage of the short-lived object pools (use the high water marks to size them)
+    def pool_stats(self):
+        return {'projectiles': self.projectiles.stats(), 'sparks': self.sparks.stats(), 'particles': self.particles.stats()}
+
+    def load_level(self,map_id):
+        # Restarting the level that is already loaded (after dying) doesn't touch the map at all: nothing in the tilemap
+        # changes while playing, so the tilemap and the spawners found the first time are simply used again
+        if self.level_data is None or self.level_data[0] != map_id:
+            self.read_level(map_id)
+        map_id, self.leaf_spawners, spawners = self.level_data
+
+        # ===== Initilize the Level ===== #
+
+        # initialize camera position
+        self.scroll = [0,0] # create a list representing the camera position
+
+        # Game Over State
+        self.dead = 0
+        self.killed_by = None # number of the enemy whose projectile hit the player (None if they weren't shot)
+
+        # Scene transition counter
+        self.transition = -30
+
+        # reset the particle controllers
+        self.particles.clear()
+        self.sparks.clear()
+
+        # initialize list of enemies (and forget every entity registered in the broadphase)
+        self.enemies = []
+        self.entities.clear()
+        self.in_sight = set() # the enemies that can see the player, see look_for_player()
+
+        # remove any projectiles left over from the last level
+        self.projectiles.clear()
+
+
+        # Spawn player and enemies by looping over all spawners in the level
+        for spawner in spawners:
+            if spawner['variant'] == 0:
+                self.player.pos = list(spawner['pos']) # move the player to the starting position (a copy, the spawner is used again on restart)
+                self.player.air_time = 0
+                self.player.dashing = 0
+                self.player.velocity = [0,0]
+                self.player.flip = False
+                self.entities.insert(self.player, self.player.rect())
+            else:
+                # Spawn enemies
+                self.enemies.append(Enemy(self,spawner['pos'],(8,15),len(self.enemies)))
+                self.entities.insert(self.enemies[-1], self.enemies[-1].rect())
+
+    # Load a level's tilemap and find its leaf spawners and spawners (which are taken out of the map), for load_level()
+    def read_level(self, map_id):
+        # Load the tilemap (from a binary copy of the json map, which loads without parsing, see scripts/mapfile.py)
+        self.tilemap.load(cached_map(MAP_DIR + str(map_id) + '.json'))
+        map_file = self.tilemap.tilemap.map_file
+        self.streaming = self.stream if self.stream is not None else bool(map_file and len(map_file.chunks) > STREAM_MIN_CHUNKS)
+
+        # initilize leaf particle spawners
+        if self.streaming:
+            # Create rectangles representing leaf spawning areas of the trees, by chunk (straight from the map's index)
+            # so only the ones around the camera have to be looked at every step
+            leaf_spawners = {loc: [pygame.Rect(4 + tree['pos'][0], 4 + tree['pos'][1], 23, 13) for tree in trees]
+                             for loc, trees in self.tilemap.offgrid_by_chunk([('large_decor',2)]).items()}
+        else:
+            leaf_spawners = []
+            # Create rectangles representing leaf spawning areas of all the trees
+            for tree in self.tilemap.extract([('large_decor',2)], keep=True):
+                    leaf_spawners.append(pygame.Rect(4 + tree['pos'][0], 4 + tree['pos'][1], 23, 13))
+
+        spawners = self.tilemap.extract([('spawners',0), ('spawners',1)],keep=False)
+        self.level_data = (map_id, leaf_spawners, spawners)
+
+if __name__ == '__main__':
+    # Quick headless throughput check:  python -m scripts.simulation [steps] [level]
+    import sys
+    steps = int(sys.argv[1]) if len(sys.argv) > 1 else 3600
+    sim = Simulation(level = int(sys.argv[2]) if len(sys.argv) > 2 else 0)
+    print('%d steps at %.0f steps/s' % (steps, sim.run(steps)))
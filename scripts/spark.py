@@ -1,25 +1,67 @@
 import math
 import pygame
+import numpy as np
 
-class Spark:
-    def __init__(self, pos, angle, speed):
-        self.pos = list(pos)
-        self.angle = angle
-        self.speed = speed
+from scripts.pool import ArrayPool
+
+class SparkSystem(ArrayPool):
+    # The position, direction and speed of every live spark are stored in NumPy arrays, so the whole pool moves in one
+    # vectorized step and all the polygon vertices are worked out at once. Like the other array systems it has room for
+    # a fixed number of sparks (see scripts/pool.py).
+    #
+    # A spark's angle never changes, so its cosine and sine are computed once when it spawns. The other three
+    # vertex directions are just rotations of that vector by multiples of pi/2 (no more trig per frame).
+    FIELDS = {'pos': ((2,), np.float64), 'direction': ((2,), np.float64), 'speed': ((), np.float64)} # direction: (cos(angle), sin(angle))
+
+    def __init__(self, capacity = 512, color = (255, 255, 255)):
+        self.color = color
+        super().__init__(capacity)
+
+    # Returns whether it was spawned (False: every slot was taken and it was dropped)
+    def spawn(self, pos, angle, speed):
+        i = self.acquire()
+        if i < 0:
+            return False
+        self.pos[i] = pos
+        self.direction[i] = (math.cos(angle), math.sin(angle))
+        self.speed[i] = speed
+        return True
 
     def update(self):
-        self.pos[0] += self.speed * math.cos(self.angle)
-        self.pos[1] += self.speed * math.sin(self.angle)
+        if not self.count:
+            return
+
+        # Sparks whose speed ran out last frame were still drawn once, remove them now
+        self.kill(self.speed[:self.top] == 0)
+
+        top = self.top
+        speed = self.speed[:top]
+        self.pos[:top] += self.direction[:top] * speed[:, None]
+        np.maximum(speed - 0.1, 0, out=speed)
 
-        self.speed = max(0, self.speed - 0.1)
-        return not self.speed # once speed runs out, returns the EOL flag to remove it from list of sparks
+    # color overrides the spark color (used to draw their outlines)
+    def render(self, surf, offset = (0, 0), color = None):
+        if not self.count:
+            return
+        slots = self.live()
+        n = len(slots)
+        center = self.pos[slots] - offset
+        cos, sin = self.direction[slots, 0], self.direction[slots, 1]
+        speed = self.speed[slots]
+        long = speed * 3 # the spark is a thin diamond, 3 * speed long and 0.5 * speed wide
+        wide = speed * 0.5
 
-    def render(self, surf, offset=(0,0)):
-        render_points = [
-            [self.pos[0] + math.cos(self.angle)               * self.speed * 3 - offset[0] ,self.pos[1] + math.sin(self.angle)               * self.speed * 3 - offset[1]],
-            [self.pos[0] + math.cos(self.angle-math.pi/2)     * self.speed *.5 - offset[0] ,self.pos[1] + math.sin(self.angle-math.pi/2)     * self.speed *.5 - offset[1]],
-            [self.pos[0] + math.cos(self.angle-math.pi)       * self.speed * 3 - offset[0] ,self.pos[1] + math.sin(self.angle-math.pi)       * self.speed * 3 - offset[1]],
-            [self.pos[0] + math.cos(self.angle-math.pi*(3/2)) * self.speed *.5 - offset[0] ,self.pos[1] + math.sin(self.angle*math.pi*(3/2)) * self.speed *.5 - offset[1]],
-        ]
+        points = np.empty((n, 4, 2))
+        points[:, 0, 0] = center[:, 0] + cos * long # angle
+        points[:, 0, 1] = center[:, 1] + sin * long
+        points[:, 1, 0] = center[:, 0] + sin * wide # angle - pi/2
+        points[:, 1, 1] = center[:, 1] - cos * wide
+        points[:, 2, 0] = center[:, 0] - cos * long # angle - pi
+        points[:, 2, 1] = center[:, 1] - sin * long
+        points[:, 3, 0] = center[:, 0] - sin * wide # angle - 3pi/2
+        points[:, 3, 1] = center[:, 1] + cos * wide
 
-        pygame.draw.polygon(surf, (255,255,255), render_points)
\ No newline at end of file
+        color = color or self.color
+        polygon = pygame.draw.polygon
+        for spark_points in points.tolist():
+            polygon(surf, color, spark_points)
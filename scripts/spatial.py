@@ -0,0 +1,107 @@
+import math
+
+class SpatialHash:
+    # Buckets items into a uniform grid of square cells (in pixels) by their bounding rectangles, so "what is near here?"
+    # only has to look at the items in a few cells instead of every item in the level.
+    #
+    # Items don't need to be hashable (tile dicts aren't), they are tracked by id(). Query results come back in the
+    # order the items were inserted, which keeps things like decoration draw order stable.
+    def __init__(self, cell_size = 64):
+        self.cell_size = cell_size
+        self.cells = {} # (cell x, cell y) -> list of item ids
+        self.items = {} # item id -> [insertion number, item, rect]
+        self.count = 0
+
+    def __len__(self):
+        return len(self.items)
+
+    def clear(self):
+        self.cells = {}
+        self.items = {}
+        self.count = 0
+
+    # first and last cell (x and y) covered by a rectangle (x, y, w, h)
+    def cell_range(self, rect):
+        size = self.cell_size
+        return (math.floor(rect[0] / size), math.floor((rect[0] + max(rect[2], 1) - 1) / size),
+                math.floor(rect[1] / size), math.floor((rect[1] + max(rect[3], 1) - 1) / size))
+
+    # cells covered by a rectangle (x, y, w, h)
+    def cells_in(self, rect):
+        x0, x1, y0, y1 = self.cell_range(rect)
+        for cx in range(x0, x1 + 1):
+            for cy in range(y0, y1 + 1):
+                yield (cx, cy)
+
+    def insert(self, item, rect):
+        item_id = id(item)
+        rect = tuple(rect)
+        if item_id in self.items:
+            entry = self.items[item_id]
+            if self.cell_range(entry[2]) == self.cell_range(rect):
+                entry[2] = rect # still in the same cells (the usual case for something moving a bit), just update it
+                return
+            self.remove(item)
+        self.items[item_id] = [self.count, item, rect]
+        self.count += 1
+        for cell in self.cells_in(rect):
+            if cell in self.cells:
+                self.cells[cell].append(item_id)
+            else:
+                self.cells[cell] = [item_id]
+
+    def remove(self, item):
+        item_id = id(item)
+        if item_id not in self.items:
+            return
+        rect = self.items.pop(item_id)[2]
+        for cell in self.cells_in(rect):
+            bucket = self.cells[cell]
+            bucket.remove(item_id)
+            if not bucket:
+                del self.cells[cell]
+
+    # All items whose rectangle overlaps rect (x, y, w, h)
+    def query_rect(self, rect):
+        x, y, w, h = rect
+        found = {}
+        for cell in self.cells_in(rect):
+            for item_id in self.cells.get(cell, ()):
+                if item_id not in found:
+                    entry = self.items[item_id]
+                    other = entry[2]
+                    if other[0] < x + w and x < other[0] + other[2] and other[1] < y + h and y < other[1] + other[3]:
+                        found[item_id] = entry
+        return [entry[1] for entry in sorted(found.values(), key = lambda entry: entry[0])]
+
+    # All items whose rectangle contains the point pos
+    def query_point(self, pos):
+        x, y = pos
+        cell = (math.floor(x / self.cell_size), math.floor(y / self.cell_size))
+        found = []
+        for item_id in self.cells.get(cell, ()):
+            entry = self.items[item_id]
+            other = entry[2]
+            if other[0] <= x < other[0] + other[2] and other[1] <= y < other[1] + other[3]:
+                found.append(entry)
+        return [entry[1] for entry in sorted(found, key = lambda entry: entry[0])]
+
+    # All items whose rectangle is within radius of pos (measured from the closest point of the rectangle)
+    def query_radius(self, pos, radius):
+        x, y = pos
+        size = self.cell_size
+        span = (math.floor((x + radius) / size) - math.floor((x - radius) / size) + 1) * \
+               (math.floor((y + radius) / size) - math.floor((y - radius) / size) + 1)
+        if span > len(self.items):
+            candidates = self.items.values() # a huge radius: checking every item is cheaper than visiting every cell
+        else:
+            candidates = [self.items[item_id] for item_id in set().union(*(self.cells.get(cell, ()) for cell in \
+                          self.cells_in((x - radius, y - radius, radius * 2, radius * 2))))]
+        found = []
+        for entry in candidates:
+            other = entry[2]
+            dx = x - min(max(x, other[0]), other[0] + other[2])
+            dy = y - min(max(y, other[1]), other[1] + other[3])
+            if dx * dx + dy * dy <= radius * radius:
+                found.append(entry)
+        return [entry[1] for entry in sorted(found, key = lambda entry: entry[0])]
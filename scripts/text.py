@@ -0,0 +1,23 @@
+from collections import OrderedDict
+
+MAX_TEXTS = 128 # how many rendered strings to keep before the least recently used ones get thrown away
+
+class TextCache:
+    # Font.render() rasterizes the whole string every time it is called, which is wasted work for text that doesn't
+    # change (menu titles, buttons, instructions...). This keeps the rendered surfaces, keyed by everything that
+    # affects how they look, and only renders a string again if it was evicted.
+    def __init__(self, max_texts = MAX_TEXTS):
+        self.max_texts = max_texts
+        self.texts = OrderedDict() # (font, text, color, antialias) -> surface
+
+    def render(self, font, text, color, antialias = True):
+        key = (font, text, tuple(color), antialias)
+        if key in self.texts:
+            self.texts.move_to_end(key) # mark as most recently used
+            return self.texts[key]
+
+        surf = font.render(text, antialias, color)
+        self.texts[key] = surf
+        if len(self.texts) > self.max_texts:
+            self.texts.popitem(last=False) # evict the least recently used text
+        return surf
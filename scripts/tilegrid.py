@@ -0,0 +1,279 @@
+import queue
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+from scripts.mapfile import EMPTY
+
+class TileGrid:
+    # The on-grid tiles of a tilemap: works like a dictionary of (x, y) -> tile dict ({'type', 'variant', 'pos'}), but
+    # a level loaded from a binary map (see scripts/mapfile.py) doesn't turn into tile dicts right away. Its chunks stay
+    # as arrays in the memory-mapped file, and a chunk is only turned into tile dicts the first time one of its cells is
+    # looked up or changed. Looping over the whole grid (items(), values(), len()...) converts every chunk that is left.
+    #
+    # Bulk questions like "which cells are solid?" or "where are the spawners?" are answered from the map's chunk index
+    # and the arrays of the unconverted chunks, see locs_of_types() and find(). The converted tiles have an index of
+    # their own by (type, variant), kept up to date as tiles are added and removed, so find() never has to look at
+    # tiles of other kinds.
+    #
+    # For levels too big to keep as tile dicts, stream() pages chunks in and out around the camera: chunks coming into
+    # view are converted ahead of time on a background thread, and converted chunks that are far away are dropped back
+    # to the file (unless they were edited, those stay).
+    def __init__(self):
+        self.tiles = {} # (x, y) -> tile dict, for the converted chunks (and everything when loaded from json)
+        self.kinds = {} # (type, variant) -> {(x, y): True} for the tiles in self.tiles
+        self.map_file = None
+        self.pending = {} # (chunk x, chunk y) -> True for the chunks of map_file that haven't been converted yet
+        self.converted = OrderedDict() # chunks of map_file that have been converted, least recently used first
+        self.modified = set() # converted chunks that were edited since, these are never paged out
+
+        # background conversion (started the first time something is prefetched)
+        self.requests = queue.Queue() # (map file, chunk) to convert
+        self.results = queue.Queue() # (map file, chunk, tiles) that are ready to be merged
+        self.requested = set()
+        self.worker = None
+
+    # Start over with the tiles of a json map, or of a binary MapFile
+    def load(self, tiles = None, map_file = None):
+        self.tiles = tiles if tiles is not None else {}
+        self.reindex()
+        self.map_file = map_file
+        self.pending = dict.fromkeys(map_file.chunks, True) if map_file else {}
+        self.converted = OrderedDict()
+        self.modified = set()
+        self.requested = set() # anything still in flight belongs to the old map and is thrown away by collect()
+
+    # Keep the (type, variant) index in step with self.tiles
+    def index_tile(self, pos, tile):
+        kind = (tile['type'], tile['variant'])
+        if kind in self.kinds:
+            self.kinds[kind][pos] = True
+        else:
+            self.kinds[kind] = {pos: True}
+
+    def unindex_tile(self, pos, tile):
+        kind = (tile['type'], tile['variant'])
+        locs = self.kinds[kind]
+        del locs[pos]
+        if not locs:
+            del self.kinds[kind]
+
+    # Rebuild the (type, variant) index from scratch
+    def reindex(self):
+        self.kinds = {}
+        for pos, tile in self.tiles.items():
+            self.index_tile(pos, tile)
+
+    def convert_chunk(self, loc, tiles = None):
+        del self.pending[loc]
+        self.converted[loc] = True
+        if tiles is None:
+            tiles = self.map_file.chunk_tiles(loc)
+        for pos, tile in tiles.items():
+            if pos not in self.tiles: # never overwrite a tile that was placed before the chunk got converted
+                self.tiles[pos] = tile
+                self.index_tile(pos, tile)
+
+    def convert_all(self):
+        for loc in list(self.pending):
+            self.convert_chunk(loc)
+
+    # Turn a converted chunk back into arrays in the file (only for chunks that weren't edited)
+    def drop_chunk(self, loc):
+        del self.converted[loc]
+        for pos in self.map_file.chunk_tiles(loc):
+            self.unindex_tile(pos, self.tiles.pop(pos))
+        self.pending[loc] = True
+
+    # Remember that the tiles of the chunk holding pos were edited, so they are never paged out
+    def mark_modified(self, pos):
+        if self.map_file:
+            size = self.map_file.chunk_size
+            self.modified.add((pos[0] // size, pos[1] // size))
+
+    # Ask the background thread to convert these chunks; they are merged in by the next collect()
+    def prefetch(self, locs):
+        if self.worker is None:
+            self.worker = threading.Thread(target=self.work, daemon=True)
+            self.worker.start()
+        for loc in locs:
+            if loc in self.pending and loc not in self.requested:
+                self.requested.add(loc)
+                self.requests.put((self.map_file, loc))
+
+    def work(self):
+        while True:
+            map_file, loc = self.requests.get()
+            self.results.put((map_file, loc, map_file.chunk_tiles(loc)))
+
+    # Merge the chunks the background thread has finished converting (on the main thread, so nothing else ever
+    # changes the grid while it is being used)
+    def collect(self):
+        while True:
+            try:
+                map_file, loc, tiles = self.results.get_nowait()
+            except queue.Empty:
+                return
+            if map_file is self.map_file:
+                self.requested.discard(loc)
+                if loc in self.pending: # it may have been needed (and converted) before the thread got to it
+                    self.convert_chunk(loc, tiles)
+
+    # Page chunks in and out: the chunks in near are converted in the background (if they aren't already) and kept,
+    # and the least recently near chunks are dropped until at most max_chunks are left. Returns the dropped chunks.
+    def stream(self, near, max_chunks):
+        if not self.map_file:
+            return []
+        self.collect()
+        self.prefetch(near)
+        for loc in near:
+            if loc in self.converted:
+                self.converted.move_to_end(loc) # mark as most recently used
+        dropped = []
+        for loc in list(self.converted):
+            if len(self.converted) <= max_chunks:
+                break
+            if loc not in near and loc not in self.modified:
+                self.drop_chunk(loc)
+                dropped.append(loc)
+        return dropped
+
+    def get(self, pos, default = None):
+        tile = self.tiles.get(pos)
+        if tile is None and self.pending:
+            size = self.map_file.chunk_size
+            loc = (pos[0] // size, pos[1] // size)
+            if loc in self.pending:
+                self.convert_chunk(loc)
+                tile = self.tiles.get(pos)
+        return default if tile is None else tile
+
+    def __contains__(self, pos):
+        return self.get(pos) is not None
+
+    def __getitem__(self, pos):
+        tile = self.get(pos)
+        if tile is None:
+            raise KeyError(pos)
+        return tile
+
+    def __setitem__(self, pos, tile):
+        old = self.get(pos) # (also makes sure the chunk is converted first, so it can't overwrite this later)
+        if old is not None:
+            self.unindex_tile(pos, old)
+        self.mark_modified(pos)
+        self.tiles[pos] = tile
+        self.index_tile(pos, tile)
+
+    def __delitem__(self, pos):
+        tile = self.get(pos)
+        if tile is None:
+            raise KeyError(pos)
+        self.mark_modified(pos)
+        del self.tiles[pos]
+        self.unindex_tile(pos, tile)
+
+    # Give the tiles at (xs[i], ys[i]) (NumPy arrays of tile coordinates, every cell must hold a tile) new variants, for
+    # changing lots of tiles at once without going through __setitem__ one tile at a time
+    def set_variants(self, xs, ys, variants):
+        if self.map_file:
+            size = self.map_file.chunk_size
+            for loc in set(zip((xs // size).tolist(), (ys // size).tolist())):
+                if loc in self.pending:
+                    self.convert_chunk(loc)
+                self.modified.add(loc)
+        tiles = self.tiles
+        kinds = self.kinds
+        for pos, variant in zip(zip(xs.tolist(), ys.tolist()), variants.tolist()):
+            tile = tiles[pos] # changed in place, making new dicts for a whole map's worth of tiles is a lot slower
+            del kinds[(tile['type'], tile['variant'])][pos]
+            tile['variant'] = variant
+            kind = (tile['type'], variant)
+            if kind in kinds:
+                kinds[kind][pos] = True
+            else:
+                kinds[kind] = {pos: True}
+        self.kinds = {kind: locs for kind, locs in kinds.items() if locs}
+
+    def __len__(self):
+        self.convert_all()
+        return len(self.tiles)
+
+    def __iter__(self):
+        self.convert_all()
+        return iter(self.tiles)
+
+    def keys(self):
+        self.convert_all()
+        return self.tiles.keys()
+
+    def values(self):
+        self.convert_all()
+        return self.tiles.values()
+
+    def items(self):
+        self.convert_all()
+        return self.tiles.items()
+
+    def copy(self):
+        self.convert_all()
+        return self.tiles.copy()
+
+    # Tile types / (type, variant) pairs that appear in the grid
+    def pairs(self):
+        found = set(self.kinds)
+        if self.pending:
+            index = self.map_file.grid_index
+            if len(self.pending) < len(self.map_file.chunks): # only the chunks that haven't been converted
+                pending = np.array([loc in self.pending for loc in self.map_file.chunk_locs], dtype=bool)
+                index = index[pending[index['chunk']]]
+            for tile_type, variant in set(zip(index['type'].tolist(), index['variant'].tolist())):
+                found.add((self.map_file.types[tile_type], variant))
+        return found
+
+    # Positions of every tile whose type is in tile_types (in no particular order), without converting any chunks;
+    # returns an array of x coordinates and an array of y coordinates
+    def locs_of_types(self, tile_types):
+        xs, ys, variants = self.cells_of_types(tile_types)
+        return xs, ys
+
+    # Like locs_of_types(), plus an array of the tiles' variants
+    def cells_of_types(self, tile_types):
+        all_xs, all_ys, all_variants = [np.zeros(0, dtype=np.int64)], [np.zeros(0, dtype=np.int64)], [np.zeros(0, dtype=np.int64)]
+        for (tile_type, variant), locs in self.kinds.items():
+            if tile_type in tile_types:
+                locs = np.array(list(locs), dtype=np.int64)
+                all_xs.append(locs[:, 0])
+                all_ys.append(locs[:, 1])
+                all_variants.append(np.full(len(locs), variant, dtype=np.int64))
+        if self.pending:
+            wanted = np.zeros(EMPTY + 1, dtype=bool) # lookup table: type number -> is it one of tile_types?
+            wanted[[i for i, name in enumerate(self.map_file.types) if name in tile_types]] = True
+            size = self.map_file.chunk_size
+            for loc in self.map_file.chunks_with(tile_types = tile_types): # only the chunks the index says have any
+                if loc in self.pending:
+                    types, variants = self.map_file.chunk(loc)
+                    ys, xs = np.nonzero(wanted[types])
+                    all_xs.append(xs + loc[0] * size)
+                    all_ys.append(ys + loc[1] * size)
+                    all_variants.append(variants[ys, xs])
+        return np.concatenate(all_xs), np.concatenate(all_ys), np.concatenate(all_variants)
+
+    # Positions of every tile whose (type, variant) is in id_pairs (in no particular order), without converting any chunks
+    def find(self, id_pairs):
+        id_pairs = set(id_pairs)
+        locs = [pos for kind in id_pairs for pos in self.kinds.get(kind, ())]
+        if self.pending:
+            type_ids = {name: i for i, name in enumerate(self.map_file.types)}
+            wanted = [(type_ids[tile_type], variant) for tile_type, variant in id_pairs if tile_type in type_ids]
+            size = self.map_file.chunk_size
+            for loc in self.map_file.chunks_with(id_pairs): # only the chunks the index says have any
+                if loc in self.pending:
+                    types, variants = self.map_file.chunk(loc)
+                    match = np.zeros(types.shape, dtype=bool)
+                    for tile_type, variant in wanted:
+                        match |= (types == tile_type) & (variants == variant)
+                    ys, xs = np.nonzero(match)
+                    locs.extend(zip((xs + loc[0] * size).tolist(), (ys + loc[1] * size).tolist()))
+        return locs
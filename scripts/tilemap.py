@@ -1,10 +1,23 @@
 import pygame
 import json
+import math
+import numpy as np
+from scripts.chunks import ChunkCache
+from scripts.spatial import SpatialHash
+from scripts.tilegrid import TileGrid
+from scripts.mapfile import MapFile, is_map_file, write_map, CHUNK_SIZE
 
 NEIGHBOR_OFFSETS = [(-1,0),(-1,-1),(0,-1),(1,-1),(1,0),(0,0),(1,1),(0,1),(-1,1)] # get all the tiles in these grid positions relative to the player
 PHYSICS_TILES = {'grass','stone'} # this is a set; it is faster to check if a value is in a set rather than if a value is in a list
 AUTOTILE_TYPES = {'grass','stone'} # which tile types can be autotiled
 
+MAX_PRECOMPUTED_RECTS = 200000 # levels with more physics tiles than this make their collision rects as cells are first touched (see build_physics)
+
+# Streaming (see Tilemap.stream): how far past the edges of the view chunks are paged in (in pixels), and how many
+# converted chunks are kept at most before the least recently seen ones are paged out again
+STREAM_MARGIN = 256
+MAX_RESIDENT_CHUNKS = 256
+
 # Define rules for auto-tiling
 AUTOTILE_MAP = {
     # Each dictionary key is a sorted list containing tile neighbors to check for, converted to a tuple
@@ -21,17 +34,115 @@ AUTOTILE_MAP = {
     tuple(sorted([(-1, 0,), (1, 0), (0, -1), (0, 1)])):  8, # tiles on left, right, above, and below
 }
 
+# The same rules as a flat lookup table: the index is a 4-bit mask of which neighbors hold the same type of tile
+# (each neighbor's bit is in AUTOTILE_BITS), the entry is the variant to use, or -1 if there is no rule for it
+AUTOTILE_BITS = {(1, 0): 1, (-1, 0): 2, (0, -1): 4, (0, 1): 8}
+
+def build_autotile_lookup():
+    lookup = [-1] * 16
+    for neighbors, variant in AUTOTILE_MAP.items():
+        lookup[sum(AUTOTILE_BITS[shift] for shift in neighbors)] = variant
+    return lookup
+
+AUTOTILE_LOOKUP = build_autotile_lookup()
+
+# Map files store on-grid tiles under "x;y" string keys, but at runtime the tilemap is indexed by (x, y) tuples of ints
+# so physics and rendering lookups never have to build (and hash) a new string. These two helpers translate between them.
+def loc_to_key(loc):
+    x, y = loc.split(';')
+    return (int(x), int(y))
+
+def key_to_loc(key):
+    return str(key[0]) + ';' + str(key[1])
+
+class SolidityGrid:
+    # A dense bitmap (one byte per grid cell) marking which cells hold a physics tile. It covers the bounding box of the
+    # level's physics tiles and grows whenever a solid tile is placed outside of it; everything outside is empty space.
+    def __init__(self):
+        self.x = 0 # tile coordinates of the top-left cell
+        self.y = 0
+        self.width = 0
+        self.height = 0
+        self.cells = bytearray()
+
+    # Mark exactly the cells at (xs[i], ys[i]) as solid (NumPy arrays of tile coordinates)
+    def build(self, xs, ys):
+        if not len(xs):
+            self.__init__()
+            return
+        self.x, self.y = int(xs.min()), int(ys.min())
+        self.width = int(xs.max()) - self.x + 1
+        self.height = int(ys.max()) - self.y + 1
+        cells = np.zeros(self.width * self.height, dtype=np.uint8)
+        cells[(ys - self.y) * self.width + (xs - self.x)] = 1
+        self.cells = bytearray(cells.tobytes())
+
+    def grow(self, x, y):
+        # Re-allocate the bitmap so it also covers (x, y), copying the old rows across
+        if not self.width:
+            self.x, self.y, self.width, self.height = x, y, 1, 1
+            self.cells = bytearray(1)
+            return
+        new_x, new_y = min(self.x, x), min(self.y, y)
+        new_width = max(self.x + self.width, x + 1) - new_x
+        new_height = max(self.y + self.height, y + 1) - new_y
+        cells = bytearray(new_width * new_height)
+        for row in range(self.height):
+            start = (row + self.y - new_y) * new_width + (self.x - new_x)
+            cells[start:start + self.width] = self.cells[row * self.width:(row + 1) * self.width]
+        self.x, self.y, self.width, self.height, self.cells = new_x, new_y, new_width, new_height, cells
+
+    def set(self, x, y, solid):
+        if not (self.x <= x < self.x + self.width and self.y <= y < self.y + self.height):
+            if not solid:
+                return # already empty
+            self.grow(x, y)
+        self.cells[(y - self.y) * self.width + (x - self.x)] = 1 if solid else 0
+
+    def is_solid(self, x, y):
+        x -= self.x
+        y -= self.y
+        if 0 <= x < self.width and 0 <= y < self.height:
+            return self.cells[y * self.width + x]
+        return 0
+
+    # Vectorized is_solid() for NumPy arrays of tile coordinates; returns a boolean array
+    def is_solid_many(self, xs, ys):
+        xs = xs - self.x
+        ys = ys - self.y
+        inside = (xs >= 0) & (xs < self.width) & (ys >= 0) & (ys < self.height)
+        solid = np.zeros(len(xs), dtype=bool)
+        if inside.any():
+            cells = np.frombuffer(self.cells, dtype=np.uint8) # a view of the bitmap, nothing is copied
+            solid[inside] = cells[ys[inside] * self.width + xs[inside]] != 0
+        return solid
+
 class Tilemap:
     def __init__(self, game, tile_size = 16): # 16 is the default tile size
         self.game = game
         self.tile_size = tile_size
-        self.tilemap = {} # this is a dictionary to map each tile to a location
-        self.offgrid_tiles = [] # this is a list of all decorations to be placed off the tile grid
+        self.tilemap = TileGrid() # this is a dictionary to map each tile to a location (keyed by (x, y) tile coordinates), see scripts/tilegrid.py
+        self.offgrid_tiles = {} # all the decorations to be placed off the tile grid, id(tile) -> tile in draw order
+        self.offgrid_kinds = {} # (type, variant) -> {id(tile): (draw order number, tile)}, kept up to date with offgrid_tiles
+        self.offgrid_count = 0 # draw order number of the next decoration
+        self.offgrid_file = None # the MapFile the decorations came from, as long as they haven't changed since (for its index)
+        self.offgrid_records = [] # the decorations in file order, while offgrid_file is set
+
+        # Collision caches, rebuilt when a level loads and patched one cell at a time by set_tile() / remove_tile()
+        self.physics_rects = {} # (x, y) -> collision rect (x, y, w, h) of every physics tile, made when the level loads (see build_physics)
+        self.physics_rects_complete = True # False: too many physics tiles to make all their rects up front
+        self.solid = SolidityGrid() # per-cell solidity bitmap
+
+        # Spatial index of the decorations, keyed on the pixel bounds of their images
+        self.offgrid_index = SpatialHash(64)
+
+        # Pre-rendered chunks of the level used by render(); anything that edits the map has to invalidate them
+        self.chunks = ChunkCache(self)
 
 
         # ============ Tilemap Data ===================#
-        # Note: Tilemap data are dictionaries whose key is a string representing a position (tile coordinates for tilemap objects, 
-        # pixels for off-grid tile objects), and whose entry is another dictionary containing image and position info for each object
+        # Note: Tilemap data are dictionaries whose key is a tuple representing a position in tile coordinates,
+        # and whose entry is another dictionary containing image and position info for each object
 
         # Template for putting tiles into a dictionary
         # {(0,0): 'grass', (0,1): 'dirt', (9999, 0): 'grass'} # save individual tile locations as specific tiles 
@@ -40,29 +151,130 @@ class Tilemap:
         # Generate sample tilemap data
         # for i in range(10):
         #     # results in positions 3 thru 12 on x, 10 on y being grass tiles
-        #     self.tilemap[str(3+i) + ';10'] = {'type': 'grass', 'variant': 1, 'pos': (3+i,10)} # keep pos as a tuple, everything else is a string
-        #     self.tilemap['10;' + str(5+i)] = {'type': 'stone', 'variant': 1, 'pos': (10,5+i)}
+        #     self.tilemap[(3+i, 10)] = {'type': 'grass', 'variant': 1, 'pos': (3+i,10)} # keep pos as a tuple, everything else is a string
+        #     self.tilemap[(10, 5+i)] = {'type': 'stone', 'variant': 1, 'pos': (10,5+i)}
 
         # # generate decorations data (note that position refers to the top-left of each image!)
         # self.offgrid_tiles.append({'type': 'large_decor', 'variant': 2, 'pos': (100,100)}) # add a tree at (100,100) in pixel coordinates
         # self.offgrid_tiles.append({'type': 'large_decor', 'variant': 0, 'pos': (200,130)}) # add a rock at (200,130) in pixel coordinates
 
-    def render(self,surf, offset = (0,0)):
+    def render(self,surf, offset = (0,0), outlines = None):
+        # Decorations and grid tiles are pre-rendered into chunks (decorations underneath), so we only
+        # have to blit the few chunks that overlap the camera view (outlines: optional OutlineRenderer, see scripts/outline.py)
+        size = self.chunks.chunk_px
+        for cx in range(offset[0] // size, (offset[0] + surf.get_width()) // size + 1):
+            for cy in range(offset[1] // size, (offset[1] + surf.get_height()) // size + 1):
+                chunk = self.chunks.get((cx, cy))
+                if chunk:
+                    surf.blit(chunk, (cx * size - offset[0], cy * size - offset[1]))
+                    if outlines:
+                        outlines.add(chunk, (cx * size - offset[0], cy * size - offset[1]))
 
-        # Render decorations first!
-        for tile in self.offgrid_tiles: # this will render all decoration items, even if they are not inside the camera view
-            surf.blit(self.game.assets[tile['type']][tile['variant']],(tile['pos'][0] - offset[0],\
-                tile['pos'][1] - offset[1])) # position is in pixels for off-grid graphics
-    
-        # identify and loop through tilemap tiles inside the camera view
-        for x in range(offset[0] // self.tile_size - 1, (offset[0] + surf.get_width()) // self.tile_size + 1):
-            for y in range(offset[1] // self.tile_size - 1, (offset[1] + surf.get_height()) // self.tile_size + 1):
-                tile_loc =  str(x) + ';' + str(y)
-                if tile_loc in self.tilemap:
-                    tile = self.tilemap[tile_loc] 
-                    # render this tile if it is in the camera view 
-                    surf.blit(self.game.assets[tile['type']][tile['variant']],\
-                              (tile['pos'][0]*self.tile_size - offset[0], tile['pos'][1]*self.tile_size - offset[1]))
+    # Add (or replace) an on-grid tile; always go through this (or remove_tile) so the collision caches stay in sync
+    def set_tile(self, pos, tile_type, variant):
+        pos = (pos[0], pos[1])
+        self.chunks.invalidate_tile(pos) # whatever was in this cell before
+        self.tilemap[pos] = {'type': tile_type, 'variant': variant, 'pos': pos}
+        self.chunks.fit_tile(self.tilemap[pos])
+        self.chunks.invalidate_tile(pos)
+        self.update_physics(pos)
+
+    def remove_tile(self, pos):
+        pos = (pos[0], pos[1])
+        if pos in self.tilemap:
+            self.chunks.invalidate_tile(pos)
+            del self.tilemap[pos]
+            self.update_physics(pos)
+
+    # Add and remove decorations; like set_tile / remove_tile these keep the render chunks up to date
+    def add_offgrid(self, tile):
+        self.offgrid_file = None # the file's index doesn't match the decorations any more
+        self.index_offgrid(tile)
+        self.chunks.invalidate_rect(self.offgrid_rect(tile))
+
+    def remove_offgrid(self, tile):
+        self.offgrid_file = None
+        del self.offgrid_tiles[id(tile)]
+        kind = (tile['type'], tile['variant'])
+        del self.offgrid_kinds[kind][id(tile)]
+        if not self.offgrid_kinds[kind]:
+            del self.offgrid_kinds[kind]
+        self.offgrid_index.remove(tile)
+        self.chunks.invalidate_rect(self.offgrid_rect(tile))
+
+    # Add a decoration to offgrid_tiles and the indexes on it (without touching the render chunks)
+    def index_offgrid(self, tile):
+        self.offgrid_tiles[id(tile)] = tile
+        kind = (tile['type'], tile['variant'])
+        if kind not in self.offgrid_kinds:
+            self.offgrid_kinds[kind] = {}
+        self.offgrid_kinds[kind][id(tile)] = (self.offgrid_count, tile)
+        self.offgrid_count += 1
+        self.offgrid_index.insert(tile, self.offgrid_rect(tile))
+
+    # Decorations overlapping a rectangle / containing a point (both in pixels), in draw order
+    def offgrid_in_rect(self, rect):
+        return self.offgrid_index.query_rect(rect)
+
+    def offgrid_at(self, pos):
+        return self.offgrid_index.query_point(pos)
+
+    # Decorations whose (type, variant) is in id_pairs, in draw order
+    def find_offgrid(self, id_pairs):
+        found = [entry for kind in set(id_pairs) for entry in self.offgrid_kinds.get(kind, {}).values()]
+        found.sort(key = lambda entry: entry[0])
+        return [entry[1] for entry in found]
+
+    # Copies of the decorations whose (type, variant) is in id_pairs, grouped by the streaming chunk (see stream())
+    # their position is in: (chunk x, chunk y) -> list of tiles
+    def offgrid_by_chunk(self, id_pairs):
+        chunks = {}
+        if self.offgrid_file is not None:
+            for loc, ids in self.offgrid_file.offgrid_groups(id_pairs):
+                chunks.setdefault(loc, []).extend(self.offgrid_records[i].copy() for i in ids.tolist())
+        else:
+            size = self.stream_chunk_px
+            for tile in self.find_offgrid(id_pairs):
+                chunks.setdefault((math.floor(tile['pos'][0] / size), math.floor(tile['pos'][1] / size)), []).append(tile.copy())
+        return chunks
+
+    # Bounding rectangle (in pixels) of an off-grid tile's image
+    def offgrid_rect(self, tile):
+        assets = self.game.assets if self.game else {}
+        if tile['type'] in assets:
+            size = assets[tile['type']][tile['variant']].get_size()
+        else:
+            size = (self.tile_size, self.tile_size) # e.g. spawners, which the game has no images for
+        return pygame.Rect(math.floor(tile['pos'][0]), math.floor(tile['pos'][1]), size[0], size[1])
+
+    # Collision rect of a grid cell, None if there is no physics tile in it
+    # The collision rect of a physics tile: a plain (x, y, w, h) tuple, so the cached ones can be handed to every caller
+    # without anyone being able to change them (pygame takes a tuple anywhere it takes a Rect, about as fast)
+    def physics_rect(self, pos):
+        return (pos[0]*self.tile_size, pos[1]*self.tile_size, self.tile_size, self.tile_size)
+
+    # Refresh the cached collision data of a single grid cell
+    def update_physics(self, pos):
+        tile = self.tilemap.get(pos)
+        solid = bool(tile and tile['type'] in PHYSICS_TILES)
+        self.solid.set(pos[0], pos[1], solid)
+        if solid:
+            self.physics_rects[pos] = self.physics_rect(pos)
+        else:
+            self.physics_rects.pop(pos, None)
+
+    # Rebuild all the cached collision data from scratch (done once per level load): the solidity bitmap and the
+    # collision rect of every physics tile. Only huge levels (which are streamed) skip making the rects up front; their
+    # rects are made the first time their cell is looked at and forgotten again with their chunk (see stream())
+    def build_physics(self):
+        xs, ys = self.tilemap.locs_of_types(PHYSICS_TILES)
+        self.solid.build(xs, ys)
+        self.physics_rects_complete = len(xs) <= MAX_PRECOMPUTED_RECTS
+        if self.physics_rects_complete:
+            size = self.tile_size
+            self.physics_rects = {(x, y): (x * size, y * size, size, size) for x, y in zip(xs.tolist(), ys.tolist())}
+        else:
+            self.physics_rects = {}
 
     def extract(self, id_pairs, keep = False):
 
@@ -71,32 +283,28 @@ class Tilemap:
         # return tiles in id_pairs, optionally remove them from the map
         matches = [] # initialize empty list of matches w/ id pairs
         
-        # Loop through off-grid tiles
-        for tile in self.offgrid_tiles.copy(): # work with a copy of offgrid_tiles rather than the actual parameter
-            # if the tile type and variant listed in id_pairs exists in offgrid tiles:
-            if (tile['type'],tile['variant']) in id_pairs:
-                matches.append(tile.copy()) # pass the tile information to matches list
-                # remove from offgrid tiles if specified
-                if not keep:
-                    self.offgrid_tiles.remove(tile)
-
-        # Loop through on grid tiles (by dictionary keys)
-        for loc in self.tilemap.copy():
-            tile = self.tilemap[loc] # tilemap is a dictionary; get the entry corresponding to [loc] (this is the actual dictionary entry, not a working copy!)
-            if (tile['type'], tile['variant']) in id_pairs:
+        # Loop through the off-grid tiles that match (straight from the (type, variant) index, no other tiles are looked at)
+        for tile in self.find_offgrid(id_pairs):
+            matches.append(tile.copy()) # pass the tile information to matches list
+            # remove from offgrid tiles if specified
+            if not keep:
+                self.remove_offgrid(tile)
 
-                # Create a clean copy of the tile data to avoid modifying the actual data
-                # in self.tilemap
-                matches.append(tile.copy()) # pass the tile information to matches list
-                # create a copy of the matches list entry (list.copy function)
-                matches[-1]['pos'] = matches[-1]['pos'].copy() # don't really understand why we have to copy this one
-                # convert tilemap position to pixel coordinates
-                matches[-1]['pos'][0] *= self.tile_size
-                matches[-1]['pos'][1] *= self.tile_size
+        # Loop through the on grid tiles that match (the grid finds them without looking at every tile)
+        for loc in self.tilemap.find(id_pairs):
+            tile = self.tilemap[loc] # tilemap is a dictionary; get the entry corresponding to [loc] (this is the actual dictionary entry, not a working copy!)
+            # Create a clean copy of the tile data to avoid modifying the actual data
+            # in self.tilemap
+            matches.append(tile.copy()) # pass the tile information to matches list
+            # create a copy of the matches list entry (list.copy function)
+            matches[-1]['pos'] = list(matches[-1]['pos']) # copy pos too so scaling it below doesn't touch the tile in self.tilemap
+            # convert tilemap position to pixel coordinates
+            matches[-1]['pos'][0] *= self.tile_size
+            matches[-1]['pos'][1] *= self.tile_size
 
-                # remove from tilemap if specified
-                if not keep:
-                    del self.tilemap[loc] # remove from dictionary
+            # remove from tilemap if specified
+            if not keep:
+                self.remove_tile(loc) # remove from dictionary (and the collision caches)
 
         return matches
    
@@ -104,64 +312,144 @@ class Tilemap:
         
         tiles = [] # initialize list of tiles to return
         # converta pixel position into a grid position
-        tile_loc = (int(pos[0] // self.tile_size),int(pos[1] // self.tile_size)) # double slash is integer division, which drops the decimals after division
+        tile_x = int(pos[0] // self.tile_size) # double slash is integer division, which drops the decimals after division
+        tile_y = int(pos[1] // self.tile_size)
+        tilemap = self.tilemap
         for offset in NEIGHBOR_OFFSETS:
-            check_loc = str(tile_loc[0] + offset[0]) + ';' + str(tile_loc[1] + offset[1])
-            if check_loc in self.tilemap: # check if there is a tile in this location ( I guess this already knows to check the 'pos' key)
-                tiles.append(self.tilemap[check_loc])
+            tile = tilemap.get((tile_x + offset[0], tile_y + offset[1])) # check if there is a tile in this location
+            if tile:
+                tiles.append(tile)
         return tiles
     
-    # filter tiles that have physics enabled
+    # get the collision rects of the neighboring physics tiles (these come straight from the cache, no new rects are made)
     def physics_rects_around(self, pos):
         rects = []
-        for tile in self.tiles_around(pos):
-            if tile['type'] in PHYSICS_TILES:
-                rects.append(pygame.Rect(tile['pos'][0]*self.tile_size, tile['pos'][1]*self.tile_size,self.tile_size,self.tile_size))
+        tile_x = int(pos[0] // self.tile_size)
+        tile_y = int(pos[1] // self.tile_size)
+        physics_rects = self.physics_rects
+        complete = self.physics_rects_complete
+        for offset in NEIGHBOR_OFFSETS:
+            loc = (tile_x + offset[0], tile_y + offset[1])
+            rect = physics_rects.get(loc)
+            if rect is None and not complete and self.solid.is_solid(loc[0], loc[1]):
+                rect = physics_rects[loc] = self.physics_rect(loc) # a huge level: first time anyone looked at this tile
+            if rect is not None:
+                rects.append(rect)
         return rects
     
     # function to check if a solid physics tile exists at a query point and return said tile
     def solid_check(self, pos):
-        tile_loc = str(int(pos[0] // self.tile_size)) + ';' + str(int(pos[1] // self.tile_size)) # convert pos to tile coordinates
-        if tile_loc in self.tilemap:
-            if self.tilemap[tile_loc]['type'] in PHYSICS_TILES:
-                return self.tilemap[tile_loc]
+        tile_x = int(pos[0] // self.tile_size) # convert pos to tile coordinates
+        tile_y = int(pos[1] // self.tile_size)
+        if self.solid.is_solid(tile_x, tile_y):
+            return self.tilemap[(tile_x, tile_y)]
+
+    # Size (in pixels) of the chunks the level is streamed in
+    @property
+    def stream_chunk_px(self):
+        map_file = self.tilemap.map_file
+        return (map_file.chunk_size if map_file else CHUNK_SIZE) * self.tile_size
+
+    # The streaming chunks overlapping a rectangle (in pixels) grown by margin on every side
+    def chunks_near(self, rect, margin = STREAM_MARGIN):
+        size = self.stream_chunk_px
+        return {(cx, cy) for cx in range(int((rect[0] - margin) // size), int((rect[0] + rect[2] + margin) // size) + 1)
+                         for cy in range(int((rect[1] - margin) // size), int((rect[1] + rect[3] + margin) // size) + 1)}
+
+    # Page the grid in and out around the camera (rect is the view, in pixels), for levels loaded from binary maps that
+    # are too big to keep as tile dicts. The chunks around the view are converted on a background thread before they
+    # are needed and the ones left far behind are turned back into arrays in the file; see TileGrid.stream().
+    def stream(self, rect):
+        size = self.tilemap.map_file.chunk_size if self.tilemap.map_file else 0
+        for cx, cy in self.tilemap.stream(self.chunks_near(rect), MAX_RESIDENT_CHUNKS):
+            if self.physics_rects_complete:
+                continue # the level's collision rects were all made up front, they stay
+            for x in range(cx * size, (cx + 1) * size): # forget the collision rects made for the dropped chunk
+                for y in range(cy * size, (cy + 1) * size):
+                    self.physics_rects.pop((x, y), None)
 
-    # Save Tilemap data
+    # Save Tilemap data (as a binary map if the file name ends in .map, see scripts/mapfile.py)
     def save(self, path): 
+        if path.endswith('.map'):
+            write_map(path, self.tilemap, list(self.offgrid_tiles.values()), self.tile_size)
+            return
         f = open(path, 'w') # create file with write access
-        json.dump({'tilemap': self.tilemap, 'tile_size': self.tile_size, 'offgrid': self.offgrid_tiles},f)
+        # translate the tuple keys back into the "x;y" strings used by the map files
+        tilemap = {key_to_loc(loc): tile for loc, tile in self.tilemap.items()}
+        json.dump({'tilemap': tilemap, 'tile_size': self.tile_size, 'offgrid': list(self.offgrid_tiles.values())},f)
         f.close()
 
-    # Load Tilemap data
+    # Load Tilemap data (json or binary map files)
     def load(self, path): 
-        # Load a saved json file
-        f = open(path, 'r')
-        map_data = json.load(f)
-        f.close()
+        if is_map_file(path):
+            # Binary maps are memory-mapped, their tiles are only read when needed (see scripts/tilegrid.py)
+            map_file = MapFile(path)
+            self.tilemap.load(map_file = map_file)
+            self.tile_size = map_file.tile_size
+            offgrid = map_file.offgrid_tiles()
+            self.offgrid_file = map_file
+        else:
+            # Load a saved json file
+            f = open(path, 'r')
+            map_data = json.load(f)
+            f.close()
+
+            # Parse loaded data to class parameters (string keys are translated into tuple keys once, here)
+            self.tilemap.load({loc_to_key(loc): tile for loc, tile in map_data['tilemap'].items()})
+            self.tile_size = map_data['tile_size']
+            offgrid = map_data['offgrid']
+            self.offgrid_file = None
+
+        self.build_physics()
+        self.offgrid_tiles = {}
+        self.offgrid_kinds = {}
+        self.offgrid_records = offgrid if self.offgrid_file else []
+        self.offgrid_index.clear()
+        for tile in offgrid:
+            self.index_offgrid(tile)
+        self.chunks.clear()
 
-        # Parse loaded data to class parameters
-        self.tilemap = map_data['tilemap']
-        self.tile_size = map_data['tile_size']
-        self.offgrid_tiles = map_data['offgrid']
+    # Auto-tiling of a single cell: pick its variant from the neighbors that hold the same type of tile
+    def autotile_tile(self, pos):
+        tile = self.tilemap.get(pos)
+        if not tile or tile['type'] not in AUTOTILE_TYPES:
+            return
+        mask = 0
+        for shift, bit in AUTOTILE_BITS.items():
+            neighbor = self.tilemap.get((pos[0] + shift[0], pos[1] + shift[1]))
+            if neighbor and neighbor['type'] == tile['type']:
+                mask |= bit
+        variant = AUTOTILE_LOOKUP[mask]
+        if variant != -1 and variant != tile['variant']:
+            self.set_tile(pos, tile['type'], variant)
 
-    # Auto-tiling 
+    # Auto-tile the cells a tile placed at (or removed from) pos can affect: the cell itself and its four neighbors
+    def autotile_around(self, pos):
+        self.autotile_tile(pos)
+        for shift in AUTOTILE_BITS:
+            self.autotile_tile((pos[0] + shift[0], pos[1] + shift[1]))
+
+    # Auto-tiling of the whole map at once (e.g. after importing a map): the neighbor masks of every tile of a type
+    # are worked out together with NumPy, from a bitmap of the cells that hold that type
     def autotile(self):
-        # loop through all the keys in the tilemap dictionary
-        for loc in self.tilemap:
-            tile = self.tilemap[loc]
-            neighbors = set()
-            for shift in [(1,0),(-1,0),(0,-1),(0,1)]:
-                # build a string representation of the location we want to check
-                check_loc = str(tile['pos'][0] + shift[0]) + ';' + str(tile['pos'][1] + shift[1])
-                # Check if something exists in the checked location
-                if check_loc in self.tilemap:
-                    # if yes, make sure the neighbor is the same type of tile
-                    if self.tilemap[check_loc]['type'] == tile['type']:
-                        neighbors.add(shift) # add this location to the set of populated neighbors
-
-            # Convert neighbors set into a tuple for compatability with the autotile rule dictionary
-            neighbors = tuple(sorted(neighbors))
-            if (tile['type'] in AUTOTILE_TYPES) and (neighbors in AUTOTILE_MAP):
-                # set this tile's variant to the entry in the rule dictionary
-                tile['variant'] = AUTOTILE_MAP[neighbors] 
+        lookup = np.array(AUTOTILE_LOOKUP)
+        grid = self.tilemap
+        for tile_type in AUTOTILE_TYPES:
+            xs, ys, old_variants = grid.cells_of_types({tile_type})
+            if not len(xs):
+                continue
+            # bitmap with a border of empty cells, so every tile has all four neighbors in it
+            cx = xs - (xs.min() - 1)
+            cy = ys - (ys.min() - 1)
+            cells = np.zeros((int(cy.max()) + 2, int(cx.max()) + 2), dtype=np.uint8)
+            cells[cy, cx] = 1
+            masks = cells[cy, cx + 1] * AUTOTILE_BITS[(1, 0)] | cells[cy, cx - 1] * AUTOTILE_BITS[(-1, 0)] | \
+                    cells[cy - 1, cx] * AUTOTILE_BITS[(0, -1)] | cells[cy + 1, cx] * AUTOTILE_BITS[(0, 1)]
+            variants = lookup[masks]
+
+            # only the tiles that have a rule for their neighbors, and aren't already the right variant, are changed
+            changed = (variants != -1) & (variants != old_variants)
+            if changed.any():
+                grid.set_variants(xs[changed], ys[changed], variants[changed])
 
+        self.chunks.clear() # any number of tiles may have changed
@@ -1,10 +1,24 @@
+import threading
+
 import pygame
-import os
+from scripts.atlas import Atlas
 
 BASE_IMG_PATH = 'data/images/'
 
-# load a specific image as a surface
+atlas = None # all the small images packed together (see scripts/atlas.py), made on first use
+atlas_lock = threading.Lock() # images can be loaded on several threads at once (see scripts/loader.py), the atlas is only made once
+
+def get_atlas():
+    global atlas
+    with atlas_lock:
+        if atlas is None:
+            atlas = Atlas(BASE_IMG_PATH)
+    return atlas
+
+# load a specific image as a surface (images packed in the atlas come back as subsurfaces of it)
 def load_image(path):
+    if path in get_atlas():
+        return atlas.image(path)
     img = pygame.image.load(BASE_IMG_PATH + path).convert()
     img.set_colorkey((0,0,0))
     return img
@@ -12,31 +26,48 @@ def load_image(path):
 # loads all the images in a folder (returns a list of surfaces)
 def load_images(path):
     images = []
-    for img_name in sorted(os.listdir(BASE_IMG_PATH + path)): # os.listdir will return a list of all files in a directory
+    for img_name in get_atlas().listdir(path): # the atlas knows every file in every folder, no need for os.listdir
         images.append(load_image(path + '/' + img_name))
     return images
 
-# Class for playing animations
+# An animation clip: the frames and timing of an animation, shared by everything that plays it (never changes after
+# it is made). Each entity or particle playing it only keeps a small AnimationPlayer with its own frame counter.
 class Animation:
-    def __init__(self, images, img_dur=5, loop = True):
+    def __init__(self, images, img_dur=5, loop = True, flipped = None):
         self.images = images
+        # horizontally flipped versions of the images, made once here instead of flipping every frame in render()
+        self.flipped = flipped if flipped is not None else [pygame.transform.flip(img, True, False) for img in images]
         self.loop = loop
         self.img_duration = img_dur
+        self.length = img_dur * len(images) # in game frames
+
+        # lookup tables from game frame to image, so getting the current image doesn't need any division
+        self.frame_index = [frame // img_dur for frame in range(self.length)]
+        self.frame_images = [images[i] for i in self.frame_index]
+        self.frame_flipped = [self.flipped[i] for i in self.frame_index]
+
+    # start playing this animation (from the given frame)
+    def play(self, frame = 0):
+        return AnimationPlayer(self, frame)
+
+# The playhead of an Animation: which clip, which frame we are on and whether it finished (a non-looping clip)
+class AnimationPlayer:
+    __slots__ = ('clip', 'frame', 'done')
+
+    def __init__(self, clip, frame = 0):
+        self.clip = clip
+        self.frame = frame # this value will be incremented every frame of the game
         self.done = False
-        self.frame = 0 # this value will be incremented every frame of the game
-
-    # create a copy instance of this animation (saves memory, somehow..)
-    def copy(self):
-        return Animation(self.images, self.img_duration, self.loop)
-    
-    # returns current image of the animation
-    def img(self):
-        return self.images[int(self.frame / self.img_duration)] # gives us whatever frame we are on for the current frame of the game
-    
+
+    # returns current image of the animation (facing left if flip is True)
+    def img(self, flip = False):
+        return (self.clip.frame_flipped if flip else self.clip.frame_images)[self.frame] # whatever image we are on for the current frame of the game
+
     def update(self):
-        if self.loop:
-            self.frame = (self.frame + 1) % (self.img_duration * len(self.images)) # make the image loop around the number of frames in the animation
+        length = self.clip.length
+        if self.clip.loop:
+            self.frame = (self.frame + 1) % length # make the image loop around the number of frames in the animation
         else:
-            self.frame = min(self.frame+1, self.img_duration * len(self.images) - 1) # this needs a -1 for 0 index, above doesn't due to modulus operation
-            if self.frame >= self.img_duration*len(self.images) - 1:
-                self.done = True
\ No newline at end of file
+            self.frame = min(self.frame+1, length - 1) # this needs a -1 for 0 index, above doesn't due to modulus operation
+            if self.frame >= length - 1:
+                self.done = True
@@ -0,0 +1,262 @@
+import os
+import sys
+import json
+import random
+import argparse
+import multiprocessing
+
+import numpy as np
+
+from scripts.simulation import Simulation, init_headless, load_assets, level_count, FPS, MAP_DIR
+from scripts.mapfile import cached_map
+from scripts.replay import InputLog
+
+# Batch level validation: plays every level many times with computer controlled players ("agents") on the headless
+# simulation, spread over all the CPU cores, and reports how often the level gets cleared, how long that takes and how
+# dangerous each enemy is. Run from the repository root with:
+#
+#   python -m scripts.validate                          # every level, 1000 runs each with the seek agent
+#   python -m scripts.validate 0 2 --runs 5000 --agent random --json stats.json
+#
+# A run ends when every enemy is dead (cleared), when the player dies (shot or fell), or after --steps steps (timed
+# out). Every run has its own seed, and a worker puts its simulation back in the state a new Simulation with that seed
+# starts in before each run, so a run can be played again with the game: --save-deaths writes an input log (see
+# scripts/replay.py) of every run that died, for python game.py --replay.
+#
+# The levels are converted into binary maps (see scripts/mapfile.py) once, before the workers start. Each worker
+# memory-maps them, so their pages are shared by every process instead of each one parsing the json, and it loads each
+# level into a simulation only once: runs after the first restart it, which doesn't touch the map at all.
+
+RUNS = 1000
+MAX_STEPS = 60 * FPS # a run that hasn't cleared the level after a minute of game time is stopped
+BATCH = 25 # runs handed to a worker at a time
+
+OUTCOMES = ('cleared', 'shot', 'fell', 'timed out')
+
+
+# ===== Agents ===== #
+# An agent is made with a seed (its only source of randomness) and picks the inputs of every step with
+# act(sim) -> ([left, right], jump, dash)
+
+class RandomAgent:
+    # Mashes buttons: holds a random direction for a while, and jumps and dashes at random
+    def __init__(self, seed):
+        self.rng = random.Random(seed)
+        self.movement = [False, False]
+        self.hold = 0
+
+    def act(self, sim):
+        if self.hold <= 0:
+            self.movement = self.rng.choice(([False, False], [True, False], [False, True], [False, True]))
+            self.hold = self.rng.randint(10, 90)
+        self.hold -= 1
+        return list(self.movement), self.rng.random() < 0.04, self.rng.random() < 0.02
+
+class SeekAgent:
+    # Plays like someone who knows what to do: runs at the nearest enemy, jumps over walls and gaps and up to enemies
+    # above, and dashes through the enemy once it is in reach. A bit of randomness keeps it from getting stuck the same
+    # way every run.
+    def __init__(self, seed):
+        self.rng = random.Random(seed)
+        self.stuck = 0 # steps spent without moving
+        self.last_x = None
+
+    def act(self, sim):
+        player = sim.player
+        if not sim.enemies:
+            return [False, False], False, False
+        x, y = player.rect().center
+        target = min(sim.enemies, key = lambda enemy: abs(enemy.pos[0] - player.pos[0]) + abs(enemy.pos[1] - player.pos[1]) * 2)
+        dx = target.rect().centerx - x
+        dy = target.rect().centery - y
+        movement = [dx < -4, dx > 4]
+
+        self.stuck = self.stuck + 1 if self.last_x is not None and abs(player.pos[0] - self.last_x) < 0.1 else 0
+        self.last_x = player.pos[0]
+
+        on_ground = player.collisions['down']
+        ahead = x + (12 if movement[1] else -12)
+        jump = False
+        if player.collisions['left'] or player.collisions['right'] or player.wall_slide: # wall in the way
+            jump = self.rng.random() < 0.3
+        elif on_ground and not sim.tilemap.solid_check((ahead, y + 16)) and abs(dy) >= 16: # gap ahead
+            jump = True
+        elif on_ground and dy < -20 and abs(dx) < 96: # enemy on a ledge above
+            jump = True
+        elif self.stuck > 30 or self.rng.random() < 0.005:
+            jump = True
+            self.stuck = 0
+
+        facing = dx < 0 if player.flip else dx > 0
+        dash = not player.dashing and facing and abs(dx) < 60 and abs(dy) < 12
+        return movement, jump, dash
+
+AGENTS = {'seek': SeekAgent, 'random': RandomAgent}
+
+
+# ===== Workers ===== #
+
+class Worker:
+    # The state of one worker process: the game assets, and a simulation per level it has played
+    def __init__(self, record = False):
+        # SDL turns SIGTERM / SIGINT into quit events for the game loop, which a worker never looks at: without this the
+        # pool couldn't stop its workers (on Ctrl-C, or an error in the main process)
+        os.environ['SDL_NO_SIGNAL_HANDLERS'] = '1'
+        init_headless()
+        self.assets = load_assets()
+        self.simulations = {}
+        self.record = record # keep an input log of every run
+
+    def simulation(self, level):
+        if level not in self.simulations:
+            self.simulations[level] = Simulation(self.assets, level = level, seed = 0)
+        return self.simulations[level]
+
+    # Play one run; returns (seed, outcome, steps, number of the enemy that shot the player or -1,
+    # projectiles fired per enemy, enemies killed (booleans), the inputs if recorded or None)
+    def play(self, level, agent_name, seed, max_steps):
+        sim = self.simulation(level)
+        sim.reset(level, seed)
+        sim.input_log = InputLog(seed, level) if self.record else None
+        agent = AGENTS[agent_name](seed)
+        enemies = list(sim.enemies)
+
+        outcome = 'timed out'
+        while sim.frame < max_steps:
+            sim.movement, jump, dash = agent.act(sim)
+            sim.step(jump, dash)
+            if sim.dead:
+                outcome = 'shot' if sim.killed_by is not None else 'fell'
+                break
+            if not sim.enemies:
+                outcome = 'cleared'
+                break
+
+        alive = set(map(id, sim.enemies))
+        steps = bytes(sim.input_log.steps) if self.record else None
+        return (seed, outcome, sim.frame, sim.killed_by if sim.killed_by is not None else -1,
+                [enemy.shots for enemy in enemies], [id(enemy) not in alive for enemy in enemies], steps)
+
+    # The enemies' starting positions (in pixels), in spawner order
+    def enemy_positions(self, level):
+        sim = self.simulation(level)
+        return [tuple(spawner['pos']) for spawner in sim.level_data[2] if spawner['variant'] == 1]
+
+worker = None # this process's Worker
+
+def init_worker(record):
+    global worker
+    worker = Worker(record)
+
+def run_batch(task):
+    level, agent_name, seeds, max_steps = task
+    return level, worker.enemy_positions(level), [worker.play(level, agent_name, seed, max_steps) for seed in seeds]
+
+
+# ===== Statistics ===== #
+
+class LevelStats:
+    # Everything the runs of one level add up to
+    def __init__(self, level, enemy_positions):
+        self.level = level
+        self.enemy_positions = enemy_positions
+        self.runs = 0
+        self.outcomes = dict.fromkeys(OUTCOMES, 0)
+        self.clear_steps = []
+        self.total_steps = 0
+        n = len(enemy_positions)
+        self.shots = np.zeros(n, dtype=np.int64) # projectiles fired by each enemy
+        self.hits = np.zeros(n, dtype=np.int64) # of those, the ones that hit (and killed) the player
+        self.killed = np.zeros(n, dtype=np.int64) # runs in which the player killed it
+
+    def add(self, result):
+        seed, outcome, steps, killed_by, shots, killed, inputs = result
+        self.runs += 1
+        self.outcomes[outcome] += 1
+        self.total_steps += steps
+        if outcome == 'cleared':
+            self.clear_steps.append(steps)
+        if killed_by >= 0:
+            self.hits[killed_by] += 1
+        self.shots += shots
+        self.killed += killed
+
+    def summary(self):
+        runs = max(self.runs, 1)
+        clear_times = np.array(self.clear_steps, dtype=np.float64) / FPS
+        if len(clear_times):
+            p50, p95 = np.percentile(clear_times, [50, 95]).tolist()
+            time_to_clear = {'mean': float(clear_times.mean()), 'p50': p50, 'p95': p95, 'min': float(clear_times.min()), 'max': float(clear_times.max())}
+        else:
+            time_to_clear = None
+        return {'level': self.level,
+                'runs': self.runs,
+                'outcomes': {outcome: count / runs for outcome, count in self.outcomes.items()},
+                'death_rate': (self.outcomes['shot'] + self.outcomes['fell']) / runs,
+                'time_to_clear': time_to_clear,
+                'game_time': self.total_steps / FPS,
+                'enemies': [{'pos': list(pos), 'shots_per_run': int(shots) / runs, 'hits': int(hits),
+                             'hits_per_run': int(hits) / runs, 'hit_rate': int(hits) / int(shots) if shots else 0.0,
+                             'killed': int(killed) / runs}
+                            for pos, shots, hits, killed in zip(self.enemy_positions, self.shots, self.hits, self.killed)]}
+
+def report(summary):
+    lines = ['level %d: %d runs, %.0f minutes of game time' % (summary['level'], summary['runs'], summary['game_time'] / 60)]
+    outcomes = summary['outcomes']
+    line = '  cleared   %6.1f%%' % (outcomes['cleared'] * 100)
+    if summary['time_to_clear']:
+        line += '   time to clear: mean %.1f s, p50 %.1f s, p95 %.1f s' % tuple(summary['time_to_clear'][key] for key in ('mean', 'p50', 'p95'))
+    lines.append(line)
+    lines.append('  died      %6.1f%%   (shot %.1f%%, fell %.1f%%)' % (summary['death_rate'] * 100, outcomes['shot'] * 100, outcomes['fell'] * 100))
+    lines.append('  timed out %6.1f%%' % (outcomes['timed out'] * 100))
+    lines.append('  %5s %16s %10s %10s %10s %9s %8s' % ('enemy', 'spawn (px)', 'shots/run', 'hits', 'hits/run', 'hit rate', 'killed'))
+    for i, enemy in enumerate(summary['enemies']):
+        lines.append('  %5d %16s %10.2f %10d %10.3f %8.1f%% %7.1f%%' % (i, '(%d, %d)' % tuple(enemy['pos']), enemy['shots_per_run'], enemy['hits'],
+                                                                     enemy['hits_per_run'], enemy['hit_rate'] * 100, enemy['killed'] * 100))
+    if not outcomes['cleared']:
+        lines.append('  NEVER CLEARED')
+    return '\n'.join(lines)
+
+# Play runs of every level with a process pool; returns {level: LevelStats}
+def validate(levels, runs = RUNS, agent = 'seek', max_steps = MAX_STEPS, workers = None, seed = 0, save_deaths = None):
+    for level in levels:
+        cached_map(MAP_DIR + str(level) + '.json') # convert once here, not in every worker at the same time
+    if save_deaths:
+        os.makedirs(save_deaths, exist_ok=True)
+
+    tasks = [(level, agent, list(range(seed + start, seed + min(start + BATCH, runs))), max_steps)
+             for level in levels for start in range(0, runs, BATCH)]
+    stats = {}
+    with multiprocessing.Pool(workers, initializer = init_worker, initargs = (save_deaths is not None,)) as pool:
+        for level, enemy_positions, results in pool.imap_unordered(run_batch, tasks):
+            if level not in stats:
+                stats[level] = LevelStats(level, enemy_positions)
+            for result in results:
+                stats[level].add(result)
+                if save_deaths and result[1] in ('shot', 'fell'):
+                    InputLog(result[0], level, result[6]).save(os.path.join(save_deaths, 'level %d %s seed %d.log' % (level, agent, result[0])))
+        pool.close()
+        pool.join()
+    return stats
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(prog = 'python -m scripts.validate', description = 'Play levels many times with computer controlled players and report how they went.')
+    parser.add_argument('levels', type = int, nargs = '*', help = 'levels to play (default: all of them)')
+    parser.add_argument('--runs', type = int, default = RUNS, help = 'runs per level (default %(default)s)')
+    parser.add_argument('--agent', choices = sorted(AGENTS), default = 'seek', help = 'who plays (default %(default)s)')
+    parser.add_argument('--steps', type = int, default = MAX_STEPS, help = 'steps before a run times out (default %(default)s)')
+    parser.add_argument('--workers', type = int, default = None, help = 'worker processes (default: one per CPU core)')
+    parser.add_argument('--seed', type = int, default = 0, help = 'seed of the first run, the others count up from it (default %(default)s)')
+    parser.add_argument('--json', metavar = 'PATH', help = 'also write the stats to a json file')
+    parser.add_argument('--save-deaths', metavar = 'FOLDER', help = 'save an input log of every run that died')
+    args = parser.parse_args()
+
+    levels = args.levels or list(range(level_count()))
+    stats = validate(levels, args.runs, args.agent, args.steps, args.workers, args.seed, args.save_deaths)
+    summaries = [stats[level].summary() for level in levels]
+    print('\n\n'.join(report(summary) for summary in summaries))
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump({'agent': args.agent, 'max_steps': args.steps, 'levels': summaries}, f, indent=2)
+    # a level nobody could clear probably can't be cleared at all
+    sys.exit(1 if any(not summary['outcomes']['cleared'] for summary in summaries) else 0)
@@ -0,0 +1,56 @@
+import os
+import sys
+
+import pytest
+
+ROOT = os.path.join(os.path.dirname(__file__), '..')
+sys.path.insert(0, ROOT) # the game imports scripts.* from the repo root
+
+from scripts.mapfile import convert, cached_map, is_map_file, map_version, VERSION
+from scripts.tilemap import Tilemap
+
+MAPS = [os.path.join(ROOT, 'data', 'maps', name) for name in sorted(os.listdir(os.path.join(ROOT, 'data', 'maps'))) if name.endswith('.json')]
+MAPS.append(os.path.join(ROOT, 'map.json'))
+
+# What a loaded tilemap holds, in a form that doesn't depend on how it was loaded (lists vs tuples, file order)
+def contents(tilemap):
+    grid = {loc: (tile['type'], tile['variant'], tuple(tile['pos'])) for loc, tile in tilemap.tilemap.items()}
+    offgrid = [(tile['type'], tile['variant'], tuple(tile['pos'])) for tile in tilemap.offgrid_tiles.values()]
+    return tilemap.tile_size, grid, offgrid
+
+# JSON -> .map -> Tilemap gives the same level as loading the json directly
+@pytest.mark.parametrize('json_path', MAPS, ids = os.path.basename)
+def test_round_trip(json_path, tmp_path):
+    map_path = str(tmp_path / 'level.map')
+    convert(json_path, map_path)
+    assert is_map_file(map_path)
+    assert map_version(map_path) == VERSION
+
+    from_json = Tilemap(None)
+    from_json.load(json_path)
+    from_map = Tilemap(None)
+    from_map.load(map_path)
+    assert len(from_map.tilemap) == len(from_json.tilemap)
+    assert contents(from_map) == contents(from_json)
+
+# Saving a loaded binary map as json gives back the original level
+def test_save_json_from_map(tmp_path):
+    map_path = str(tmp_path / 'level.map')
+    convert(MAPS[0], map_path)
+    tilemap = Tilemap(None)
+    tilemap.load(map_path)
+    tilemap.save(str(tmp_path / 'level.json'))
+
+    saved = Tilemap(None)
+    saved.load(str(tmp_path / 'level.json'))
+    original = Tilemap(None)
+    original.load(MAPS[0])
+    assert contents(saved) == contents(original)
+
+# Converted maps go in the cache folder, never next to the json in the level folder
+def test_cached_map_location(tmp_path):
+    cache_dir = str(tmp_path / 'cache') + os.sep
+    map_path = cached_map(MAPS[0], cache_dir)
+    assert os.path.dirname(map_path) == os.path.dirname(cache_dir)
+    assert is_map_file(map_path)
+    assert cached_map(MAPS[0], cache_dir) == map_path # up to date: not converted again
@@ -0,0 +1,39 @@
+import os
+import sys
+
+ROOT = os.path.join(os.path.dirname(__file__), '..')
+sys.path.insert(0, ROOT) # the game imports scripts.* from the repo root
+
+from scripts.tilemap import Tilemap, PHYSICS_TILES
+
+def load_level():
+    tilemap = Tilemap(None)
+    tilemap.load(os.path.join(ROOT, 'data', 'maps', '0.json'))
+    return tilemap
+
+# Every physics tile gets its collision rect when the level loads, and nothing else does
+def test_physics_rects_built_on_load():
+    tilemap = load_level()
+    size = tilemap.tile_size
+    solid = {loc for loc, tile in tilemap.tilemap.items() if tile['type'] in PHYSICS_TILES}
+    assert set(tilemap.physics_rects) == solid
+    for (x, y), rect in tilemap.physics_rects.items():
+        assert rect == (x * size, y * size, size, size)
+
+# Looking around empty space doesn't add anything to the cache
+def test_empty_cells_not_cached():
+    tilemap = load_level()
+    count = len(tilemap.physics_rects)
+    assert tilemap.physics_rects_around((-5000, -5000)) == []
+    assert len(tilemap.physics_rects) == count
+
+# Adding and removing tiles (the editor) keeps the collision rects up to date
+def test_set_and_remove_tile():
+    tilemap = load_level()
+    size = tilemap.tile_size
+    pos = (1000, 1000)
+    tilemap.set_tile(pos, 'stone', 0)
+    assert tilemap.physics_rects_around((pos[0] * size, pos[1] * size)) == [(pos[0] * size, pos[1] * size, size, size)]
+    tilemap.remove_tile(pos)
+    assert tilemap.physics_rects_around((pos[0] * size, pos[1] * size)) == []
+    assert pos not in tilemap.physics_rects